@@ -0,0 +1,464 @@
+"""
+Batch Move Generation for Chess Bot
+Generates the moves of many positions at once: the positions are stacked
+into one array of bitboards (one uint64 per side and piece, bit row * 8 +
+col), and every step of move generation is a shift and mask over the whole
+batch, so the Python overhead is paid once per batch instead of once per
+square of every position
+Moves are encoded as in moves.py and match Node.generate_moves() (pseudo-
+legal, with castling fully checked); legal_moves() and perft() also play
+the moves on the batch to drop those that leave one's own King checked
+
+Perft: python batchgen.py FEN ... [--depth N]
+"""
+
+import argparse
+import json
+
+import numpy as np
+from moves import move_flags, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE,\
+    EN_PASSANT, PROMOTION, PROMOTION_CAPTURE
+
+PERFT_CHUNK = 2 ** 15  # Positions expanded together in one step of perft()
+
+FEN_PIECES = "rnbqkp"  # FEN letter of each piece, indexed by Piece
+ROOK, KNIGHT, BISHOP, QUEEN, KING, PAWN = range(6)
+
+ONE = np.uint64(1)
+ZERO = np.uint64(0)
+FILE_A = 0x0101010101010101
+ROWS = [0xFF << (8 * row) for row in range(8)]
+
+# Bits a step of col_change columns may land on without wrapping around
+COLUMN_MASKS = {col_change: np.uint64(sum(FILE_A << col for col in range(8)
+    if 0 <= col - col_change < 8)) for col_change in range(-2, 3)}
+
+KNIGHT_STEPS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1),
+    (-2, 1), (-1, 2))
+KING_STEPS = ((1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (1, -1), (-1, -1),
+    (-1, 1))
+
+
+# Returns the bitboards shifted by [row_change, col_change], dropping the
+# bits that leave the board
+def shift(bitboards, row_change, col_change):
+    amount = row_change * 8 + col_change
+
+    if amount >= 0:
+        shifted = bitboards << np.uint64(amount)
+    else:
+        shifted = bitboards >> np.uint64(-amount)
+
+    return shifted & COLUMN_MASKS[col_change]
+
+
+# Returns positions, squares: the position index and square number of
+# every bit set in an (N,) array of bitboards, grouped by position
+def set_bits(bitboards):
+    bits = np.unpackbits(bitboards.astype("<u8").view(np.uint8).reshape(-1,
+        8), axis=1, bitorder="little")
+
+    return np.nonzero(bits)
+
+
+# N positions stored as arrays
+class PositionBatch:
+    # boards = uint64 array (N, 2, 6): bitboard of each side's pieces of
+    # each Piece
+    # side = side to move in each position
+    # castling = bool array (N, 2, 2): whether each side may still castle
+    # on the left (Rook ID 0) and on the right (Rook ID 7)
+    # en_passant = column of the en passant square (-1 if none)
+    def __init__(self, boards, side, castling, en_passant):
+        self.boards = boards
+        self.side = side
+        self.castling = castling
+        self.en_passant = en_passant
+
+    def __len__(self):
+        return len(self.side)
+
+    # Returns the batch of the positions at "indices" (an index array or a
+    # slice)
+    def take(self, indices):
+        return PositionBatch(self.boards[indices], self.side[indices],
+            self.castling[indices], self.en_passant[indices])
+
+    # Returns (N,) bitboards of every piece of "sides" (one side per
+    # position)
+    def occupied(self, sides):
+        return np.bitwise_or.reduce(self.boards[np.arange(len(self)), sides],
+            axis=1)
+
+
+# Returns the batch of a list of Nodes
+def stack_nodes(nodes):
+    boards = np.array([node.board for node in nodes]).reshape(-1, 64, 3)
+    side = np.array([node.side for node in nodes], dtype=np.int8)
+    castling = np.zeros((len(nodes), 2, 2), dtype=bool)
+    en_passant = np.full(len(nodes), -1, dtype=np.int8)
+
+    for index, node in enumerate(nodes):
+        for color, moved in ((node.side, node.my_moved), (1 - node.side,
+                node.opp_moved)):
+            castling[index, color] = [not moved[4] and not moved[0], not
+                moved[4] and not moved[7]]
+
+        if node.en_passant[0] != -1:
+            en_passant[index] = node.en_passant[1]
+
+    return PositionBatch(pack_boards(boards), side, castling, en_passant)
+
+
+# Returns the batch of a list of FEN strings (only the first four fields
+# are used), without building Nodes
+def stack_fens(fens):
+    boards = np.full((len(fens), 64, 3), -1, dtype=np.int8)
+    side = np.zeros(len(fens), dtype=np.int8)
+    castling = np.zeros((len(fens), 2, 2), dtype=bool)
+    en_passant = np.full(len(fens), -1, dtype=np.int8)
+
+    for index, fen in enumerate(fens):
+        fields = fen.split()
+
+        for row_index, text in enumerate(fields[0].split("/")):
+            square = (7 - row_index) * 8
+
+            for char in text:
+                if char.isdigit():
+                    square += int(char)
+                else:
+                    boards[index, square, 0] = 0 if char.isupper() else 1
+                    boards[index, square, 2] = FEN_PIECES.index(char.lower())
+                    square += 1
+
+        side[index] = 0 if fields[1] == "w" else 1
+        castling[index] = [[char in fields[2] for char in rights] for
+            rights in ("QK", "qk")]
+
+        if fields[3] != "-":
+            en_passant[index] = "abcdefgh".index(fields[3][0])
+
+    return PositionBatch(pack_boards(boards), side, castling, en_passant)
+
+
+# Returns the (N, 2, 6) bitboards of (N, 64, 3) [Side, ID, Piece] squares
+def pack_boards(squares):
+    boards = np.zeros((len(squares), 2, 6), dtype=np.uint64)
+
+    for color in range(2):
+        for piece in range(6):
+            bits = (squares[:, :, 0] == color) & (squares[:, :, 2] == piece)
+            boards[:, color, piece] = np.packbits(bits, axis=1,
+                bitorder="little").view("<u8").reshape(-1)
+
+    return boards
+
+
+# Returns (N,) bitboards of the squares that "sides" (one side per
+# position) attack
+# occupied = (N,) bitboards of every piece on the board
+def attack_maps(batch, sides, occupied):
+    pieces = batch.boards[np.arange(len(batch)), sides]
+    empty = ~occupied
+
+    # Pawns attack one row up (White) or down (Black)
+    up = np.where(sides == 0, 1, -1)
+    pawns = pieces[:, PAWN]
+    attacks = np.where(up == 1, shift(pawns, 1, 1) | shift(pawns, 1, -1),
+        shift(pawns, -1, 1) | shift(pawns, -1, -1))
+
+    for row_change, col_change in KNIGHT_STEPS:
+        attacks |= shift(pieces[:, KNIGHT], row_change, col_change)
+
+    for row_change, col_change in KING_STEPS:
+        attacks |= shift(pieces[:, KING], row_change, col_change)
+
+        # Sliders along this line, stepped until they are blocked
+        sliders = pieces[:, QUEEN] | (pieces[:, ROOK] if row_change == 0 or
+            col_change == 0 else pieces[:, BISHOP])
+
+        while sliders.any():
+            sliders = shift(sliders, row_change, col_change)
+            attacks |= sliders
+            sliders &= empty
+
+    return attacks
+
+
+# Collects the moves of a batch as arrays, in order
+class MoveList:
+    def __init__(self):
+        self.positions = []
+        self.moves = []
+
+    # Adds a move for every bit of the (N,) bitboards of end squares
+    # step = end square number minus start square number
+    # flags = flags of the moves (see moves.py)
+    def add(self, ends, step, flags):
+        if not ends.any():
+            return
+
+        positions, end = set_bits(ends)
+        self.positions.append(positions)
+        self.moves.append(flags << 12 | (end - step) << 6 | end)
+
+    # Returns positions, moves: the index of the position of each move and
+    # the move, sorted by position
+    def arrays(self):
+        if len(self.moves) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        positions = np.concatenate(self.positions)
+        moves = np.concatenate(self.moves)
+        order = np.argsort(positions, kind="stable")
+
+        return positions[order], moves[order]
+
+
+# Returns positions, moves: every move available to the side to move in
+# each position of the batch (see Node.generate_moves()), as the index of
+# its position and the move, sorted by position
+def generate_moves(batch):
+    rows = np.arange(len(batch))
+    side = batch.side.astype(np.int64)
+    opp = 1 - side
+
+    mine = batch.boards[rows, side]
+    theirs = batch.boards[rows, opp]
+    own = np.bitwise_or.reduce(mine, axis=1)
+    occupied = own | np.bitwise_or.reduce(theirs, axis=1)
+    empty = ~occupied
+
+    # Kings are never taken
+    takeable = occupied & ~own & ~theirs[:, KING]
+    moves = MoveList()
+
+    for steps, piece in ((KNIGHT_STEPS, KNIGHT), (KING_STEPS, KING)):
+        for row_change, col_change in steps:
+            ends = shift(mine[:, piece], row_change, col_change)
+            step = row_change * 8 + col_change
+
+            moves.add(ends & empty, step, 0)
+            moves.add(ends & takeable, step, CAPTURE)
+
+    for row_change, col_change in KING_STEPS:
+        sliders = mine[:, QUEEN] | (mine[:, ROOK] if row_change == 0 or
+            col_change == 0 else mine[:, BISHOP])
+        distance = 0
+
+        while sliders.any():
+            sliders = shift(sliders, row_change, col_change)
+            distance += 1
+            step = distance * (row_change * 8 + col_change)
+
+            moves.add(sliders & empty, step, 0)
+            moves.add(sliders & takeable, step, CAPTURE)
+
+            sliders &= empty
+
+    add_pawn_moves(batch, moves, mine[:, PAWN], empty, takeable)
+    add_castles(batch, moves, occupied)
+
+    return moves.arrays()
+
+
+# Adds the Pawn moves of both sides (each position only has Pawns of the
+# side to move in "pawns")
+def add_pawn_moves(batch, moves, pawns, empty, takeable):
+    for color in range(2):
+        own = np.where(batch.side == color, pawns, ZERO)
+
+        if not own.any():
+            continue
+
+        up = 1 if color == 0 else -1
+        last = np.uint64(ROWS[7 if color == 0 else 0])
+        third = np.uint64(ROWS[2 if color == 0 else 5])
+
+        # The en passant square, in the positions that have one
+        row = 5 if color == 0 else 2
+        en_passant = np.where(batch.en_passant >= 0, ONE << (np.uint64(row *
+            8) + np.maximum(batch.en_passant, 0).astype(np.uint64)), ZERO)
+
+        pushes = shift(own, up, 0) & empty
+
+        moves.add(pushes & ~last, 8 * up, 0)
+        moves.add(shift(pushes & third, up, 0) & empty, 16 * up,
+            DOUBLE_PUSH)
+
+        for choice in range(4):
+            moves.add(pushes & last, 8 * up, PROMOTION | choice)
+
+        for col_change in (-1, 1):
+            ends = shift(own, up, col_change)
+            step = 8 * up + col_change
+
+            moves.add(ends & takeable & ~last, step, CAPTURE)
+            moves.add(ends & en_passant & empty, step, EN_PASSANT)
+
+            for choice in range(4):
+                moves.add(ends & takeable & last, step, PROMOTION_CAPTURE |
+                    choice)
+
+
+# Adds the castles of the side to move: the King and Rook must not have
+# moved, the squares between them must be empty and the King may not be
+# checked or pass over an attacked square
+def add_castles(batch, moves, occupied):
+    if not batch.castling.any():
+        return
+
+    rows = np.arange(len(batch))
+    side = batch.side.astype(np.int64)
+    rights = batch.castling[rows, side]
+    attacked = attack_maps(batch, 1 - side, occupied)
+    home = np.where(side == 0, 0, 56).astype(np.uint64)
+
+    # [flags, King step, squares that must be empty, squares that must not
+    # be attacked] (as columns of the first row)
+    castles = [[QUEEN_CASTLE, -2, (1, 2, 3), (2, 3, 4)], [KING_CASTLE, 2,
+        (5, 6), (4, 5, 6)]]
+
+    for rook, (flags, step, between, passed) in enumerate(castles):
+        clear_bits = np.uint64(sum(1 << col for col in between)) << home
+        safe_bits = np.uint64(sum(1 << col for col in passed)) << home
+
+        allowed = rights[:, rook] & (occupied & clear_bits == 0) &\
+            (attacked & safe_bits == 0)
+
+        moves.add(np.where(allowed, (ONE << np.uint64(4 + step)) << home,
+            ZERO), step, flags)
+
+
+# Returns the batch of the positions reached by playing moves[i] in the
+# position positions[i] of "batch"
+def do_moves(batch, positions, moves):
+    count = len(moves)
+    rows = np.arange(count)
+
+    boards = batch.boards[positions]
+    side = batch.side[positions].astype(np.int64)
+    opp = 1 - side
+    castling = batch.castling[positions]
+
+    flags = move_flags(moves)
+    start = (moves >> 6 & 63).astype(np.uint64)
+    end = (moves & 63).astype(np.uint64)
+    start_bit = ONE << start
+    end_bit = ONE << end
+
+    # The moving piece, and the piece taken on the end square (if any)
+    piece = np.argmax(boards[rows, side] & start_bit[:, None] != 0, axis=1)
+    taken = boards[rows, opp] & end_bit[:, None] != 0
+    captures = taken.any(axis=1)
+
+    boards[rows, side, piece] ^= start_bit | end_bit
+    boards[rows[captures], opp[captures], np.argmax(taken[captures],
+        axis=1)] ^= end_bit[captures]
+
+    # The Pawn taken en passant is one row behind the end square
+    passant = flags == EN_PASSANT
+    behind = np.where(side[passant] == 0, end[passant] - np.uint64(8),
+        end[passant] + np.uint64(8))
+    boards[rows[passant], opp[passant], PAWN] ^= ONE << behind
+
+    # A promoted Pawn becomes its new piece
+    promotions = flags & PROMOTION != 0
+    boards[rows[promotions], side[promotions], PAWN] ^= end_bit[promotions]
+    boards[rows[promotions], side[promotions], flags[promotions] & 3] |=\
+        end_bit[promotions]
+
+    # The Rook of a castle jumps over the King
+    for castle, rook_start, rook_end in ((KING_CASTLE, 7, 5), (QUEEN_CASTLE,
+            0, 3)):
+        castled = flags == castle
+        home = np.where(side[castled] == 0, 0, 56).astype(np.uint64)
+
+        boards[rows[castled], side[castled], ROOK] ^= (ONE <<
+            np.uint64(rook_start) | ONE << np.uint64(rook_end)) << home
+
+    # Castling is lost once the King moves, or once anything moves from or
+    # onto a Rook's starting square
+    castling[rows[piece == KING], side[piece == KING]] = False
+
+    for color, rook, square in ((0, 0, 0), (0, 1, 7), (1, 0, 56), (1, 1,
+            63)):
+        castling[:, color, rook] &= (start != square) & (end != square)
+
+    en_passant = np.where(flags == DOUBLE_PUSH, moves >> 6 & 7,
+        -1).astype(np.int8)
+
+    return PositionBatch(boards, opp.astype(np.int8), castling, en_passant)
+
+
+# Returns a boolean array: whether the side that just moved in each
+# position of the batch left its own King checked
+def left_in_check(batch):
+    rows = np.arange(len(batch))
+    side = batch.side.astype(np.int64)
+    occupied = batch.occupied(side) | batch.occupied(1 - side)
+
+    return attack_maps(batch, side, occupied) & batch.boards[rows, 1 - side,
+        KING] != 0
+
+
+# Returns positions, moves, children: the legal moves of every position of
+# the batch (see generate_moves()) and the batch of the positions they
+# reach
+def legal_moves(batch):
+    positions, moves = generate_moves(batch)
+    children = do_moves(batch, positions, moves)
+    legal = ~left_in_check(children)
+
+    return positions[legal], moves[legal], children.take(legal)
+
+
+# Returns a list per position of the batch of its moves
+def move_lists(batch, positions, moves):
+    bounds = np.searchsorted(positions, np.arange(1, len(batch)))
+
+    return [part.tolist() for part in np.split(moves, bounds)]
+
+
+# Returns an int64 array: the number of move sequences "depth" plies long
+# from each position of the batch (perft)
+# The positions of each ply are expanded PERFT_CHUNK at a time, so memory
+# stays bounded however large the tree is
+def perft(batch, depth, chunk=PERFT_CHUNK):
+    if depth == 0:
+        return np.ones(len(batch), dtype=np.int64)
+
+    counts = np.zeros(len(batch), dtype=np.int64)
+
+    for first in range(0, len(batch), chunk):
+        part = batch.take(slice(first, first + chunk))
+        positions, _, children = legal_moves(part)
+
+        if depth == 1:
+            found = np.bincount(positions, minlength=len(part))
+        else:
+            found = np.zeros(len(part), dtype=np.int64)
+            np.add.at(found, positions, perft(children, depth - 1, chunk))
+
+        counts[first:first + len(part)] = found
+
+    return counts
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Count the move sequences "
+        "from positions (perft)")
+    parser.add_argument("fen", nargs="+", help="Positions to count from")
+    parser.add_argument("--depth", type=int, default=3, help="Plies")
+    args = parser.parse_args(args)
+
+    counts = perft(stack_fens(args.fen), args.depth)
+
+    for fen, count in zip(args.fen, counts):
+        print(json.dumps({"fen": fen, "depth": args.depth, "nodes":
+            int(count)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Performance Benchmarks for Chess Bot
+Measures move generation, node_do_move, targeted-matrix updates, full
+searches and peak memory on a fixed set of positions, and the startup time
+of a new process, writes the results as JSON and compares them with a
+stored baseline
+
+Usage: python bench.py [--depth N] [--repeat N] [--output FILE]
+    [--baseline FILE] [--save-baseline] [--threshold FRACTION]
+    [--metric-threshold NAME=FRACTION ...]
+Exits with status 1 if any metric regressed past its threshold
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from position import node_from_fen
+from searchtree import SearchTree
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "bench_baseline.json")  # Stored baseline
+THRESHOLD = 0.2  # Default allowed slowdown, as a fraction of the baseline
+
+# What a short-lived process does before it can search: import the search
+# and set up a game
+STARTUP_CODE = "import searchtree; searchtree.SearchTree(0)"
+
+# Standard positions (opening, middlegames, endgames)
+POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/3PP3/5N2/PPP2PPP/RNBQKB1R b KQkq - 0 3",
+    "r2q1rk1/pp2bppp/2n1pn2/3p4/3P4/2NBPN2/PP3PPP/R2Q1RK1 w - - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+]
+
+
+# Returns the median of the seconds taken by "repeat" calls of fn
+def median_time(fn, repeat):
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return float(np.median(times))
+
+
+# Returns [metric, value, unit, better] for expand() throughput: children
+# generated per second over every position
+def bench_expand(nodes, repeat):
+    children = sum(len(node.expand()) for node in nodes)
+    seconds = median_time(lambda: [node.expand() for node in nodes], repeat)
+
+    return ["expand_children_per_sec", children / seconds, "children/s",
+        "higher"]
+
+
+# Returns node_do_move() latency: mean microseconds per call over every
+# move of every position
+def bench_do_move(nodes, repeat):
+    moves = [[node, move] for node in nodes for move in
+        node.generate_moves()]
+    seconds = median_time(lambda: [node.node_do_move(move) for node, move in
+        moves], repeat)
+
+    return ["node_do_move_us", seconds / len(moves) * 1e6, "us", "lower"]
+
+
+# Returns the cost of keeping the targeted matrices up to date: mean
+# microseconds to take every piece off its square and put it back
+# (update_targeted() and alter_targeted() for both sides)
+def bench_targeted(nodes, repeat):
+    def run():
+        for node in nodes:
+            board = node.board.copy()
+            mine = node.my_targeted.copy()
+            theirs = node.opp_targeted.copy()
+            opp = 1 if node.side == 0 else 0
+
+            for square in node.my_squares:
+                if square[0] == -1:
+                    continue
+
+                tup = board[square[0], square[1]].copy()
+
+                node.update_targeted(square, mine, board, 1)
+                board[square[0], square[1]] = -1
+                node.alter_targeted(node.side, square, mine, board, 0)
+                node.alter_targeted(opp, square, theirs, board, 0)
+
+                board[square[0], square[1]] = tup
+                node.alter_targeted(node.side, square, mine, board, 1)
+                node.alter_targeted(opp, square, theirs, board, 1)
+                node.update_targeted(square, mine, board, 0)
+
+    pieces = sum(int((node.my_squares[:, 0] != -1).sum()) for node in nodes)
+
+    return ["targeted_update_us", median_time(run, repeat) / pieces * 1e6,
+        "us", "lower"]
+
+
+# Returns find_next_move() speed at a fixed depth in deterministic mode
+# (nodes per second over every position) and the total nodes searched,
+# which only changes when the search itself does
+def bench_search(depth):
+    nodes = 0
+    seconds = 0
+
+    for fen in POSITIONS:
+        node = node_from_fen(fen)
+        tree = SearchTree(node.side, node)
+
+        start = time.perf_counter()
+        tree.find_next_move(verbose=False, max_level=depth,
+            deterministic=True)
+        seconds += time.perf_counter() - start
+
+        nodes += tree.local_nodes_generated
+
+    return [["search_nodes_per_sec", nodes / seconds, "nodes/s", "higher"],
+        ["search_nodes", nodes, "nodes", "lower"]]
+
+
+# Returns the peak memory (in KiB) allocated while searching the first
+# position at a fixed depth
+def bench_memory(depth):
+    tracemalloc.start()
+
+    node = node_from_fen(POSITIONS[1])
+    SearchTree(node.side, node).find_next_move(verbose=False,
+        max_level=depth, deterministic=True)
+
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return ["search_peak_kib", peak / 1024, "KiB", "lower"]
+
+
+# Returns [[metric, value, unit, better]] for startup: the milliseconds a
+# new Python process takes to run STARTUP_CODE (interpreter start
+# included) and the microseconds SearchTree() takes to set up a game
+def bench_startup(repeat):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, "-c", STARTUP_CODE]
+
+    process = median_time(lambda: subprocess.run(command, cwd=directory,
+        check=True), repeat)
+    new_game = median_time(lambda: SearchTree(0), repeat)
+
+    return [["startup_ms", process * 1e3, "ms", "lower"], ["new_game_us",
+        new_game * 1e6, "us", "lower"]]
+
+
+# Runs every benchmark and returns the results as a dict
+# depth = search depth of the search and memory benchmarks
+# repeat = timed runs of the other benchmarks (the median is kept)
+def run_benchmarks(depth=2, repeat=5):
+    nodes = [node_from_fen(fen) for fen in POSITIONS]
+
+    metrics = [bench_expand(nodes, repeat), bench_do_move(nodes, repeat),
+        bench_targeted(nodes, repeat)] + bench_search(depth) +\
+        [bench_memory(depth)] + bench_startup(repeat)
+
+    return {"depth": depth, "python": platform.python_version(),
+        "machine": platform.machine(), "metrics": {name: {"value": value,
+        "unit": unit, "better": better} for name, value, unit, better in
+        metrics}}
+
+
+# Returns [name, baseline value, value, change, regressed] for every metric
+# in both results; change is the relative change (positive = worse)
+# thresholds = {metric: allowed fraction}, THRESHOLD for the others
+def compare(results, baseline, threshold=THRESHOLD, thresholds=None):
+    thresholds = thresholds or {}
+    rows = []
+
+    for name, metric in results["metrics"].items():
+        if name not in baseline["metrics"]:
+            continue
+
+        old = baseline["metrics"][name]["value"]
+        new = metric["value"]
+
+        change = (new - old) / old if old != 0 else 0.0
+
+        if metric["better"] == "higher":
+            change = -change
+
+        rows.append([name, old, new, change, change > thresholds.get(name,
+            threshold)])
+
+    return rows
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Run the performance "
+        "benchmarks")
+    parser.add_argument("--depth", type=int, default=2, help="Search depth")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs "
+        "per benchmark")
+    parser.add_argument("--output", default=None, help="File for the JSON "
+        "results")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline "
+        "to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store "
+        "the results as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+        help="Allowed regression as a fraction of the baseline")
+    parser.add_argument("--metric-threshold", nargs="*", default=[],
+        metavar="NAME=FRACTION", help="Threshold for single metrics")
+    args = parser.parse_args(args)
+
+    results = run_benchmarks(args.depth, args.repeat)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+
+    for name, metric in results["metrics"].items():
+        print("{:<26}{:>14.2f} {}".format(name, metric["value"],
+            metric["unit"]))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=4)
+
+        return 0
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print("No baseline at", args.baseline)
+
+        return 0
+
+    if baseline["depth"] != results["depth"]:
+        print("Baseline was run at depth", baseline["depth"])
+
+        return 0
+
+    thresholds = {}
+
+    for item in args.metric_threshold:
+        name, value = item.split("=")
+        thresholds[name] = float(value)
+
+    regressed = False
+    print()
+
+    for name, old, new, change, worse in compare(results, baseline,
+            args.threshold, thresholds):
+        print("{:<26}{:>14.2f}{:>14.2f}{:>+9.1%}{}".format(name, old, new,
+            (new - old) / old if old != 0 else 0.0, "  REGRESSION" if worse
+            else ""))
+        regressed = regressed or worse
+
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,13 +4,14 @@ Jerry Shukai Zhang
 12/06/2020 - 02/03/2021
 """
 
-from searchtree import SearchTree
-import numpy as np
+from searchtree import IllegalMoveError, SearchTree
+from timemanager import TimeManager
+from moves import coords_to_move, start_square, end_square
 
 PIECES = ["Ro", "Kn", "Bi", "Qu", "Ki", "Pa"]
 # LETTERS used for printing the columns of the chess board
 LETTERS = ["A", "B", "C", "D", "E", "F", "G", "H"]
-EMPTY = np.array([-1, -1, -1])
+PROMOTION_CHOICES = "RNBQ"  # Letter of each piece a Pawn can become
 
 
 # Keeps taking inputs from the user until a letter in acceptable_letters
@@ -52,9 +53,45 @@ def get_valid_coord():
     return coord
 
 
-# Takes in inputs from the user to execute the next move
+# Keeps taking inputs from the user until a number of at least 0 is input
+# An empty input gives None
+def get_valid_number():
+    number = input().strip()
+
+    while number != "":
+        try:
+            if float(number) >= 0:
+                return float(number)
+        except ValueError:
+            pass
+
+        print("I did not understand that. Please enter a number (i.e "
+            "\"5\"): ", end="")
+
+        number = input().strip()
+
+    return None
+
+
+# Takes in inputs from the user to execute the next move, asking again
+# until the move is legal
 # chess_game = the SearchTree holding the current game
 def take_move(chess_game):
+    while True:
+        move = read_move(chess_game.curr_board)
+
+        try:
+            chess_game.tree_do_move(move)
+
+            return
+        except IllegalMoveError:
+            print("That move is not legal. Please try again.")
+
+
+# Takes in the squares of a move (and the new piece of a Pawn promotion)
+# from the user
+# Returns the move in "node", encoded as in moves.py
+def read_move(node):
     print("Please enter the Column/Row of your piece: ", end="")
     old_coord = get_valid_coord()
 
@@ -63,7 +100,7 @@ def take_move(chess_game):
 
     old_row = int(old_coord[1]) - 1
 
-    old = np.array([old_row, old_col])
+    old = (old_row, old_col)
 
     print("Next, the Column/Row you want to move to : ", end="")
     new_coord = get_valid_coord()
@@ -73,11 +110,17 @@ def take_move(chess_game):
 
     new_row = int(new_coord[1]) - 1
 
-    new = np.array([new_row, new_col])
+    new = (new_row, new_col)
 
-    move = np.array([old, new])
+    promotion = 3
 
-    chess_game.tree_do_move(move)
+    # A Pawn of the side to move reaching the last row
+    if node.board[old_row, old_col][0] == node.side and\
+            node.board[old_row, old_col][2] == 5 and new_row in (0, 7):
+        print("Promote to which piece? (Q/R/B/N): ", end="")
+        promotion = PROMOTION_CHOICES.index(get_valid_letter("QRBN"))
+
+    return coords_to_move(node, old, new, promotion)
 
 
 def main():
@@ -89,6 +132,17 @@ def main():
 
     chess_game = SearchTree(player_side)
 
+    # Set up the computer's clock
+    print("Minutes on the computer's clock (Enter for no clock): ", end="")
+    remaining = get_valid_number()
+    increment = 0
+
+    if remaining is not None:
+        remaining *= 60
+
+        print("Seconds added after each move: ", end="")
+        increment = get_valid_number() or 0
+
     # Run the game
     while chess_game.curr_board.outcome == "Ongoing":
         # Print state of game
@@ -108,7 +162,7 @@ def main():
                 new_str = ""
 
                 # If the square is empty, print an appropriate "empty" string
-                if (chess_game.curr_board.board[row, col] == EMPTY).all():
+                if chess_game.curr_board.board[row, col][0] == -1:
                     new_str = "   "
                 # Otherwise, print the piece in the square
                 else:
@@ -131,13 +185,21 @@ def main():
         # Otherwise, if it is the computer's turn
         else:
             # Return the suggested move
-            suggested_move = chess_game.find_next_move()
+            if remaining is None:
+                suggested_move = chess_game.find_next_move()
+            else:
+                time_manager = TimeManager(remaining, increment)
+                suggested_move = chess_game.find_timed_move(time_manager)
+
+                remaining += increment - time_manager.elapsed()
+                print("Seconds left on the computer's clock: ",\
+                    round(remaining, 1))
 
-            old_row = suggested_move[0, 0] + 1
-            old_col = LETTERS[suggested_move[0, 1]]
+            old_row, old_col = start_square(suggested_move)
+            old_row, old_col = old_row + 1, LETTERS[old_col]
 
-            new_row = suggested_move[1, 0] + 1
-            new_col = LETTERS[suggested_move[1, 1]]
+            new_row, new_col = end_square(suggested_move)
+            new_row, new_col = new_row + 1, LETTERS[new_col]
 
             print("Suggested move: ", (old_col, old_row), " to ", (new_col,\
                 new_row), "; Do this? (Y/N): ", end="")
@@ -0,0 +1,464 @@
+"""
+Distributed Search for Chess Bot
+A coordinator splits the search of a position at a split level (the root's
+children by default), sends every position at that level to worker
+processes over TCP and takes the minimax of their values; positions whose
+worker fails are sent again
+
+Workers: python distributed.py worker [--host HOST] [--port PORT]
+    [--processes N]
+Search: python distributed.py search FEN --workers HOST:PORT ...
+    [--depth N] [--split N] [--timeout SECONDS] [--local N]
+Messages are JSON objects, one per line: the coordinator sends {"id",
+"position" (packed position, see position.py, in base64), "depth"} and the
+worker answers {"id", "value", "nodes", "move" (its best move as encoded in
+moves.py, or null)} or {"error": message}
+"""
+
+import argparse
+import asyncio
+import base64
+import concurrent.futures
+import contextlib
+import json
+import multiprocessing
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from position import node_from_fen, pack_node, unpack_node
+
+MAX_RETRIES = 3  # Times one position is sent again before the search fails
+WORKER_PORT = 8766  # Default port of a worker
+START_TIMEOUT = 10  # Seconds to wait for a local worker to start listening
+
+WORKER_TABLES = {}  # Player -> transposition table shared by every search
+# run in this worker process
+
+
+class DistributedSearchError(RuntimeError):
+    pass
+
+
+# Runs in a worker process: searches a packed position to "depth" levels
+# Returns a dict with its value (from the computer's point of view, like
+# h_value), the number of nodes generated and its best move (None if the
+# game is over or depth is 0)
+def search_split(data, depth):
+    from searchtree import SearchTree, TT_SIZE
+    from transposition import TranspositionTable
+
+    node = unpack_node(data)
+    tree = SearchTree(node.player, node)
+
+    # Positions sent by one search share most of their subtrees
+    if node.player not in WORKER_TABLES:
+        WORKER_TABLES[node.player] = TranspositionTable(TT_SIZE)
+
+    tree.tt = WORKER_TABLES[node.player]
+    tree.start_search(None, depth)
+
+    if node.side == node.player:
+        value, move = tree.max_value(node, -9999, 9999, 0)
+    else:
+        value, move = tree.min_value(node, -9999, 9999, 0)
+
+    return {"value": float(value), "nodes": tree.local_nodes_generated,
+        "move": move}
+
+
+# Expands node down to "levels" levels and adds every position at that
+# level to "positions"
+# Returns the split tree: the index of the position in "positions" for a
+# position at that level, otherwise [node, list of the children's split
+# trees] (no children when the game is over at node)
+def make_split(node, levels, positions):
+    if levels == 0:
+        positions.append(node)
+
+        return len(positions) - 1
+
+    return [node, [make_split(child, levels - 1, positions) for child in
+        node.expand()]]
+
+
+# Returns the minimax value of a split tree (see make_split()) from the
+# values of its positions
+def combine(split, values):
+    if isinstance(split, int):
+        return values[split]
+
+    node, children = split
+
+    if len(children) == 0:
+        return node.h_value
+
+    child_values = [combine(child, values) for child in children]
+
+    return max(child_values) if node.side == node.player else\
+        min(child_values)
+
+
+class Coordinator:
+    # addresses = [host, port] of every worker; an address listed N times
+    # is sent N positions at a time
+    # timeout = seconds a worker may take on one position before it counts
+    # as failed (None = no limit)
+    # retries = times one position is sent again before the search fails
+    # If every worker is down, the remaining positions are searched in this
+    # process
+    def __init__(self, addresses, timeout=None, retries=MAX_RETRIES):
+        self.addresses = addresses
+        self.timeout = timeout
+        self.retries = retries
+
+        # State of the search in progress
+        self.queue = None  # Positions waiting to be searched
+        self.values = {}  # Position index -> value
+        self.moves = {}  # Position index -> best move, if any
+        self.nodes = 0  # Nodes generated by the workers
+        self.failures = 0  # Positions sent again
+        self.live = 0  # Worker connections still up
+        self.finished = None  # Future set once every value is in
+        self.total = 0  # Number of positions
+        self.tasks = []  # Tasks feeding the workers (or this process)
+
+    # Takes the result of a position
+    # Raises KeyError, TypeError or ValueError, taking nothing, if the
+    # result is malformed
+    def finish(self, item, result):
+        value = float(result["value"])
+        nodes = int(result["nodes"])
+        move = None if result.get("move") is None else int(result["move"])
+
+        if self.finished.done():
+            return
+
+        self.values[item[0]] = value
+        self.moves[item[0]] = move
+        self.nodes += nodes
+
+        if len(self.values) == self.total:
+            self.finished.set_result(None)
+
+    # Puts a position whose worker failed back in the queue
+    def retry(self, item, error):
+        self.failures += 1
+        item[3] += 1
+
+        if item[3] > self.retries:
+            if not self.finished.done():
+                self.finished.set_exception(DistributedSearchError("Position "
+                    + str(item[0]) + " failed " + str(item[3]) + " times: " +
+                    repr(error)))
+
+            return
+
+        self.queue.put_nowait(item)
+
+    # Sends one position over a worker connection; returns the answer
+    async def send(self, reader, writer, item):
+        writer.write((json.dumps({"id": item[0], "position":
+            base64.b64encode(item[1]).decode(), "depth": item[2]}) +
+            "\n").encode())
+        await writer.drain()
+
+        line = await reader.readline()
+
+        if not line:
+            raise ConnectionError("Worker closed the connection")
+
+        result = json.loads(line)
+
+        if "error" in result:
+            raise ValueError(result["error"])
+
+        if result.get("id") != item[0]:
+            raise ValueError("Answer for another position: " + line.decode())
+
+        return result
+
+    # Feeds positions to one worker connection until the search ends
+    # A position that fails for any reason (a lost connection, a timeout, an
+    # error or malformed answer) is put back in the queue and the connection
+    # is opened again for the next one; the worker is given up once it
+    # cannot be connected to or fails more than "retries" positions in a row
+    async def remote_slot(self, host, port):
+        writer = None
+        failed = 0  # Positions failed in a row
+
+        try:
+            while True:
+                if writer is None:
+                    try:
+                        reader, writer = await asyncio.open_connection(host,
+                            port)
+                    except OSError:
+                        break
+
+                item = await self.queue.get()
+
+                try:
+                    result = await asyncio.wait_for(self.send(reader, writer,
+                        item), self.timeout)
+                    self.finish(item, result)
+                except Exception as error:
+                    writer.close()
+                    writer = None
+                    failed += 1
+
+                    self.retry(item, error)
+
+                    if failed > self.retries:
+                        break
+
+                    continue
+
+                failed = 0
+        finally:
+            if writer is not None:
+                writer.close()
+
+            self.live -= 1
+
+            # Search the rest here once no worker is left
+            if self.live == 0 and not self.finished.done():
+                self.tasks.append(asyncio.get_running_loop().create_task(
+                    self.local_slot()))
+
+    # Searches the remaining positions in this process
+    async def local_slot(self):
+        loop = asyncio.get_running_loop()
+
+        while not self.finished.done():
+            item = await self.queue.get()
+
+            try:
+                result = await loop.run_in_executor(None, search_split,
+                    item[1], item[2])
+                self.finish(item, result)
+            except Exception as error:
+                self.retry(item, error)
+
+    # Searches node to "depth" levels, split at split_level levels below it
+    # (at most depth); with a split_level or depth of 0 the root itself is
+    # the only position sent, and "scores" only has the best move the
+    # worker found
+    # Returns a dict with the best move (in coordinate notation), its value,
+    # the nodes generated, the number of positions sent again and [move,
+    # value] for every move of node, best first
+    async def search(self, node, depth, split_level=1):
+        from moves import move_to_str
+
+        split_level = min(split_level, depth)
+        positions = []
+        split = make_split(node, split_level, positions)
+
+        self.queue = asyncio.Queue()
+        self.values = {}
+        self.moves = {}
+        self.nodes = 0
+        self.failures = 0
+        self.total = len(positions)
+        self.finished = asyncio.get_running_loop().create_future()
+
+        # Each item is [index, packed position, depth, failures]
+        for index, position in enumerate(positions):
+            self.queue.put_nowait([index, pack_node(position), depth -
+                split_level, 0])
+
+        if self.total == 0:
+            self.finished.set_result(None)
+
+        self.live = len(self.addresses)
+        self.tasks = [asyncio.create_task(self.remote_slot(host, port)) for
+            host, port in self.addresses]
+
+        if len(self.tasks) == 0:
+            self.tasks.append(asyncio.create_task(self.local_slot()))
+
+        try:
+            await self.finished
+        finally:
+            for task in self.tasks:
+                task.cancel()
+
+        # Not split: the root was searched as a whole
+        if isinstance(split, int):
+            move = self.moves[split]
+            scores = [] if move is None else [[move, self.values[split]]]
+        else:
+            scores = [[child[0].move if isinstance(child, list) else
+                positions[child].move, combine(child, self.values)] for child
+                in split[1]]
+
+        # The computer maximizes the value and its opponent minimizes it
+        sign = 1 if node.side == node.player else -1
+        scores.sort(key=lambda score: -sign * score[1])
+
+        return {
+            "move": move_to_str(scores[0][0]) if len(scores) > 0 else None,
+            "value": float(scores[0][1]) if len(scores) > 0 else
+                float(node.h_value),
+            "nodes": self.nodes,
+            "retries": self.failures,
+            "scores": [[move_to_str(move), float(value)] for move, value in
+                scores],
+        }
+
+
+# Returns a process pool for the searches of a worker
+# Its processes are started fresh rather than forked, so that they do not
+# hold on to the worker's listening socket: a worker that dies must refuse
+# connections rather than leave them hanging
+def worker_pool(processes=None):
+    return concurrent.futures.ProcessPoolExecutor(processes,
+        multiprocessing.get_context("spawn"))
+
+
+# Serves searches to coordinators over a socket, one JSON object per line
+# each way (see the module header)
+# executor = where positions are searched; a process pool by default
+async def serve_worker(host="127.0.0.1", port=WORKER_PORT, executor=None,
+        processes=None):
+    if executor is None:
+        executor = worker_pool(processes)
+
+    loop = asyncio.get_running_loop()
+
+    async def handle_client(reader, writer):
+        while True:
+            line = await reader.readline()
+
+            if not line:
+                break
+
+            try:
+                request = json.loads(line)
+                response = await loop.run_in_executor(executor, search_split,
+                    base64.b64decode(request["position"]), request["depth"])
+                response["id"] = request["id"]
+            except Exception as error:
+                response = {"error": type(error).__name__ + ": " +
+                    str(error)}
+
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+
+        writer.close()
+
+    return await asyncio.start_server(handle_client, host, port)
+
+
+# Runs a worker until it is stopped; SIGTERM stops it cleanly, along with
+# its search processes
+async def run_worker(host="127.0.0.1", port=WORKER_PORT, processes=None):
+    executor = worker_pool(processes)
+    server = await serve_worker(host, port, executor)
+
+    # Signal handlers are not available on every platform
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+            asyncio.current_task().cancel)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Starts "count" worker processes listening on localhost from port up
+# Returns the processes and their [host, port] addresses
+def start_local_workers(count, port=WORKER_PORT):
+    workers = []
+    addresses = []
+
+    for number in range(count):
+        workers.append(subprocess.Popen([sys.executable, __file__, "worker",
+            "--port", str(port + number), "--processes", "1"]))
+        addresses.append(["127.0.0.1", port + number])
+
+    # Wait until every worker is listening
+    deadline = time.monotonic() + START_TIMEOUT
+
+    for host, worker_port in addresses:
+        while True:
+            try:
+                socket.create_connection((host, worker_port), 1).close()
+
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    break
+
+                time.sleep(0.1)
+
+    return workers, addresses
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Distributed search "
+        "coordinator and worker")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser("worker", help="Run a worker")
+    worker.add_argument("--host", default="127.0.0.1")
+    worker.add_argument("--port", type=int, default=WORKER_PORT)
+    worker.add_argument("--processes", type=int, default=None, help="Search "
+        "processes (one per CPU by default)")
+
+    search = commands.add_parser("search", help="Search a position")
+    search.add_argument("fen", help="Position to search")
+    search.add_argument("--workers", nargs="*", default=[],
+        metavar="HOST:PORT", help="Worker addresses")
+    search.add_argument("--depth", type=int, default=4, help="Search depth")
+    search.add_argument("--split", type=int, default=1, help="Levels below "
+        "the root at which the search is split")
+    search.add_argument("--timeout", type=float, default=None,
+        help="Seconds a worker may take on one position")
+    search.add_argument("--local", type=int, default=0, help="Start this "
+        "many workers on localhost first")
+    search.add_argument("--port", type=int, default=WORKER_PORT, help="First "
+        "port of the local workers")
+    args = parser.parse_args(args)
+
+    if args.command == "search" and args.split < 1:
+        parser.error("--split must be at least 1")
+
+    if args.command == "worker":
+        asyncio.run(run_worker(args.host, args.port, args.processes))
+
+        return
+
+    addresses = []
+
+    for address in args.workers:
+        host, port = address.rsplit(":", 1)
+        addresses.append([host, int(port)])
+
+    workers = []
+
+    if args.local > 0:
+        workers, local_addresses = start_local_workers(args.local,
+            args.port)
+        addresses += local_addresses
+
+    try:
+        coordinator = Coordinator(addresses, args.timeout)
+        result = asyncio.run(coordinator.search(node_from_fen(args.fen),
+            args.depth, args.split))
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Bulk EPD/FEN Analysis for Chess Bot
+Streams positions from a file through worker processes and writes one JSON
+line per position
+
+Usage: python epd.py positions.epd [--depth N] [--time SECONDS]
+    [--nodes N] [--engine minimax|mcts|mate|perft] [--visits N]
+    [--workers N] [--unordered] [--shared-tables] [--output FILE]
+With --engine mate, --depth is the number of moves to find a mate in, and
+the lines have "mate" (the forced line) and "mate_in" instead of "value"
+With --engine perft, the move sequences --depth plies long (3 by default)
+are counted, PERFT_BATCH positions at a time (see batchgen.py)
+A position that cannot be analyzed (a bad FEN, an error in the search or a
+worker that died) gives a line with its "line", "id", "fen" and "error"
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+import time
+
+WINDOW_PER_WORKER = 4  # Positions in flight per worker; bounds memory use
+PERFT_BATCH = 256  # Positions counted together by the perft engine
+PERFT_DEPTH = 3  # Default plies of the perft engine
+
+
+# Returns [line number, position id, FEN] for every position in the file,
+# reading it lazily; the id is taken from an EPD "id" operation if present
+def read_positions(file):
+    for line_number, line in enumerate(file, 1):
+        line = line.strip()
+
+        if not line or line.startswith("#"):
+            continue
+
+        fields = line.split(None, 4)
+        fen = " ".join(fields[:4])
+        position_id = None
+
+        if len(fields) > 4 and "id " in fields[4]:
+            text = fields[4][fields[4].index("id ") + 3:].strip()
+            position_id = text.split(";")[0].strip().strip('"')
+
+        yield line_number, position_id, fen
+
+
+# Returns the result of a position that could not be analyzed: its line
+# number, id and FEN, and the error
+def error_record(line_number, position_id, fen, error):
+    return {"line": line_number, "id": position_id, "fen": fen, "error":
+        type(error).__name__ + ": " + str(error)}
+
+
+# Returns the results of a finished future as a list, or an error record
+# for each of its positions (see read_positions()) if it failed outside
+# the analysis, i.e. its worker process died
+def results_of(future, positions):
+    try:
+        result = future.result()
+    except Exception as error:
+        return [error_record(*position, error) for position in positions]
+
+    return result if isinstance(result, list) else [result]
+
+
+# Submits fn(*args) to the executor and returns its future; once the pool
+# is broken (a worker process died), the future holds that error instead,
+# so the position gets an error record and the run goes on
+def submit(executor, fn, *args):
+    try:
+        return executor.submit(fn, *args)
+    except concurrent.futures.BrokenExecutor as error:
+        future = concurrent.futures.Future()
+        future.set_exception(error)
+
+        return future
+
+
+# Runs in a worker: searches one position and returns its result
+# An error in the search gives an error record (see error_record()) rather
+# than an exception, so that one position cannot stop a streamed run
+# depth = level at which to stop (MAX_LEVEL by default)
+# time_limit = seconds the search may take (None = no limit)
+# max_nodes = nodes the search may generate (None = no limit)
+# engine = "minimax" (SearchTree.find_next_move()), "mcts" (Monte Carlo
+# tree search, see mcts.py) or "mate" (forced mates in "depth" moves within
+# max_nodes positions, see mate.py)
+# visits = root visits of the Monte Carlo search
+def analyze_position(line_number, position_id, fen, depth, time_limit,
+        max_nodes=None, engine="minimax", visits=None):
+    from position import node_from_fen
+
+    result = {"line": line_number, "id": position_id, "fen": fen}
+    start = time.monotonic()
+
+    try:
+        node = node_from_fen(fen)
+    except (ValueError, IndexError) as error:
+        result["error"] = "Bad FEN: " + str(error)
+
+        return result
+
+    try:
+        search_node(result, node, start, depth, time_limit, max_nodes,
+            engine, visits)
+    except Exception as error:
+        return error_record(line_number, position_id, fen, error)
+
+    return result
+
+
+# Searches node as analyze_position() describes, adding the move found and
+# the search's statistics to "result"
+# start = time.monotonic() value at which the analysis started
+def search_node(result, node, start, depth, time_limit, max_nodes, engine,
+        visits):
+    from moves import move_to_str
+    from searchtree import SearchTree
+    from sharedtables import shared_tt
+
+    deadline = None if time_limit is None else start + time_limit
+
+    tree = SearchTree(node.side, node, tt=shared_tt(node.side))
+
+    if engine == "mate":
+        from mate import MATE_MOVES, MATE_NODES
+
+        line = tree.find_mate(MATE_MOVES if depth is None else depth,
+            MATE_NODES if max_nodes is None else max_nodes, verbose=False)
+        move = None if line is None else line[0]
+        result["mate"] = None if line is None else [move_to_str(step) for
+            step in line]
+        result["mate_in"] = None if line is None else (len(line) + 1) // 2
+    elif engine == "mcts":
+        move = tree.find_mcts_move(deadline=deadline, max_visits=visits,
+            verbose=False)
+        result["visits"] = int(sum(score[1] for score in
+            tree.mcts.root_scores()))
+    else:
+        move = tree.find_next_move(deadline=deadline, verbose=False,
+            max_level=depth, max_nodes=max_nodes)
+
+    result["move"] = None if move is None else move_to_str(move)
+
+    # The mate search gives a line, not a heuristic value
+    if engine != "mate":
+        result["value"] = round(float(tree.last_value), 3)
+
+    result["nodes"] = tree.local_nodes_generated
+    result["time"] = round(time.monotonic() - start, 4)
+    result["outcome"] = node.outcome
+
+
+# Runs in a worker: counts the move sequences "depth" plies long from every
+# position of a chunk at once (see batchgen.perft())
+# Returns the result of each position, in order
+# If counting the chunk fails, its positions are counted one at a time so
+# that only the ones that fail get error records
+def perft_chunk(chunk, depth):
+    try:
+        return count_chunk(chunk, depth)
+    except Exception as error:
+        if len(chunk) == 1:
+            return [error_record(*chunk[0], error)]
+
+        return [result for position in chunk for result in
+            perft_chunk([position], depth)]
+
+
+# Counts the positions of a chunk together for perft_chunk()
+def count_chunk(chunk, depth):
+    from batchgen import perft, stack_fens
+
+    start = time.monotonic()
+    results = []
+    valid = []
+
+    for line_number, position_id, fen in chunk:
+        results.append({"line": line_number, "id": position_id, "fen": fen})
+
+        try:
+            stack_fens([fen])
+            valid.append(len(results) - 1)
+        except (ValueError, IndexError) as error:
+            results[-1]["error"] = "Bad FEN: " + str(error)
+
+    counts = [] if len(valid) == 0 else perft(stack_fens([results[index]
+        ["fen"] for index in valid]), depth)
+    seconds = round((time.monotonic() - start) / max(len(valid), 1), 4)
+
+    for index, count in zip(valid, counts):
+        results[index].update({"depth": depth, "perft": int(count), "time":
+            seconds})
+
+    return results
+
+
+# Counts the move sequences from every position of "positions" in chunks
+# of batch_size and yields the results in input order
+def run_perft(positions, depth=PERFT_DEPTH, workers=None, executor=None,
+        batch_size=PERFT_BATCH):
+    if executor is None:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+
+    window = (workers or os.cpu_count() or 1) * WINDOW_PER_WORKER
+
+    with executor:
+        pending = collections.deque()
+
+        while True:
+            chunk = list(itertools.islice(positions, batch_size))
+
+            if len(chunk) == 0:
+                break
+
+            pending.append([submit(executor, perft_chunk, chunk, depth),
+                chunk])
+
+            if len(pending) >= window:
+                yield from results_of(*pending.popleft())
+
+        while pending:
+            yield from results_of(*pending.popleft())
+
+
+# Analyzes every position from "positions" and yields the results, either in
+# input order or as they complete
+# Only workers * WINDOW_PER_WORKER positions are in flight at once, so memory
+# stays constant however long the input is
+def run_pipeline(positions, depth=None, time_limit=None, workers=None,
+        ordered=True, executor=None, max_nodes=None, engine="minimax",
+        visits=None):
+    if executor is None:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+
+    window = (workers or os.cpu_count() or 1) * WINDOW_PER_WORKER
+
+    with executor:
+        # Future -> [line number, position id, FEN] of its position
+        pending = collections.OrderedDict()
+
+        for position in positions:
+            future = submit(executor, analyze_position, *position, depth,
+                time_limit, max_nodes, engine, visits)
+            pending[future] = position
+
+            if ordered and len(pending) >= window:
+                future, position = pending.popitem(last=False)
+
+                yield from results_of(future, [position])
+            elif len(pending) >= window:
+                done, _ = concurrent.futures.wait(pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    yield from results_of(future, [pending.pop(future)])
+
+        if ordered:
+            while pending:
+                future, position = pending.popitem(last=False)
+
+                yield from results_of(future, [position])
+        else:
+            for future in concurrent.futures.as_completed(list(pending)):
+                yield from results_of(future, [pending.pop(future)])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Analyze every position "
+        "of an EPD/FEN file")
+    parser.add_argument("input", help="EPD/FEN file, one position per line "
+        "(- for stdin)")
+    parser.add_argument("--depth", type=int, default=None, help="Search "
+        "depth (MAX_LEVEL by default)")
+    parser.add_argument("--time", type=float, default=None, help="Seconds "
+        "per position")
+    parser.add_argument("--nodes", type=int, default=None, help="Node "
+        "budget per position (reproducible across machines)")
+    parser.add_argument("--engine", choices=["minimax", "mcts", "mate",
+        "perft"],
+        default="minimax", help="Search engine")
+    parser.add_argument("--visits", type=int, default=None, help="Root "
+        "visits per position (mcts engine)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker "
+        "processes (one per CPU by default)")
+    parser.add_argument("--unordered", action="store_true", help="Write "
+        "results as they complete instead of in input order")
+    parser.add_argument("--shared-tables", action="store_true", help="Share "
+        "the transposition and evaluation tables between the workers")
+    parser.add_argument("--output", default="-", help="Output file (- for "
+        "stdout)")
+    args = parser.parse_args(args)
+
+    file = sys.stdin if args.input == "-" else open(args.input)
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+
+    tables = None
+    executor = None
+
+    if args.shared_tables:
+        from sharedtables import SharedTables, SHARED_NAME, attach_tables
+
+        tables = SharedTables(SHARED_NAME + "_" + str(os.getpid()), True)
+        executor = concurrent.futures.ProcessPoolExecutor(args.workers,
+            initializer=attach_tables, initargs=(tables.name,))
+
+    if args.engine == "perft":
+        results = run_perft(read_positions(file), PERFT_DEPTH if args.depth
+            is None else args.depth, args.workers, executor)
+    else:
+        results = run_pipeline(read_positions(file), args.depth, args.time,
+            args.workers, not args.unordered, executor, max_nodes=args.nodes,
+            engine=args.engine, visits=args.visits)
+
+    try:
+        for result in results:
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+        if output is not sys.stdout:
+            output.close()
+
+        if tables is not None:
+            tables.close()
+
+
+if __name__ == "__main__":
+    main()
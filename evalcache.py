@@ -0,0 +1,84 @@
+"""
+Evaluation Cache for Chess Bot
+"""
+
+import numpy as np
+
+EVAL_CACHE_SIZE = 2 ** 16  # Number of entries in the shared cache
+
+MASK_16 = (1 << 16) - 1
+MASK_64 = (1 << 64) - 1
+VALID_BIT = 1 << 63  # Set in every stored entry, so 0 marks an empty one
+
+
+# Packs the components of a position's heuristic value into one word
+#   bits 0-15: times White's pieces are attacked, 16-31: Black's, 63: valid
+def pack_components(white_attacked, black_attacked):
+    return int(white_attacked) | int(black_attacked) << 16 | VALID_BIT
+
+
+# Returns white_attacked, black_attacked from a word made by pack_components
+def unpack_components(data):
+    return data & MASK_16, data >> 16 & MASK_16
+
+
+# Holds the components of the heuristic that only depend on the position
+# (Heuristic Part 3: how many times each side's pieces are attacked), so
+# that a position reached again along another path, or in a later search,
+# does not have to count them again
+# The components do not depend on the weights, so every SearchTree in a
+# process can share one cache
+class EvalCache:
+    # size = number of entries, rounded down to a power of two
+    # table = optional existing uint64 array of shape (size, 2) to use as
+    # storage
+    def __init__(self, size=EVAL_CACHE_SIZE, table=None):
+        if table is None:
+            size = 1 << (size.bit_length() - 1)
+            table = np.zeros((size, 2), dtype=np.uint64)
+
+        # Each entry is [hash ^ data, data], indexed by the low bits of the
+        # hash; the high bits are verified by XORing the two words back
+        # together, so a collision or a torn write reads as a miss
+        self.table = table
+        self.mask = len(table) - 1
+
+        self.hits = 0
+        self.misses = 0
+
+    # Switches to another storage array of the same layout (i.e. one in
+    # shared memory, see sharedtables.py)
+    def use_table(self, table):
+        self.table = table
+        self.mask = len(table) - 1
+
+    def clear(self):
+        self.table[:] = 0
+        self.hits = 0
+        self.misses = 0
+
+    # Returns white_attacked, black_attacked for the position, or None on a
+    # miss
+    def probe(self, key):
+        entry = self.table[key & self.mask]
+        data = int(entry[1])
+
+        if data == 0 or int(entry[0]) ^ data != key & MASK_64:
+            self.misses += 1
+
+            return None
+
+        self.hits += 1
+
+        return unpack_components(data)
+
+    # Stores the components of a position (always replacing the old entry)
+    def store(self, key, white_attacked, black_attacked):
+        index = key & self.mask
+        data = pack_components(white_attacked, black_attacked)
+
+        self.table[index, 1] = data
+        self.table[index, 0] = (key & MASK_64) ^ data
+
+
+EVAL_CACHE = EvalCache()  # The cache used by every Node in the process
@@ -0,0 +1,376 @@
+"""
+Game Database for Chess Bot
+Replays the games of PGN files and builds an index from position hash (see
+zobrist.py) to the games that reached the position and the move played
+there; the index is stored sorted, so a lookup is a binary search in a
+memory-mapped file
+
+Build: python gamedb.py build INDEX_DIR games.pgn ... [--workers N]
+    [--plies N]
+Lookup: python gamedb.py lookup INDEX_DIR FEN [--games N]
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import sys
+
+import numpy as np
+from moves import COLUMNS, KING_CASTLE, QUEEN_CASTLE, NO_MOVE, end_square,\
+    is_castle, is_promotion, move_flags, move_to_str, promotion_piece,\
+    start_square
+from zobrist import EN_PASSANT_KEYS, MOVED_KEYS
+
+MAX_PLIES = 60  # Plies of each game indexed by default
+
+# One record per position of every game (sorted by hash on disk)
+RECORD_TYPE = np.dtype([("hash", "<u8"), ("game", "<u4"), ("move", "<u2")])
+# One entry per game: the file it is in, where it starts and its result
+GAME_TYPE = np.dtype([("file", "<u2"), ("offset", "<u8"), ("result", "u1")])
+
+RESULTS = ["1-0", "1/2-1/2", "0-1", "*"]  # Result codes, by index
+SAN_PIECES = "RNBQK"  # SAN letter of each piece, indexed by Piece
+
+# Comments, variations (innermost first), NAGs, move numbers and results in
+# PGN movetext
+COMMENT = re.compile(r"\{[^}]*\}|;[^\n]*")
+VARIATION = re.compile(r"\([^()]*\)")
+NOISE = re.compile(r"\$\d+|\d+\.(\.\.)?|1-0|0-1|1/2-1/2|\*")
+TAG = re.compile(r'\[(\w+)\s+"(.*)"\]')
+
+
+# Returns the key a position is indexed by: what FEN records of it, so that
+# a position looked up from FEN matches the same position reached in a game
+# The hash (see zobrist.py) also holds which pieces have moved, so their
+# keys are taken out of it and only the castling rights (an unmoved King
+# and Rook) put back; the en passant square is taken out unless a Pawn can
+# actually take there
+def position_key(node):
+    key = node.hash
+    sides = [[node.side, node.my_moved, node.my_squares], [1 - node.side,
+        node.opp_moved, node.opp_squares]]
+
+    for side, moved, squares in sides:
+        for piece_id in range(16):
+            if moved[piece_id]:
+                key ^= MOVED_KEYS[side][piece_id]
+
+        if not moved[4]:
+            for rook_id in (0, 7):
+                if not moved[rook_id] and squares[rook_id][0] != -1:
+                    key ^= MOVED_KEYS[side][rook_id]
+
+    row, col = node.en_passant
+
+    if row == -1:
+        return key
+
+    # Pawns of the side to move that could take on the square
+    pawn_row = row - 1 if node.side == 0 else row + 1
+
+    for pawn_col in (col - 1, col + 1):
+        if 0 <= pawn_col < 8 and node.board[pawn_row, pawn_col][0] ==\
+                node.side and node.board[pawn_row, pawn_col][2] == 5:
+            return key
+
+    return key ^ EN_PASSANT_KEYS[col]
+
+
+# Returns the move and child Node of the move written in SAN (i.e "Nbd7",
+# "exd5", "e8=Q+", "O-O") in "node"
+def parse_san(node, text):
+    text = text.rstrip("+#!?")
+
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        flags = KING_CASTLE if len(text) == 3 else QUEEN_CASTLE
+
+        for move in node.generate_moves():
+            if move_flags(move) == flags:
+                return legal_child(node, [move], text)
+
+        raise ValueError("Illegal move: " + text)
+
+    promotion = None
+
+    if "=" in text:
+        text, letter = text.split("=")
+        promotion = SAN_PIECES.index(letter[0])
+    elif text[-1] in SAN_PIECES and len(text) > 2 and text[0] not in\
+            SAN_PIECES:
+        text, promotion = text[:-1], SAN_PIECES.index(text[-1])
+
+    piece = SAN_PIECES.index(text[0]) if text[0] in SAN_PIECES else 5
+    hint = text[1 if piece != 5 else 0:-2].replace("x", "")
+    end = (int(text[-1]) - 1, COLUMNS.index(text[-2]))
+
+    candidates = []
+
+    for move in node.generate_moves():
+        start = start_square(move)
+
+        if end_square(move) != end or node.board[start[0], start[1]][2] !=\
+                piece or is_castle(move):
+            continue
+
+        if promotion is not None and (not is_promotion(move) or
+                promotion_piece(move) != promotion):
+            continue
+
+        # File and/or rank of the moving piece, when ambiguous
+        if any(char != COLUMNS[start[1]] for char in hint if
+                char.isalpha()) or any(int(char) - 1 != start[0] for char in
+                hint if char.isdigit()):
+            continue
+
+        candidates.append(move)
+
+    return legal_child(node, candidates, text)
+
+
+# Returns the move and child Node of the one candidate that does not leave
+# the mover's King checked
+def legal_child(node, candidates, text):
+    found = []
+
+    for move in candidates:
+        child = node.node_do_move(move)
+
+        if not child.is_checked(node.side):
+            found.append([move, child])
+
+    if len(found) != 1:
+        raise ValueError(("Illegal" if len(found) == 0 else "Ambiguous") +
+            " move: " + text)
+
+    return found[0]
+
+
+# Returns [offset, tags, movetext] for every game of a PGN file, reading it
+# lazily; offset is the byte offset of the game's first line
+def read_games(file):
+    offset = 0
+    start = None
+    tags = {}
+    movetext = []
+
+    for line in file:
+        text = line.decode("utf-8", "replace").strip()
+
+        if text.startswith("["):
+            # A tag after movetext starts the next game
+            if len(movetext) > 0:
+                yield start, tags, " ".join(movetext)
+
+                start, tags, movetext = None, {}, []
+
+            if start is None:
+                start = offset
+
+            match = TAG.match(text)
+
+            if match:
+                tags[match.group(1)] = match.group(2)
+        elif text:
+            if start is None:
+                start = offset
+
+            movetext.append(text)
+
+        offset += len(line)
+
+    if start is not None:
+        yield start, tags, " ".join(movetext)
+
+
+# Returns the SAN moves of PGN movetext, without comments, variations, NAGs,
+# move numbers or the result
+def san_moves(movetext):
+    movetext = COMMENT.sub(" ", movetext)
+
+    while True:
+        stripped = VARIATION.sub(" ", movetext)
+
+        if stripped == movetext:
+            break
+
+        movetext = stripped
+
+    return NOISE.sub(" ", movetext).split()
+
+
+# Runs in a worker: replays every game of one PGN file
+# Returns records, games, errors: the records of the file (with game numbers
+# counted from 0 within the file), its GAME_TYPE entries and the number of
+# games that could not be replayed (a bad FEN tag or move; only their
+# positions before the error are kept)
+# max_plies = plies of each game to index
+def index_file(path, file_number, max_plies=MAX_PLIES):
+    from position import node_from_fen
+    from searchtree import SearchTree
+
+    start_node = SearchTree(0).curr_board
+    records = []
+    games = []
+    errors = 0
+
+    with open(path, "rb") as file:
+        for offset, tags, movetext in read_games(file):
+            game = len(games)
+            result = tags.get("Result", "*")
+            games.append((file_number, offset, RESULTS.index(result) if
+                result in RESULTS else 3))
+
+            moves = san_moves(movetext)[:max_plies]
+
+            try:
+                node = node_from_fen(tags["FEN"], 0) if "FEN" in tags else\
+                    start_node
+
+                for text in moves:
+                    move, child = parse_san(node, text)
+                    records.append((position_key(node), game, move))
+                    node = child
+            except (ValueError, IndexError):
+                errors += 1
+
+                continue
+
+            # The last position reached, with no move played from it
+            records.append((position_key(node), game, NO_MOVE))
+
+    return np.array(records, dtype=RECORD_TYPE), np.array(games,
+        dtype=GAME_TYPE), errors
+
+
+# Indexes PGN files in parallel and writes the index to the directory
+# "index" (records.npy sorted by hash, games.npy and files.json)
+# Returns the number of games and of games that could not be replayed
+def build_index(index, paths, workers=None, max_plies=MAX_PLIES,
+        executor=None):
+    if executor is None:
+        executor = concurrent.futures.ProcessPoolExecutor(workers)
+
+    with executor:
+        results = list(executor.map(index_file, paths, range(len(paths)),
+            [max_plies] * len(paths)))
+
+    # Number the games across files
+    first = np.cumsum([0] + [len(games) for _, games, _ in results])
+
+    for (records, _, _), base in zip(results, first):
+        records["game"] += int(base)
+
+    records = np.concatenate([result[0] for result in results]) if\
+        len(results) > 0 else np.zeros(0, dtype=RECORD_TYPE)
+    games = np.concatenate([result[1] for result in results]) if\
+        len(results) > 0 else np.zeros(0, dtype=GAME_TYPE)
+
+    records = records[np.argsort(records["hash"], kind="stable")]
+
+    os.makedirs(index, exist_ok=True)
+    np.save(os.path.join(index, "records.npy"), records)
+    np.save(os.path.join(index, "games.npy"), games)
+
+    with open(os.path.join(index, "files.json"), "w") as file:
+        json.dump([os.path.abspath(path) for path in paths], file)
+
+    return len(games), sum(result[2] for result in results)
+
+
+class GameIndex:
+    # index = directory written by build_index()
+    def __init__(self, index):
+        self.records = np.load(os.path.join(index, "records.npy"),
+            mmap_mode="r")
+        self.games = np.load(os.path.join(index, "games.npy"), mmap_mode="r")
+
+        # Searching a plain array of the hashes avoids reading the whole
+        # records into memory
+        self.hashes = self.records["hash"]
+
+        with open(os.path.join(index, "files.json")) as file:
+            self.files = json.load(file)
+
+    # Returns the records of the position with hash "key"
+    def find(self, key):
+        key = np.uint64(key & (2 ** 64 - 1))
+        low = np.searchsorted(self.hashes, key, "left")
+        high = np.searchsorted(self.hashes, key, "right")
+
+        return self.records[low:high]
+
+    # Returns the numbers of the games that reached node's position
+    def games_with(self, node):
+        return np.unique(self.find(position_key(node))["game"])
+
+    # Returns {move: [games, White wins, draws, Black wins]} for the moves
+    # played from node's position, most played first
+    def move_stats(self, node):
+        records = self.find(position_key(node))
+        records = records[records["move"] != NO_MOVE]
+        results = self.games["result"][records["game"]]
+        stats = {}
+
+        for move in np.unique(records["move"]):
+            played = results[records["move"] == move]
+            stats[int(move)] = [len(played)] + [int((played == result).sum())
+                for result in range(3)]
+
+        return dict(sorted(stats.items(), key=lambda item: -item[1][0]))
+
+    # Returns the PGN text of a game
+    def read_game(self, game):
+        entry = self.games[game]
+
+        with open(self.files[entry["file"]], "rb") as file:
+            file.seek(int(entry["offset"]))
+
+            # Only the first game from the offset
+            offset, tags, movetext = next(read_games(file))
+
+        return "\n".join('[{} "{}"]'.format(*tag) for tag in tags.items()) +\
+            "\n\n" + movetext
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Build or look up a game "
+        "database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Index PGN files")
+    build.add_argument("index", help="Directory for the index")
+    build.add_argument("pgn", nargs="+", help="PGN files")
+    build.add_argument("--workers", type=int, default=None, help="Worker "
+        "processes (one per CPU by default)")
+    build.add_argument("--plies", type=int, default=MAX_PLIES, help="Plies "
+        "of each game to index")
+
+    lookup = commands.add_parser("lookup", help="Look up a position")
+    lookup.add_argument("index", help="Directory of the index")
+    lookup.add_argument("fen", help="Position to look up")
+    lookup.add_argument("--games", type=int, default=10, help="Game numbers "
+        "to list")
+    args = parser.parse_args(args)
+
+    if args.command == "build":
+        games, errors = build_index(args.index, args.pgn, args.workers,
+            args.plies)
+        print("Games indexed: ", games, " (could not replay ", errors, ")",
+            sep="")
+
+        return
+
+    from position import node_from_fen
+
+    index = GameIndex(args.index)
+    node = node_from_fen(args.fen)
+
+    print(json.dumps({"games": index.games_with(node)[:args.games].tolist(),
+        "moves": {move_to_str(move): stats for move, stats in
+        index.move_stats(node).items()}}))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
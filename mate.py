@@ -0,0 +1,173 @@
+"""
+Mate Solver for Chess Bot
+Proof-number search for forced mates: the side to move (the attacker) only
+plays checking moves and the defender plays every legal reply, so the tree
+is far narrower than a full-width search, and it is grown best-first
+toward the position that is cheapest to prove or disprove
+"""
+
+INFINITY = 10 ** 9  # Proof/disproof number of a solved node
+MATE_MOVES = 5  # Default number of attacker moves to look for a mate in
+MATE_NODES = 200000  # Default budget of generated positions
+
+
+class ProofNode:
+    # position = the Node of the position
+    # attacker = whether the attacker is to move (an OR node; otherwise an
+    # AND node, where the defender is to move)
+    # depth = attacker moves made to reach the position
+    def __init__(self, position, attacker, depth, parent=None):
+        self.position = position
+        self.attacker = attacker
+        self.depth = depth
+        self.parent = parent
+
+        self.children = None  # ProofNodes of the moves, once expanded
+        self.proof = 1  # Proof number: positions still to prove the mate
+        self.disproof = 1  # Disproof number: positions still to refute it
+
+    def set_proven(self):
+        self.proof, self.disproof = 0, INFINITY
+
+    def set_disproven(self):
+        self.proof, self.disproof = INFINITY, 0
+
+    # Recomputes the proof and disproof numbers from the children
+    def update(self):
+        proofs = [child.proof for child in self.children]
+        disproofs = [child.disproof for child in self.children]
+
+        # The attacker needs one move that mates, the defender one that
+        # escapes
+        if self.attacker:
+            self.proof = min(proofs)
+            self.disproof = min(sum(disproofs), INFINITY)
+        else:
+            self.proof = min(sum(proofs), INFINITY)
+            self.disproof = min(disproofs)
+
+
+class MateSolver:
+    # root = Node where the attacker is to move
+    # max_moves = attacker moves the mate may take
+    # max_nodes = positions that may be generated before giving up
+    def __init__(self, root, max_moves=MATE_MOVES, max_nodes=MATE_NODES):
+        self.root = ProofNode(root, True, 0)
+        self.max_moves = max_moves
+        self.max_nodes = max_nodes
+
+        self.nodes = 0  # Positions generated
+
+    # Generates the children of a leaf, or solves it if the game is over or
+    # the attacker is out of moves
+    def expand(self, proof_node):
+        position = proof_node.position
+
+        if proof_node.attacker and proof_node.depth == self.max_moves:
+            proof_node.set_disproven()
+
+            return
+
+        child_nodes = position.expand()
+        self.nodes += len(child_nodes)
+
+        if len(child_nodes) == 0:
+            # Mate if the defender is to move and checked
+            if not proof_node.attacker and position.is_checked(position.side):
+                proof_node.set_proven()
+            else:
+                proof_node.set_disproven()
+
+            return
+
+        # The attacker only plays checks
+        if proof_node.attacker:
+            child_nodes = [node for node in child_nodes if
+                node.is_checked(node.side)]
+
+            if len(child_nodes) == 0:
+                proof_node.set_disproven()
+
+                return
+
+        depth = proof_node.depth + 1 if proof_node.attacker else\
+            proof_node.depth
+
+        proof_node.children = [ProofNode(node, not proof_node.attacker,
+            depth, proof_node) for node in child_nodes]
+        proof_node.update()
+
+    # Returns the leaf to expand next: from the root, the child with the
+    # smallest proof number where the attacker moves and the smallest
+    # disproof number where the defender does
+    def most_proving(self):
+        proof_node = self.root
+
+        while proof_node.children is not None:
+            if proof_node.attacker:
+                proof_node = min(proof_node.children, key=lambda child:
+                    child.proof)
+            else:
+                proof_node = min(proof_node.children, key=lambda child:
+                    child.disproof)
+
+        return proof_node
+
+    # Updates the numbers from a newly expanded node up to the root
+    def update_ancestors(self, proof_node):
+        proof_node = proof_node.parent
+
+        while proof_node is not None:
+            proof, disproof = proof_node.proof, proof_node.disproof
+            proof_node.update()
+
+            # Nothing above changes if this node did not
+            if proof_node.proof == proof and proof_node.disproof == disproof:
+                break
+
+            proof_node = proof_node.parent
+
+    # Runs the search until the root is solved or the budget is spent
+    # Returns the forced line (attacker and defender moves, ending in mate)
+    # or None if there is no mate in max_moves or none was found in time
+    def solve(self):
+        while self.root.proof != 0 and self.root.disproof != 0 and\
+                self.nodes < self.max_nodes:
+            proof_node = self.most_proving()
+
+            self.expand(proof_node)
+            self.update_ancestors(proof_node)
+
+        if self.root.proof != 0:
+            return None
+
+        return self.mate_line(self.root)[1]
+
+    # Returns the result of the search: "mate", "no mate" (within max_moves)
+    # or "unknown" (budget spent)
+    def status(self):
+        if self.root.proof == 0:
+            return "mate"
+
+        return "no mate" if self.root.disproof == 0 else "unknown"
+
+    # Returns length, moves: the shortest mate the attacker can force from a
+    # proven node against the longest defense, and its moves
+    def mate_line(self, proof_node):
+        if proof_node.children is None:
+            return 0, []
+
+        lines = [self.mate_line(child) for child in proof_node.children if
+            child.proof == 0]
+
+        # Every defender move is proven; the attacker only needs one
+        if proof_node.attacker:
+            index = min(range(len(lines)), key=lambda i: lines[i][0])
+        else:
+            index = max(range(len(lines)), key=lambda i: lines[i][0])
+
+        child = [child for child in proof_node.children if child.proof ==
+            0][index]
+        length, moves = lines[index]
+
+        return length + 1, [child.position.move] + moves
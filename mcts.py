@@ -0,0 +1,328 @@
+"""
+Monte Carlo Tree Search for Chess Bot
+An alternative to the minimax search of SearchTree: PUCT (or UCT) tree
+search over Node.expand(), where each new leaf is valued by the heuristic
+instead of a random playout
+Leaves are collected in batches (virtual loss keeps one batch from taking
+the same path again), expanded, and then valued together: the heuristic
+terms of the whole batch are counted on its stacked boards (see
+node.evaluate_nodes()) and squashed and backed up with NumPy
+"""
+
+import time
+
+import numpy as np
+from node import evaluate_nodes
+
+EXPLORATION = 1.5  # c of the PUCT and UCT formulas
+VALUE_SCALE = 5  # Heuristic points that map to a value of tanh(1) = 0.76
+PRIOR_TEMPERATURE = 2  # Heuristic points that make a move e times likelier
+# in the priors
+BATCH_SIZE = 8  # Leaves collected before they are valued together
+VIRTUAL_LOSS = 1  # Loss added along a path while its leaf is pending
+MAX_TREE = 20000  # Positions the tree may hold before it is recycled
+RECYCLE_SHARE = 0.75  # Share of MAX_TREE that recycling brings it down to
+DEFAULT_VISITS = 800  # Visits of a search with neither budget given
+
+
+# One position in the tree; the statistics of its moves (edges) are held in
+# arrays, so that a move is picked with one vectorized formula
+class MCTSNode:
+    # position = the Node of the position
+    def __init__(self, position):
+        self.position = position
+
+        # Set once expanded
+        self.children = None  # Child Nodes, one per legal move
+        self.nodes = None  # MCTSNode of each child once visited, else None
+        self.priors = None  # Prior probability of each move
+        self.visits = None  # Visits of each move
+        self.values = None  # Sum of the values of each move, from the point
+        # of view of the side to move here
+        self.terminal = None  # Value (from the computer's point of view) if
+        # the game is over here
+
+    def is_expanded(self):
+        return self.children is not None
+
+
+class MCTS:
+    # root = Node to search from (its player is the computer)
+    # formula = "puct" (priors from the heuristic guide the search) or "uct"
+    # max_tree = positions the tree may hold (see recycle())
+    # batch_size = leaves valued together
+    def __init__(self, root, formula="puct", exploration=EXPLORATION,
+            max_tree=MAX_TREE, batch_size=BATCH_SIZE):
+        self.root = MCTSNode(root)
+        self.player = root.player
+        self.formula = formula
+        self.exploration = exploration
+        self.max_tree = max_tree
+        self.batch_size = batch_size
+
+        self.size = 1  # Positions held in the tree
+        self.recycled = 0  # Positions dropped by recycle()
+        self.generated = 0  # Positions made by expand(), recycled or not
+
+    # Returns the value of a position from the computer's point of view,
+    # squashed into (-1, 1)
+    def leaf_value(self, node):
+        return np.tanh(node.position.evaluate() / VALUE_SCALE)
+
+    # Expands a tree node: makes its children and their priors
+    # Returns the number of positions added
+    def expand(self, tree_node):
+        position = tree_node.position
+        children = position.expand()
+        self.generated += len(children)
+
+        if len(children) == 0:
+            tree_node.terminal = self.leaf_value(tree_node)
+
+            return 0
+
+        # The children's cheap heuristic values (see Node.evaluate()), from
+        # the point of view of the side to move
+        sign = 1 if position.side == self.player else -1
+        scores = sign * np.array([child.h_value for child in children],
+            dtype=float) / PRIOR_TEMPERATURE
+        priors = np.exp(scores - scores.max())
+
+        tree_node.nodes = [None] * len(children)
+        tree_node.priors = priors / priors.sum()
+        tree_node.visits = np.zeros(len(children))
+        tree_node.values = np.zeros(len(children))
+        tree_node.children = children
+
+        return len(children)
+
+    # Returns the index of the move to follow from an expanded tree node
+    def pick(self, tree_node):
+        visits = tree_node.visits
+        total = visits.sum()
+        q = tree_node.values / np.maximum(visits, 1)
+
+        if self.formula == "uct":
+            # Unvisited moves first, in the order of their priors
+            explore = self.exploration * np.sqrt(np.log(max(total, 1)) /
+                np.maximum(visits, 1))
+
+            return int(np.argmax(np.where(visits == 0, 1e9 +
+                tree_node.priors, q + explore)))
+
+        return int(np.argmax(q + self.exploration * tree_node.priors *
+            np.sqrt(total + 1) / (1 + visits)))
+
+    # Walks from the root to a leaf, adding a virtual loss to every move on
+    # the way
+    # Returns path, leaf: path lists [tree node, move index] from the root;
+    # leaf is the tree node reached (None if it is already pending in this
+    # batch)
+    def select(self, pending):
+        path = []
+        tree_node = self.root
+
+        while tree_node.is_expanded():
+            index = self.pick(tree_node)
+            path.append([tree_node, index])
+
+            tree_node.visits[index] += VIRTUAL_LOSS
+            tree_node.values[index] -= VIRTUAL_LOSS
+
+            if tree_node.nodes[index] is None:
+                tree_node.nodes[index] = MCTSNode(tree_node.children[index])
+
+            tree_node = tree_node.nodes[index]
+
+        if id(tree_node) in pending:
+            return path, None
+
+        return path, tree_node
+
+    # Takes the virtual loss back off a path and adds the leaf's value
+    # value = leaf value from the computer's point of view
+    def backup(self, path, value):
+        for tree_node, index in path:
+            sign = 1 if tree_node.position.side == self.player else -1
+
+            tree_node.visits[index] += 1 - VIRTUAL_LOSS
+            tree_node.values[index] += sign * value + VIRTUAL_LOSS
+
+    # Collects, expands and values one batch of leaves
+    def run_batch(self):
+        paths = []
+        leaves = []
+        pending = set()
+
+        for _ in range(self.batch_size):
+            path, leaf = self.select(pending)
+
+            # The same leaf again: the tree is too small to fill the batch
+            if leaf is None:
+                self.backup(path, 0)
+                self.undo_visit(path)
+
+                break
+
+            paths.append(path)
+            leaves.append(leaf)
+            pending.add(id(leaf))
+
+        new = [leaf for leaf in leaves if leaf.terminal is None and not
+            leaf.is_expanded()]
+
+        self.size += sum(self.expand(leaf) for leaf in new)
+
+        # Terminal values are already squashed; the rest are valued by the
+        # heuristic together
+        values = np.array([0 if leaf.terminal is None else leaf.terminal for
+            leaf in leaves], dtype=float)
+        heuristic = np.array([leaf.terminal is None for leaf in leaves],
+            dtype=bool)
+
+        if heuristic.any():
+            values[heuristic] = np.tanh(evaluate_nodes([leaf.position for
+                leaf in leaves if leaf.terminal is None]) / VALUE_SCALE)
+
+        for path, value in zip(paths, values):
+            self.backup(path, value)
+
+        return len(leaves)
+
+    # Removes the visit a backup() added along a path that found no leaf
+    def undo_visit(self, path):
+        for tree_node, index in path:
+            tree_node.visits[index] -= 1
+
+    # Brings the tree down to RECYCLE_SHARE of max_tree positions by
+    # collapsing the least visited nodes whose children are all leaves back
+    # into leaves; their own statistics (held by their parents) are kept
+    # Collapsing makes their parents the new frontier, so passes are made
+    # until the target is reached; the tree then has room for many batches
+    # before search() calls this again
+    def recycle(self):
+        target = self.max_tree * RECYCLE_SHARE
+
+        while self.size > target:
+            if not self.recycle_pass(target):
+                break
+
+    # Makes one recycle() pass over the current frontier
+    # Returns False if there was nothing left to collapse
+    def recycle_pass(self, target):
+        frontier = []
+        stack = [self.root]
+
+        while len(stack) > 0:
+            tree_node = stack.pop()
+            inner = [child for child in tree_node.nodes if child is not None
+                and child.is_expanded()]
+
+            if len(inner) == 0 and tree_node is not self.root:
+                frontier.append([tree_node.visits.sum(), id(tree_node),
+                    tree_node])
+
+            stack += inner
+
+        frontier.sort(key=lambda entry: entry[:2])
+
+        for _, _, tree_node in frontier:
+            if self.size <= target:
+                break
+
+            self.size -= len(tree_node.children)
+            self.recycled += len(tree_node.children)
+
+            tree_node.children = None
+            tree_node.nodes = None
+            tree_node.priors = None
+            tree_node.visits = None
+            tree_node.values = None
+
+        return len(frontier) > 0
+
+    # Searches until max_visits root visits or the deadline, whichever comes
+    # first (DEFAULT_VISITS if neither is given)
+    # deadline = time.monotonic() value at which to stop
+    # Returns the most visited move (None if the game is over)
+    def search(self, max_visits=None, deadline=None):
+        if max_visits is None and deadline is None:
+            max_visits = DEFAULT_VISITS
+
+        if not self.root.is_expanded() and self.root.terminal is None:
+            self.size += self.expand(self.root)
+
+        if self.root.terminal is not None:
+            return None
+
+        while (max_visits is None or self.root.visits.sum() < max_visits)\
+                and (deadline is None or time.monotonic() < deadline):
+            if self.size >= self.max_tree:
+                self.recycle()
+
+            if self.run_batch() == 0:
+                break
+
+        return self.best_move()
+
+    def best_move(self):
+        if not self.root.is_expanded():
+            return None
+
+        # Most visits, then the best average value
+        q = self.root.values / np.maximum(self.root.visits, 1)
+        index = max(range(len(q)), key=lambda i: (self.root.visits[i], q[i]))
+
+        return self.root.children[index].move
+
+    # Returns [move, visits, value] for every root move, most visited first;
+    # value is the average value mapped back to heuristic points (from the
+    # computer's point of view)
+    def root_scores(self):
+        if not self.root.is_expanded():
+            return []
+
+        sign = 1 if self.root.position.side == self.player else -1
+        q = self.root.values / np.maximum(self.root.visits, 1)
+        points = sign * VALUE_SCALE * np.arctanh(np.clip(q, -0.999, 0.999))
+
+        scores = [[child.move, int(visits), float(value)] for child, visits,
+            value in zip(self.root.children, self.root.visits, points)]
+
+        return sorted(scores, key=lambda score: -score[1])
+
+    # Moves the root to the child reached by "move", keeping its subtree
+    # Returns False if that child is not in the tree (the caller should
+    # start a new tree)
+    def advance(self, move):
+        if not self.root.is_expanded():
+            return False
+
+        for index, child in enumerate(self.root.children):
+            if child.move == move:
+                tree_node = self.root.nodes[index]
+
+                if tree_node is None:
+                    return False
+
+                self.root = tree_node
+                self.size = self.count(tree_node)
+
+                return True
+
+        return False
+
+    # Returns the number of positions held under a tree node
+    def count(self, tree_node):
+        total = 1
+        stack = [tree_node]
+
+        while len(stack) > 0:
+            tree_node = stack.pop()
+
+            if tree_node.is_expanded():
+                total += len(tree_node.children)
+                stack += [child for child in tree_node.nodes if child is not
+                    None]
+
+        return total
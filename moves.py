@@ -0,0 +1,128 @@
+"""
+Move Encoding for Chess Bot
+Moves are 16-bit ints:
+    bits 0-5 = end square, bits 6-11 = start square, bits 12-15 = flags
+Squares are numbered row * 8 + col (A1 = 0, H1 = 7, A8 = 56)
+"""
+
+# Flags (bits 12-15)
+QUIET = 0
+DOUBLE_PUSH = 1  # Pawn moving two squares up (opens en passant)
+KING_CASTLE = 2  # Castle on the right side (King moves to column 6)
+QUEEN_CASTLE = 3  # Castle on the left side (King moves to column 2)
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8  # Plus the new piece (0 = Rook, 1 = Knight, 2 = Bishop,
+# 3 = Queen) in the low 2 bits
+PROMOTION_CAPTURE = 12  # Same as PROMOTION, but also takes a piece
+
+NO_MOVE = 0  # A1 to A1 is never a real move
+
+COLUMNS = "abcdefgh"
+PROMOTION_LETTERS = "rnbq"  # Letter of each promotion piece
+
+
+# Returns the move from [start_row, start_col] to [end_row, end_col]
+def encode_move(start_row, start_col, end_row, end_col, flags=QUIET):
+    return flags << 12 | (start_row * 8 + start_col) << 6 | (end_row * 8 +
+        end_col)
+
+
+# Returns (row, col) of the square the move starts on
+def start_square(move):
+    return move >> 9 & 7, move >> 6 & 7
+
+
+# Returns (row, col) of the square the move ends on
+def end_square(move):
+    return move >> 3 & 7, move & 7
+
+
+# Returns the flags of a move (also works on arrays of moves)
+def move_flags(move):
+    return move >> 12
+
+
+def is_capture(move):
+    return move >> 12 & CAPTURE != 0
+
+
+def is_promotion(move):
+    return move >> 12 & PROMOTION != 0
+
+
+# Returns the piece a Pawn is promoted to (only valid for promotions)
+def promotion_piece(move):
+    return move >> 12 & 3
+
+
+def is_castle(move):
+    return move >> 12 == KING_CASTLE or move >> 12 == QUEEN_CASTLE
+
+
+# Returns the move from the "start" square to the "end" square in "node",
+# with the flags read off the board
+# promotion = piece a Pawn reaching the last row becomes (Queen by default)
+def coords_to_move(node, start, end, promotion=3):
+    start_row, start_col = int(start[0]), int(start[1])
+    end_row, end_col = int(end[0]), int(end[1])
+
+    piece = node.board[start_row, start_col][2]
+    taken = node.board[end_row, end_col][0] != -1
+
+    if piece == 5 and (end_row == 7 or end_row == 0):
+        flags = (PROMOTION_CAPTURE if taken else PROMOTION) | promotion
+    elif taken:
+        flags = CAPTURE
+    elif piece == 5 and start_col != end_col and end_row ==\
+            node.en_passant[0] and end_col == node.en_passant[1]:
+        flags = EN_PASSANT
+    elif piece == 5 and abs(end_row - start_row) == 2:
+        flags = DOUBLE_PUSH
+    elif piece == 4 and end_col - start_col == 2:
+        flags = KING_CASTLE
+    elif piece == 4 and end_col - start_col == -2:
+        flags = QUEEN_CASTLE
+    else:
+        flags = QUIET
+
+    return encode_move(start_row, start_col, end_row, end_col, flags)
+
+
+# Returns the name of a square (i.e (1, 4) -> "e2")
+def square_name(square):
+    return COLUMNS[square[1]] + str(square[0] + 1)
+
+
+# Returns the (row, col) of a named square (i.e "e2" -> (1, 4))
+def parse_square(name):
+    if len(name) != 2 or name[0].lower() not in COLUMNS or name[1] not in\
+            "12345678":
+        raise ValueError("Not a square: " + name)
+
+    return int(name[1]) - 1, COLUMNS.index(name[0].lower())
+
+
+# Returns the move in coordinate notation (i.e "e2e4", "e7e8q")
+def move_to_str(move):
+    text = square_name(start_square(move)) + square_name(end_square(move))
+
+    if is_promotion(move):
+        text += PROMOTION_LETTERS[promotion_piece(move)]
+
+    return text
+
+
+# Returns the move in "node" written in coordinate notation (see
+# move_to_str)
+def parse_move(node, text):
+    text = text.strip().lower()
+
+    if len(text) not in (4, 5) or (len(text) == 5 and text[4] not in
+            PROMOTION_LETTERS):
+        raise ValueError("Not a move: " + text)
+
+    promotion = PROMOTION_LETTERS.index(text[4]) if len(text) == 5 else 3
+
+    return coords_to_move(node, parse_square(text[:2]),
+        parse_square(text[2:4]), promotion)
@@ -6,26 +6,36 @@ Jerry Shukai Zhang
 
 import numpy as np
 from copy import deepcopy
+from evalcache import EVAL_CACHE
+from pawns import PAWN_TABLE, PAWN_SIGNS, pawn_structure, pawn_structures,\
+    pawn_terms
+from psqt import EG_VALUES, MG_VALUES, PHASE_WEIGHTS, tapered
+from moves import encode_move, is_capture, is_castle, move_flags,\
+    DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EN_PASSANT, PROMOTION,\
+    PROMOTION_CAPTURE
+from weights import DEFAULT_WEIGHTS
+from zobrist import PIECE_KEYS, MOVED_KEYS, EN_PASSANT_KEYS, SIDE_KEY
 
-POINTS = np.array([5, 3, 3, 9, 0, 1])  # Points that each piece are worth
 EMPTY_2 = np.array([-1, -1])  # "Empty" two-element array used for comparison
 EMPTY_3 = np.array([-1, -1, -1])  # Same idea, but three-element
 
-# Values used in heuristics
-HEUR_P1_ADD = 100  # If someone checkmates, add by this number
-HEUR_P1_DIVIDE = 2  # If someone draws, divide by this number
-HEUR_P4_POINTS = [3, 2, 2, 4, 0, 1]  # Points for moving each piece type from
-# its starting position
-HEUR_P5_ADD = 3  # Points for checking
-HEUR_P6_ADD = 3  # Points for castling
+# [row_change, col_change] of every Knight move and of every 1-square move
+# (the cardinal directions first, then the intermediate ones)
+KNIGHT_STEPS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1),
+    (-2, 1), (-1, 2))
+KING_STEPS = ((1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (1, -1), (-1, -1),
+    (-1, 1))
+
+# The values used in heuristics are held in a Weights object (see weights.py)
 
 
 class Node:
-    def __init__(self, state, side, player):
+    def __init__(self, state, side, player, weights=DEFAULT_WEIGHTS):
         # Parameter inputs
         self.board = state  # The current board-state
         self.side = side  # Whoever has the move right now
         self.player = player  # Side that the computer is playing as
+        self.weights = weights  # Weights used in heuristics
 
         # Values given by parent
         # My own values (values of the person making the move right now)
@@ -44,8 +54,20 @@ class Node:
         self.opp_targeted = None
 
         self.h_value = 0  # Heuristic value
+        self.pending = False  # Whether h_value still lacks Heuristic Parts 3
+        # and 7 (see evaluate())
         self.outcome = "Ongoing"  # "Ongoing", "Draw", "Checkmate"
         self.move = None  # Most recent move used to create this board state
+        self.hash = 0  # Zobrist hash of the position (see zobrist.py)
+        self.attacked = None  # [White, Black] number of times each side's
+        # pieces are attacked, once counted (see attack_counts())
+        self.pawn_hash = 0  # Hash of the Pawns alone (see zobrist.py)
+        self.pawns = None  # Pawn structure, once known (see pawns.py)
+        self.mg_score = 0  # Piece-square table scores from White's point of
+        self.eg_score = 0  # view and the phase of the position (see psqt.py)
+        self.phase = 0
+        self.legal = None  # Set of the legal moves, once known (see
+        # legal_moves())
 
     # Returns the number of times that pieces in "squares" are attacked in
     # the "targeted" matrix
@@ -61,6 +83,85 @@ class Node:
 
         return total
 
+    # Returns [White, Black]: the number of times each side's pieces are
+    # attacked, looked up in the evaluation cache (see evalcache.py) before
+    # counting them
+    def attack_counts(self):
+        if self.attacked is None:
+            self.attacked = EVAL_CACHE.probe(self.hash)
+
+        if self.attacked is None:
+            mine = self.num_attacked(self.my_squares, self.opp_targeted)
+            theirs = self.num_attacked(self.opp_squares, self.my_targeted)
+
+            self.attacked = (mine, theirs) if self.side == 0 else\
+                (theirs, mine)
+
+            EVAL_CACHE.store(self.hash, self.attacked[0], self.attacked[1])
+
+        return self.attacked
+
+    # Returns the value of Heuristic Part 3 for this position: points lost
+    # each time the computer's pieces are attacked, and gained each time its
+    # opponent's are
+    def attack_value(self):
+        counts = self.attack_counts()
+
+        return self.weights.attacked * (counts[1 - self.player] -\
+            counts[self.player])
+
+    # Returns [White, Black] arrays of the Pawn structure counts (see
+    # pawns.py), looking the structure up in the Pawn table before counting
+    def pawn_counts(self):
+        if self.pawns is None:
+            self.pawns = PAWN_TABLE.probe(self.pawn_hash)
+
+        if self.pawns is None:
+            self.pawns = pawn_structure(self.board)
+
+            PAWN_TABLE.store(self.pawn_hash, self.pawns)
+
+        kings = [self.my_squares[4], self.opp_squares[4]] if self.side == 0\
+            else [self.opp_squares[4], self.my_squares[4]]
+
+        return pawn_terms(self.pawns, kings)
+
+    # Returns the value of Heuristic Part 7 for this position: the
+    # computer's Pawn structure against its opponent's
+    def pawn_value(self):
+        counts = self.pawn_counts()
+
+        return np.dot(counts[self.player] - counts[1 - self.player],\
+            self.weights.pawns * PAWN_SIGNS)
+
+    # Returns the value of Heuristic Part 8 for this position: the
+    # piece-square tables, blended between the middlegame and the endgame by
+    # the phase
+    def psqt_value(self):
+        value = self.weights.psqt * tapered(self.mg_score, self.eg_score,
+            self.phase)
+
+        return value if self.player == 0 else -value
+
+    # Returns h_value, first adding the position-only Heuristic Parts 3 and
+    # 7 that node_do_move leaves out (so nodes that are never evaluated never
+    # pay for them)
+    # They are skipped, and the cheap value is returned as it is, when it is
+    # already more than "margin" outside the window alpha/beta
+    # margin = how much Parts 3 and 7 are assumed to change the value at
+    # most (None to always add them); a margin smaller than they can be
+    # makes the value differ from a full evaluation when they are larger
+    def evaluate(self, alpha=-9999, beta=9999, margin=None):
+        if self.pending:
+            if margin is not None and (self.h_value - margin >= beta or\
+                    self.h_value + margin <= alpha):
+                return self.h_value
+
+            self.h_value += self.attack_value() + self.pawn_value()
+            self.pending = False
+
+        return self.h_value
+
     # Used when a square is cleared or blocked (moved/placed in empty square)
     # side = the side of the targeted matrix
     # square = the square being altered
@@ -75,103 +176,41 @@ class Node:
         # +1 to each square if a square is being cleared, -1 if it's blocked
         change = 1 if action == 0 else -1
 
-        # Check the cardinal directions for Rook/Queen
-        # Find the coordinates of the upmost/rightmost/downmost/leftmost
-        # pieces (-1 set the default for min values and 8 for max)
-        vert = np.array([-1, 8])
-        horiz = np.array([-1, 8])
-        for direction in range(4):
-            start_index = start_row if direction < 2 else start_col
-            start_index += -1 if direction % 2 == 0 else 1
-            end_index = vert[direction] if direction < 2 else\
-                horiz[direction % 2]
-            increment = -1 if direction % 2 == 0 else 1
-
-            for index in range(start_index, end_index, increment):
-                row = index if direction < 2 else start_row
-                col = start_row if direction < 2 else index
-
-                if (board[row, col] != EMPTY_3).all():
-                    if direction < 2:
-                        vert[direction] = index
-                    else:
-                        horiz[direction % 2] = index
-
-                    break
-
-        # Once the needed pieces of found, determine how many times each
-        # square in this row/col need to have their numbers increased
-        for direction in range(4):
-            index = vert[direction] if direction < 2 else horiz[direction % 2]
-            increment = 1 if direction % 2 == 0 else -1
-
-            if index != -1 and index != 8:
-                row = index if direction < 2 else start_row
-                col = start_col if direction < 2 else index
-
-                tup = board[row, col]
-                piece = tup[2]
+        # Look for a Rook/Queen (cardinal directions) or a Bishop/Queen
+        # (intermediate directions) whose line runs through the square
+        for row_change, col_change in KING_STEPS:
+            sliders = (0, 3) if row_change == 0 or col_change == 0 else (2, 3)
 
-                if tup[0] == side and (piece == 0 or piece == 3):
-                    while row in range(0, 8) and col in range(0, 8):
-                        targeted[row, col] += change
-
-                        if (board[row, col] != EMPTY_3).all():
-                            break
-
-                        if direction < 2:
-                            row += increment
-                        else:
-                            col += increment
-
-        # Check the intermediate directions for Bishop/Queen
-        # Find the coordinates of the pieces on every diagonal
-        # (-1 set the default for min values and 8 for max)
-        pos_diag = np.array([-1, 8])
-        neg_diag = np.array([-1, 8])
-
-        row_change = -1
-        col_change = -1
-        for direction in range(4):
+            # Find the first piece in this direction
             row = start_row + row_change
             col = start_col + col_change
 
-            while row in range(0, 8) and col in range(0, 8):
-                if (board[row, col] != EMPTY_3).all():
-                    if direction % 2 == 0:
-                        pos_diag[direction // 2] = index
-                    else:
-                        neg_diag[(direction - 1) // 2] = index
-
-                    break
-
+            while row in range(0, 8) and col in range(0, 8) and\
+                    board[row, col][0] == -1:
                 row += row_change
                 col += col_change
 
-        # Once the needed pieces of found, determine how many times each
-        # square in each diagonal need to have their numbers increased
-        for direction in range(4):
-            index = vert[direction // 2] if direction % 2 == 0 else\
-                horiz[(direction - 1) % 2]
-            row_change = 1 if direction < 2 else -1
-            col_change = 1 if direction % 2 == 0 else 1
+            if row not in range(0, 8) or col not in range(0, 8):
+                continue
 
-            if index != -1 and index != 8:
-                row = index
-                col = index if direction % 2 == 0 else 7 - index
+            tup = board[row, col]
 
-                tup = board[row, col]
-                piece = tup[2]
+            if tup[0] != side or tup[2] not in sliders:
+                continue
 
-                if tup[0] == side and (piece == 2 or piece == 3):
-                    while row in range(0, 8) and col in range(0, 8):
-                        targeted[row, col] += change
+            # The piece's line continues past the square (up to and including
+            # the next piece) while the square is clear
+            row = start_row - row_change
+            col = start_col - col_change
 
-                        if (board[row, col] != EMPTY_3).all():
-                            break
+            while row in range(0, 8) and col in range(0, 8):
+                targeted[row, col] += change
 
-                        row += row_change
-                        col += col_change
+                if board[row, col][0] != -1:
+                    break
+
+                row -= row_change
+                col -= col_change
 
     # Used when a piece is inserted or removed (placed/ taken)
     # side = the side of the targeted matrix
@@ -205,7 +244,7 @@ class Node:
                 while row in range(0, 8) and col in range(0, 8):
                     targeted[row, col] += change
 
-                    if (self.board[row, col] != EMPTY_3).all():
+                    if (board[row, col] != EMPTY_3).all():
                         break
 
                     row += row_change
@@ -275,7 +314,7 @@ class Node:
                 while row in range(0, 8) and col in range(0, 8):
                     targeted[row, col] += change
 
-                    if (self.board[row, col] != EMPTY_3).all():
+                    if (board[row, col] != EMPTY_3).all():
                         break
 
                     row += row_change
@@ -303,24 +342,192 @@ class Node:
 
         return self.is_attacked(king_coord, side)
 
-    # Returns an array of available nodes/ only add valid nodes
-    # Also updates game status if checkmate/draw
-    def expand(self):
+    # Returns the value of a piece in exchanges (a King is worth a
+    # checkmate, so it is never traded off)
+    def piece_value(self, piece):
+        return self.weights.checkmate if piece == 4 else\
+            self.weights.points[piece]
+
+    # Returns [value, square] of the least valuable piece of "side" that
+    # attacks "square", or None if there is none
+    # removed = squares whose pieces have already been traded off (lines
+    # through them are open, so pieces behind them attack as well)
+    # board = board to look at instead of this node's (see legal_moves())
+    def least_attacker(self, square, side, removed=(), board=None):
+        if board is None:
+            board = self.board
+
+        row = square[0]
+        col = square[1]
+
+        # [row, col, pieces] of every square an attacker could be on
+        candidates = []
+
+        # Pawns attack one row up, so look one row down from the square
+        pawn_row = row - 1 if side == 0 else row + 1
+
+        for pawn_col in (col - 1, col + 1):
+            candidates.append((pawn_row, pawn_col, (5,)))
+
+        for row_change, col_change in KNIGHT_STEPS:
+            candidates.append((row + row_change, col + col_change, (1,)))
+
+        for row_change, col_change in KING_STEPS:
+            candidates.append((row + row_change, col + col_change, (4,)))
+
+            # The first piece on each line may be a Rook/Queen (cardinal) or
+            # a Bishop/Queen (intermediate)
+            check_row = row + row_change
+            check_col = col + col_change
+
+            while check_row in range(0, 8) and check_col in range(0, 8):
+                if board[check_row, check_col][0] != -1 and\
+                        (check_row, check_col) not in removed:
+                    candidates.append((check_row, check_col, (0, 3) if
+                        row_change == 0 or col_change == 0 else (2, 3)))
+
+                    break
+
+                check_row += row_change
+                check_col += col_change
+
+        best = None
+
+        for check_row, check_col, pieces in candidates:
+            if check_row not in range(0, 8) or check_col not in range(0, 8)\
+                    or (check_row, check_col) in removed:
+                continue
+
+            tup = board[check_row, check_col]
+
+            if tup[0] == side and tup[2] in pieces:
+                value = self.piece_value(tup[2])
+
+                if best is None or value < best[0]:
+                    best = [value, (check_row, check_col)]
+
+        return best
+
+    # Returns how much "side" wins by starting the exchange on "square"
+    # (static exchange evaluation); each side recaptures with its least
+    # valuable attacker and may stop whenever continuing would lose
+    # value = value of the piece standing on the square
+    # removed = squares whose pieces have already been traded off
+    def exchange(self, square, side, value, removed=frozenset()):
+        attacker = self.least_attacker(square, side, removed)
+
+        if attacker is None:
+            return 0
+
+        opp = 1 if side == 0 else 0
+
+        return max(0, value - self.exchange(square, opp, attacker[0],\
+            removed | {attacker[1]}))
+
+    # Returns the material that the side to move wins (negative if it loses
+    # material) by making the move and then trading off every piece that
+    # attacks the square it lands on
+    # move = move encoded as in moves.py
+    def see(self, move):
+        flags = move_flags(move)
+
+        if is_castle(move):
+            return 0
+
+        start = (move >> 9 & 7, move >> 6 & 7)
+        end = (move >> 3 & 7, move & 7)
         opp = 1 if self.side == 0 else 0
-        available_nodes = []
+
+        piece = self.board[start][2]
+        removed = {start}
+        gain = 0
+
+        if flags == EN_PASSANT:
+            # The taken Pawn is next to the start square
+            gain = self.piece_value(5)
+            removed.add((start[0], end[1]))
+        elif flags & CAPTURE:
+            gain = self.piece_value(self.board[end][2])
+
+        # A promoted Pawn is worth its new piece
+        if flags & PROMOTION:
+            piece = flags & 3
+            gain += self.piece_value(piece) - self.piece_value(5)
+
+        return gain - self.exchange(end, opp, self.piece_value(piece),\
+            removed)
+
+    # Returns True if the piece of "side" on "square" cannot be won by the
+    # opponent through captures on that square
+    # value = value of the piece (that of the piece on the square if None,
+    # i.e. give the value of a piece that is about to move there)
+    # removed = squares being emptied (i.e. the start square of that move)
+    def is_safe(self, square, side, value=None, removed=()):
+        # Squares that are not attacked at all are always safe
+        if len(removed) == 0 and not self.is_attacked(square, side):
+            return True
+
+        if value is None:
+            value = self.piece_value(self.board[square[0], square[1]][2])
+
+        opp = 1 if side == 0 else 0
+
+        return self.exchange(square, opp, value, frozenset(removed)) == 0
+
+    # Returns [see, move] for every capture that does not lose material
+    # (see see()), best first; moves are not checked for leaving one's own
+    # King checked
+    # moves = the moves to pick from (every move available if None)
+    def good_captures(self, moves=None):
+        captures = []
+
+        if moves is None:
+            moves = self.generate_moves()
+
+        for move in moves:
+            if is_capture(move):
+                gain = self.see(move)
+
+                if gain >= 0:
+                    captures.append([gain, move])
+
+        captures.sort(key=lambda capture: -capture[0])
+
+        return captures
+
+    # Returns the move for going from "start" to the square [row, col], or
+    # None if the square is taken by one's own piece or by a King
+    # (moves are encoded as in moves.py)
+    def square_move(self, start, row, col):
+        tup = self.board[row, col]
+
+        # If the square is empty
+        if tup[0] == -1:
+            return encode_move(start[0], start[1], row, col)
+
+        # If the square is takeable
+        if tup[0] != self.side and tup[2] != 4:
+            return encode_move(start[0], start[1], row, col, CAPTURE)
+
+        return None
+
+    # Returns a list of every move available to the side to move, without
+    # checking whether it leaves one's own King checked (castling is fully
+    # checked); moves are encoded as in moves.py
+    def generate_moves(self):
+        moves = []
 
         for piece_id in range(len(self.my_squares)):
             # Do not check pieces that are already taken
-            if (self.my_squares[piece_id] == EMPTY_2).all():
+            if self.my_squares[piece_id][0] == -1:
                 continue
 
             # Coordinates of the piece being examined
-            start_row = self.my_squares[piece_id][0]
-            start_col = self.my_squares[piece_id][1]
-            start = np.array([start_row, start_col])
+            start_row = int(self.my_squares[piece_id][0])
+            start_col = int(self.my_squares[piece_id][1])
+            start = (start_row, start_col)
 
-            tup = self.board[start_row, start_col]
-            piece = tup[2]
+            piece = self.board[start_row, start_col][2]
 
             # If the piece is a Rook or a Queen
             if piece == 0 or piece == 3:
@@ -335,26 +542,13 @@ class Node:
 
                     # Account for all available moves
                     while row in range(0, 8) and col in range(0, 8):
-                        end = np.array([row, col])
-                        move = np.array([start, end])
-
-                        # If the square is empty
-                        if (self.board[row, col] == EMPTY_3).all():
-                            node = self.node_do_move(move)
-
-                            if not node.is_checked(opp):
-                                available_nodes.append(node)
-
-                        # If the square is occupied
-                        else:
-                            # If the square is takeable
-                            if self.board[row, col][0] != self.side and\
-                                    self.board[row, col][2] != 4:
-                                node = self.node_do_move(move)
+                        move = self.square_move(start, row, col)
 
-                                if not node.is_checked(opp):
-                                    available_nodes.append(node)
+                        if move is not None:
+                            moves.append(move)
 
+                        # Stop at the first occupied square
+                        if self.board[row, col][0] != -1:
                             break
 
                         row += row_change
@@ -375,23 +569,10 @@ class Node:
                     col = start_col + col_change
 
                     if row in range(0, 8) and col in range(0, 8):
-                        end = np.array([row, col])
-                        move = np.array([start, end])
-
-                        # If the square is empty
-                        if (self.board[row, col] == EMPTY_3).all():
-                            node = self.node_do_move(move)
-
-                            if not node.is_checked(opp):
-                                available_nodes.append(node)
-
-                        # If the square is occupied and takeable
-                        elif self.board[row, col][0] != self.side and \
-                                self.board[row, col][2] != 4:
-                            node = self.node_do_move(move)
+                        move = self.square_move(start, row, col)
 
-                            if not node.is_checked(opp):
-                                available_nodes.append(node)
+                        if move is not None:
+                            moves.append(move)
 
                     row_change, col_change = col_change, row_change
                     col_change *= -1
@@ -410,23 +591,10 @@ class Node:
                     col = start_col + col_change
 
                     if row in range(0, 8) and col in range(0, 8):
-                        end = np.array([row, col])
-                        move = np.array([start, end])
-
-                        # If the square is empty
-                        if (self.board[row, col] == EMPTY_3).all():
-                            node = self.node_do_move(move)
-
-                            if not node.is_checked(opp):
-                                available_nodes.append(node)
-
-                        # If the square is occupied and takeable
-                        elif self.board[row, col][0] != self.side and\
-                                self.board[row, col][2] != 4:
-                            node = self.node_do_move(move)
+                        move = self.square_move(start, row, col)
 
-                            if not node.is_checked(opp):
-                                available_nodes.append(node)
+                        if move is not None:
+                            moves.append(move)
 
                     row_change, col_change = col_change, row_change
                     col_change *= -1
@@ -437,13 +605,14 @@ class Node:
 
                 # Represent castling
                 if not self.my_moved[4] and not self.is_checked(self.side):
-                    clear = np.array([True, True])  # Whether a castle on
-                    # the left/right side is available
                     condition = np.array([not self.my_moved[0],\
                         not self.my_moved[7]])  # The initial condition for
                         # castle-ability on either side
+                    clear = np.array(condition)  # Whether a castle on
+                    # the left/right side is available
                     distance = np.array([-2, 2])  # The space that the King
                     # moves for a castle on the left/right side
+                    flags = np.array([QUEEN_CASTLE, KING_CASTLE])
                     start_index = np.array([2, 5])  # The column to start
                     # looking at when looking for a castle on the left/right
                     end_index = np.array([4, 7]) # The column to stop looking
@@ -457,8 +626,8 @@ class Node:
                                 # square on a left castle where one of the
                                 # squares between the Rook and King is allowed
                                 # to be checked
-                                if rook == 0 and (self.board[start_row, 1] !=\
-                                        EMPTY_3).all():
+                                if rook == 0 and self.board[start_row, 1][0]\
+                                        != -1:
                                     clear[rook] = False
 
                                     break
@@ -466,22 +635,18 @@ class Node:
                                 # If there is a piece in the way, or if a
                                 # square in between is checked, the castle
                                 # is not valid
-                                if (self.board[start_row, check] !=\
-                                        EMPTY_3).all() or self.is_attacked\
-                                        ([start_row, check], self.side):
+                                if self.board[start_row, check][0] != -1 or\
+                                        self.is_attacked([start_row, check],\
+                                        self.side):
                                     clear[rook] = False
 
                                     break
 
-                        # If the castle is valid, add it to available nodes
+                        # If the castle is valid, add it to the moves
                         if clear[rook]:
-                            end = np.array([start_row, start_col +\
-                                distance[rook]])
-                            move = np.array([start, end])
-
-                            node = self.node_do_move(move)
-
-                            available_nodes.append(node)
+                            moves.append(encode_move(start_row, start_col,\
+                                start_row, start_col + int(distance[rook]),\
+                                int(flags[rook])))
 
             # If the piece is a Pawn
             elif piece == 5:
@@ -492,63 +657,51 @@ class Node:
                 # The initial row for pawns on White side is 1; 6 on Black
                 initial_row = 1 if self.side == 0 else 6
 
+                # Whether a move up reaches the end of the board, where it
+                # becomes a Pawn promotion (one move per promotion choice)
+                promotes = start_row + one_up == 7 or start_row + one_up == 0
+
                 # A pawn can move up if no piece is in front of it
-                if (self.board[start_row + one_up, start_col] == EMPTY_3)\
-                        .all():
-                    end = np.array([start_row + one_up, start_col])
-                    move = np.array([start, end])
-
-                    # If a pawn is at either end of the board, do a Pawn
-                    # promotion
-                    if start_row + one_up == 7 or start_row + one_up == 0:
-                        available_nodes += self.pawn_promotion(move)
+                if self.board[start_row + one_up, start_col][0] == -1:
+                    if promotes:
+                        for choice in range(4):
+                            moves.append(encode_move(start_row, start_col,\
+                                start_row + one_up, start_col, PROMOTION |\
+                                choice))
                     else:
-                        node = self.node_do_move(move)
-
-                        if not node.is_checked(opp):
-                            available_nodes.append(node)
+                        moves.append(encode_move(start_row, start_col,\
+                            start_row + one_up, start_col))
 
                     # If a pawn is in its starting row, a two-up move is
                     # available as well
-                    if start_row == initial_row and (self.board[start_row\
-                            + (2 * one_up), start_col] == EMPTY_3).all():
-                        end = np.array([start_row + (2 * one_up), start_col])
-                        move = np.array([start, end])
-                        
-                        node = self.node_do_move(move)
-
-                        if not node.is_checked(opp):
-                            available_nodes.append(node)
-
-                # A pawn can take on either diagonal
-                condition = np.array([start_col > 0, start_col < 7])
-                col_change = np.array([-1, 1])
+                    if start_row == initial_row and self.board[start_row +\
+                            (2 * one_up), start_col][0] == -1:
+                        moves.append(encode_move(start_row, start_col,\
+                            start_row + (2 * one_up), start_col,\
+                            DOUBLE_PUSH))
 
                 # If the pawn can take a piece on left, right diagonal
-                for diag in range(2):
-                    if condition[diag]:
-                        end = np.array([start_row + one_up, start_col +\
-                            col_change[diag]])
-                        move = np.array([start, end])
-
-                        # If a pawn is in its starting row, a two-up move is
-                        # available as well
-                        if start_row + one_up == 7 or start_row + one_up == 0:
-                            available_nodes += self.pawn_promotion(move)
+                for col in (start_col - 1, start_col + 1):
+                    if col not in range(0, 8):
+                        continue
+
+                    take_square = self.board[start_row + one_up, col]
+
+                    if take_square[0] != -1 and take_square[0] != self.side\
+                            and take_square[2] != 4:
+                        # A take onto the last row is also a promotion
+                        if promotes:
+                            for choice in range(4):
+                                moves.append(encode_move(start_row,\
+                                    start_col, start_row + one_up, col,\
+                                    PROMOTION_CAPTURE | choice))
                         else:
-                            take_square = self.board[start_row + one_up,\
-                                start_col + col_change[diag]]
-
-                            if (take_square != EMPTY_3).all() and\
-                                    take_square[0] != self.side and\
-                                    take_square[2] != 4 or (np.array([\
-                                    start_row + one_up, start_col +\
-                                    col_change[diag]]) == self.en_passant)\
-                                    .all():
-                                node = self.node_do_move(move)
-
-                                if not node.is_checked(opp):
-                                    available_nodes.append(node)
+                            moves.append(encode_move(start_row, start_col,\
+                                start_row + one_up, col, CAPTURE))
+                    elif start_row + one_up == self.en_passant[0] and col ==\
+                            self.en_passant[1]:
+                        moves.append(encode_move(start_row, start_col,\
+                            start_row + one_up, col, EN_PASSANT))
 
             # If the piece is a Bishop or Queen
             if piece == 2 or piece == 3:
@@ -561,26 +714,13 @@ class Node:
                     col = start_col + col_change
 
                     while row in range(0, 8) and col in range(0, 8):
-                        end = np.array([row, col])
-                        move = np.array([start, end])
-                        
-                        # If the square is empty
-                        if (self.board[row, col] == EMPTY_3).all():
-                            node = self.node_do_move(move)
+                        move = self.square_move(start, row, col)
 
-                            if not node.is_checked(opp):
-                                available_nodes.append(node)
-
-                        # If the square is occupied
-                        else:
-                            # If the square is takeable
-                            if self.board[row, col][0] != self.side and\
-                                    self.board[row, col][2] != 4:
-                                node = self.node_do_move(move)
-
-                                if not node.is_checked(opp):
-                                    available_nodes.append(node)
+                        if move is not None:
+                            moves.append(move)
 
+                        # Stop at the first occupied square
+                        if self.board[row, col][0] != -1:
                             break
 
                         row += row_change
@@ -589,39 +729,116 @@ class Node:
                     row_change, col_change = col_change, row_change
                     col_change *= -1
 
-        # Update on Heuristic Part 1: If someone is checkmated
+        return moves
+
+    # Returns the set of moves that do not leave one's own King checked,
+    # worked out once per position (expand() fills it in as well)
+    # Also updates game status if checkmate/draw
+    # Instead of making a child Node for every move, each move is played on
+    # a scratch copy of the board and then taken back, and only the King's
+    # square is checked for attackers
+    def legal_moves(self):
+        if self.legal is not None:
+            return self.legal
+
+        board = self.board.copy()
+        opp = 1 if self.side == 0 else 0
+        king = (int(self.my_squares[4][0]), int(self.my_squares[4][1]))
+        legal = set()
+
+        for move in self.generate_moves():
+            start = (move >> 9 & 7, move >> 6 & 7)
+            end = (move >> 3 & 7, move & 7)
+
+            # The taken Pawn of an en passant is next to the start square
+            taken = (start[0], end[1]) if move_flags(move) == EN_PASSANT else\
+                end
+
+            start_tup = board[start].copy()
+            end_tup = board[end].copy()
+            taken_tup = board[taken].copy()
+
+            board[taken] = EMPTY_3
+            board[end] = start_tup
+            board[start] = EMPTY_3
+
+            # (A castling Rook is left where it is: castling is only
+            # generated when the King's squares are not attacked anyway)
+            if self.least_attacker(end if start == king else king, opp,\
+                    board=board) is None:
+                legal.add(move)
+
+            board[taken] = taken_tup
+            board[end] = end_tup
+            board[start] = start_tup
+
+        self.legal = legal
+
+        if len(legal) == 0:
+            self.end_game()
+
+        return legal
+
+    # Returns an array of available nodes/ only add valid nodes
+    # Also updates game status if checkmate/draw
+    def expand(self):
+        available_nodes = []
+
+        for move in self.generate_moves():
+            node = self.node_do_move(move)
+
+            # Only keep moves that do not leave one's own King checked
+            if not node.is_checked(self.side):
+                available_nodes.append(node)
+
+        self.legal = set(node.move for node in available_nodes)
+
         if len(available_nodes) == 0:
+            self.end_game()
+
+        return available_nodes
+
+    # Sets the outcome of a position with no legal moves
+    def end_game(self):
+        # Update on Heuristic Part 1: If someone is checkmated
+        # (only once, in case the node is expanded again)
+        if self.outcome == "Ongoing":
+            self.evaluate()
+
             # If there are no available nodes and checked, checkmate
             if self.is_checked(self.side):
                 self.outcome = "Checkmate"
 
-                self.h_value += HEUR_P1_ADD if self.side != self.player \
-                    else -1 * HEUR_P1_ADD
+                self.h_value += self.weights.checkmate if self.side !=\
+                    self.player else -1 * self.weights.checkmate
             # But if you aren't checked, it's just a draw
             else:
                 self.outcome = "Draw"
 
-                self.h_value = int(self.h_value // HEUR_P1_DIVIDE)
-
-        return available_nodes
+                self.h_value = self.h_value // self.weights.draw_divide
 
     # Returns a node corresponding to a new (valid) move
     # Also updates the h-value and targeting matrices for the child
+    # move = move encoded as in moves.py
     def node_do_move(self, move):
         new_board = deepcopy(self.board)
         opp = 1 if self.side == 0 else 0
         additive = 1 if self.side == self.player else -1
 
+        flags = move_flags(move)
+
         # Coordinates of piece that is about to move
-        start_row = move[0, 0]
-        start_col = move[0, 1]
+        start_row = move >> 9 & 7
+        start_col = move >> 6 & 7
+        start = (start_row, start_col)
         start_tup = new_board[start_row, start_col]
         start_id = start_tup[1]
         start_piece = start_tup[2]
 
         # Coordinates of square the piece is moving to
-        end_row = move[1, 0]
-        end_col = move[1, 1]
+        end_row = move >> 3 & 7
+        end_col = move & 7
+        end = (end_row, end_col)
         end_tup = new_board[end_row, end_col]
 
         # Variables of the node to be returned
@@ -634,110 +851,200 @@ class Node:
         new_opp_moved = deepcopy(self.opp_moved)
         new_opp_targeted = deepcopy(self.opp_targeted)
 
+        # Update the hash for the side to move, the en passant square and the
+        # piece leaving its square
+        new_hash = self.hash ^ SIDE_KEY ^ PIECE_KEYS[self.side][start_piece]\
+            [start_row * 8 + start_col]
+
+        if self.en_passant[0] != -1:
+            new_hash ^= EN_PASSANT_KEYS[self.en_passant[1]]
+
+        new_pawn_hash = self.pawn_hash
+
+        if start_piece == 5:
+            new_pawn_hash ^= PIECE_KEYS[self.side][5][start_row * 8 +\
+                start_col]
+
+        # The piece-square table scores (Heuristic Part 8) change by the
+        # squares that are emptied and filled, like the hash
+        new_mg_score = self.mg_score - MG_VALUES[self.side][start_piece]\
+            [start_row * 8 + start_col]
+        new_eg_score = self.eg_score - EG_VALUES[self.side][start_piece]\
+            [start_row * 8 + start_col]
+        new_phase = self.phase
+
+        # "Reset" Heuristic Part 3 and 7 values (if they were added) in order
+        # to leave them out of the child's value until it is evaluated
         new_h_value = self.h_value
-        # "Reset" Heuristic Part 4 values in order to update them
-        new_h_value += additive * self.num_attacked(new_my_squares,\
-            new_opp_targeted)
-        new_h_value -= additive * self.num_attacked(new_opp_squares,\
-            new_my_targeted)
-
-        # Move piece from its original position
-        self.alter_targeted(self.side, move[0], new_my_targeted, new_board, 0)
-        self.alter_targeted(opp, move[0], new_opp_targeted, new_board, 0)
-        self.update_targeted(move[0], new_my_targeted, new_board, 1)
-
-        # Update both targeted matrices for when piece is moved
-        if (end_tup == EMPTY_3).all():
-            self.alter_targeted(self.side, move[1], new_my_targeted,\
-                new_board, 1)
-            self.alter_targeted(opp, move[1], new_opp_targeted, new_board, 1)
+
+        if not self.pending:
+            new_h_value -= self.attack_value() + self.pawn_value()
+
+        # Take the piece off its original position (the targeted matrices
+        # are kept in step with every change to the board)
+        self.update_targeted(start, new_my_targeted, new_board, 1)
+
+        new_board[start_row, start_col] = np.array(EMPTY_3)
+
+        self.alter_targeted(self.side, start, new_my_targeted, new_board, 0)
+        self.alter_targeted(opp, start, new_opp_targeted, new_board, 0)
+
+        # Whether the piece lands on an empty square
+        lands_empty = end_tup[0] == -1
 
         # If an enemy piece was taken
-        if (end_tup != EMPTY_3).all():
+        if flags & CAPTURE and flags != EN_PASSANT:
             end_id = end_tup[1]
             end_piece = end_tup[2]
 
             # Update on Heuristic Part 2: Piece point total
-            new_h_value += additive * POINTS[end_piece]
+            new_h_value += additive * self.weights.points[end_piece]
 
             # Remove the enemy piece from targeted
-            self.update_targeted(move[1], new_opp_targeted, new_board, 1)
+            self.update_targeted(end, new_opp_targeted, new_board, 1)
 
             # Update opp variables
+            new_hash ^= PIECE_KEYS[opp][end_piece][end_row * 8 + end_col]
+
+            if end_piece == 5:
+                new_pawn_hash ^= PIECE_KEYS[opp][5][end_row * 8 + end_col]
+
+            new_mg_score -= MG_VALUES[opp][end_piece][end_row * 8 + end_col]
+            new_eg_score -= EG_VALUES[opp][end_piece][end_row * 8 + end_col]
+            new_phase -= PHASE_WEIGHTS[end_piece]
+
+            if not new_opp_moved[end_id]:
+                new_hash ^= MOVED_KEYS[opp][end_id]
+
             new_opp_squares[end_id] = np.array([-1, -1])
             new_opp_moved[end_id] = True
 
             # Remove the enemy piece from the board
             new_board[end_row, end_col] = np.array(EMPTY_3)
         # Account for en passant
-        elif (start_piece == 5 and move[1] == self.en_passant).all():
+        elif flags == EN_PASSANT:
             one_down = -1 if self.side == 0 else 1
+            take_square = np.array([end_row + one_down, end_col])
 
             end_tup = new_board[end_row + one_down, end_col]
             end_id = end_tup[1]
             end_piece = end_tup[2]
 
             # Update on Heuristic Part 2: Piece point total
-            new_h_value += additive * POINTS[end_piece]
+            new_h_value += additive * self.weights.points[end_piece]
+
+            # Remove the taken Pawn from targeted and from the board
+            self.update_targeted(take_square, new_opp_targeted, new_board, 1)
+
+            new_board[end_row + one_down, end_col] = np.array(EMPTY_3)
+
+            self.alter_targeted(self.side, take_square, new_my_targeted,\
+                new_board, 0)
+            self.alter_targeted(opp, take_square, new_opp_targeted,\
+                new_board, 0)
 
             # Update opp variables
+            new_hash ^= PIECE_KEYS[opp][end_piece][take_square[0] * 8 +\
+                take_square[1]]
+            new_pawn_hash ^= PIECE_KEYS[opp][5][take_square[0] * 8 +\
+                take_square[1]]
+            new_mg_score -= MG_VALUES[opp][5][take_square[0] * 8 +\
+                take_square[1]]
+            new_eg_score -= EG_VALUES[opp][5][take_square[0] * 8 +\
+                take_square[1]]
+
+            if not new_opp_moved[end_id]:
+                new_hash ^= MOVED_KEYS[opp][end_id]
+
             new_opp_squares[end_id] = np.array([-1, -1])
             new_opp_moved[end_id] = True
 
         # Account for castle
-        elif start_piece == 4 and abs(start_col - end_col) == 2:
-            # Left-side castle
-            if end_col == 2:
-                # Move the Rook too
-                new_board[start_row, 0] = np.array(EMPTY_3)
-                new_board[start_row, 3] = np.array([self.side, 0, 0])
-
-                new_my_squares[0] = np.array([start_row, 3])
-                new_my_moved[0] = True
-            # Right-side castle
-            else:
-                # Move the Rook too
-                new_board[start_row, 7] = np.array(EMPTY_3)
-                new_board[start_row, 5] = np.array([self.side, 7, 0])
+        elif flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            # Move the Rook too (ID 0 on the left side, 7 on the right)
+            rook_id = 0 if flags == QUEEN_CASTLE else 7
+            rook_start = (start_row, rook_id)
+            rook_end = (start_row, 3 if flags == QUEEN_CASTLE else 5)
 
-                new_my_squares[7] = np.array([start_row, 3])
-                new_my_moved[7] = True
+            self.update_targeted(rook_start, new_my_targeted, new_board, 1)
+
+            new_board[rook_start] = np.array(EMPTY_3)
+
+            self.alter_targeted(self.side, rook_start, new_my_targeted,\
+                new_board, 0)
+            self.alter_targeted(opp, rook_start, new_opp_targeted,\
+                new_board, 0)
+
+            new_board[rook_end] = np.array([self.side, rook_id, 0])
+
+            self.alter_targeted(self.side, rook_end, new_my_targeted,\
+                new_board, 1)
+            self.alter_targeted(opp, rook_end, new_opp_targeted, new_board,\
+                1)
+            self.update_targeted(rook_end, new_my_targeted, new_board, 0)
+
+            new_hash ^= PIECE_KEYS[self.side][0][start_row * 8 + rook_id] ^\
+                PIECE_KEYS[self.side][0][start_row * 8 + rook_end[1]] ^\
+                MOVED_KEYS[self.side][rook_id]
+            new_mg_score += MG_VALUES[self.side][0][start_row * 8 +\
+                rook_end[1]] - MG_VALUES[self.side][0][start_row * 8 + rook_id]
+            new_eg_score += EG_VALUES[self.side][0][start_row * 8 +\
+                rook_end[1]] - EG_VALUES[self.side][0][start_row * 8 + rook_id]
+
+            new_my_squares[rook_id] = np.array(rook_end)
+            new_my_moved[rook_id] = True
 
             # Update on Heuristic Part 6: If someone castles
-            new_h_value += additive * HEUR_P6_ADD
+            new_h_value += additive * self.weights.castle
 
         # Open en passant for opponent after Pawn double-up
-        elif start_piece == 5 and abs(start_row - end_row) == 2:
-            one_down = -1 if self.side == 0 else 1
+        elif flags == DOUBLE_PUSH:
+            one_up = 1 if self.side == 0 else -1
+
+            # The square that was skipped over
+            new_en_passant = np.array([start_row + one_up, start_col])
+            new_hash ^= EN_PASSANT_KEYS[start_col]
 
-            new_en_passant = np.array([start_row + one_down, start_col])
+        # Put the piece on its new square (a promoted Pawn arrives as its new
+        # piece)
+        end_piece = flags & 3 if flags & PROMOTION else start_piece
 
-        # Swap the starting and ending squares (in order to move piece to the
-        # new square and empty the old square)
-        new_board[end_row, end_col] = new_board[start_row, start_col]
-        new_board[start_row, start_col] = np.array([-1, -1, -1])
+        new_board[end_row, end_col] = np.array([self.side, start_id,\
+            end_piece])
+
+        # A piece landing on an empty square blocks the lines through it
+        if lands_empty:
+            self.alter_targeted(self.side, end, new_my_targeted, new_board, 1)
+            self.alter_targeted(opp, end, new_opp_targeted, new_board, 1)
 
         # Add the just-moved piece to targeted
-        self.update_targeted(move[1], new_my_targeted, new_board, 0)
+        self.update_targeted(end, new_my_targeted, new_board, 0)
 
         # Update my_moved
         new_my_squares[start_id] = np.array([end_row, end_col])
+        new_hash ^= PIECE_KEYS[self.side][end_piece][end_row * 8 + end_col]
+
+        if end_piece == 5:
+            new_pawn_hash ^= PIECE_KEYS[self.side][5][end_row * 8 + end_col]
 
-        # Update on Heuristic Part 3: How many times one's pieces are attacked
-        new_h_value -= additive * self.num_attacked(new_my_squares,\
-            new_opp_targeted)
-        new_h_value += additive * self.num_attacked(new_opp_squares,\
-            new_my_targeted)
+        new_mg_score += MG_VALUES[self.side][end_piece][end_row * 8 + end_col]
+        new_eg_score += EG_VALUES[self.side][end_piece][end_row * 8 + end_col]
+
+        # A promoted Pawn adds its new piece to the phase
+        if flags & PROMOTION:
+            new_phase += PHASE_WEIGHTS[end_piece]
 
         # Update on Heuristic Part 4: If a piece is moved from its starting
         # position
         if not new_my_moved[start_id]:
-            new_h_value += additive * HEUR_P4_POINTS[start_piece]
+            new_h_value += additive * self.weights.moved_points\
+                [start_piece]
 
             new_my_moved[start_id] = True
+            new_hash ^= MOVED_KEYS[self.side][start_id]
 
         # Prepare the node to be returned (swap [my <-> opp])
-        ret_node = Node(new_board, opp, self.player)
+        ret_node = Node(new_board, opp, self.player, self.weights)
 
         ret_node.my_squares = new_opp_squares
         ret_node.my_moved = new_opp_moved
@@ -751,125 +1058,83 @@ class Node:
         # Update on Heuristic Part 5: If opp is Checked
         # If enemy king is checked, heuristic++
         if ret_node.is_checked(opp):
-            new_h_value += additive * HEUR_P5_ADD
+            new_h_value += additive * self.weights.check
 
-        ret_node.h_value = new_h_value
         ret_node.move = move
+        ret_node.hash = new_hash
+        ret_node.pawn_hash = new_pawn_hash
+        ret_node.mg_score = new_mg_score
+        ret_node.eg_score = new_eg_score
+        ret_node.phase = new_phase
+
+        # Update on Heuristic Part 8: The piece-square tables (the blend
+        # changes with the phase, so the whole term is swapped)
+        new_h_value += ret_node.psqt_value() - self.psqt_value()
+
+        # Most moves leave the Pawns where they are
+        if new_pawn_hash == self.pawn_hash:
+            ret_node.pawns = self.pawns
+
+        # Heuristic Parts 3 (how many times one's pieces are attacked) and 7
+        # (Pawn structure) are added by evaluate()
+        ret_node.h_value = new_h_value
+        ret_node.pending = True
 
         return ret_node
 
-    # Returns all nodes corresponding a pawn promotion (Pawn ->
-    # Rook/Knight/Bishop/Queen)
-    def pawn_promotion(self, move):
-        nodes = []
-
-        new_board = deepcopy(self.board)
-        opp = 1 if self.side == 0 else 0
-        additive = 1 if self.side == self.player else -1
-
-        # Coordinates of piece that is about to move
-        start_row = move[0, 0]
-        start_col = move[0, 1]
-        start_tup = new_board[start_row, start_col]
-        start_id = start_tup[1]
-        start_piece = start_tup[2]
-
-        # Coordinates of square the piece is moving to
-        end_row = move[1, 0]
-        end_col = move[1, 1]
-        end_tup = new_board[end_row, end_col]
-
-        # Variables of the node to be returned
-        new_my_squares = deepcopy(self.my_squares)
-        new_my_moved = deepcopy(self.my_moved)
-        new_my_targeted = deepcopy(self.my_targeted)
-
-        new_opp_squares = deepcopy(self.opp_squares)
-        new_opp_moved = deepcopy(self.opp_moved)
-        new_opp_targeted = deepcopy(self.opp_targeted)
-
-        new_h_value = self.h_value
-        # "Reset" Heuristic Part 4 values in order to update them
-        new_h_value += additive * self.num_attacked(new_my_squares,\
-            new_opp_targeted)
-        new_h_value -= additive * self.num_attacked(new_opp_squares,\
-            new_my_targeted)
-
-        # Move piece from its original position
-        self.alter_targeted(self.side, move[0], new_my_targeted, new_board, 0)
-        self.alter_targeted(opp, move[0], new_opp_targeted, new_board, 0)
-        self.update_targeted(move[0], new_my_targeted, new_board, 1)
-
-        # Update both targeted matrices for when piece is moved
-        if (end_tup == EMPTY_3).all():
-            self.alter_targeted(self.side, move[1], new_my_targeted,\
-                new_board, 1)
-            self.alter_targeted(opp, move[1], new_opp_targeted, new_board, 1)
-
-        # If an enemy piece was taken
-        if (end_tup != EMPTY_3).all():
-            end_id = end_tup[1]
-            end_piece = end_tup[2]
-
-            # Update on Heuristic Part 2: Piece point total
-            new_h_value += additive * POINTS[end_piece]
-
-            # Remove the enemy piece from targeted
-            self.update_targeted(move[1], new_opp_targeted, new_board, 1)
-
-            # Update opp variables
-            new_opp_squares[end_id] = np.array([-1, -1])
-            new_opp_moved[end_id] = True
-
-            # Remove the enemy piece from the board
-            new_board[end_row, end_col] = np.array(EMPTY_3)
 
-        # Swap the starting and ending squares (in order to move piece to the
-        # new square and empty the old square)
-        new_board[end_row, end_col] = new_board[start_row, start_col]
-        new_board[start_row, start_col] = np.array([-1, -1, -1])
-
-        # Update my_moved
-        new_my_squares[start_id] = np.array([end_row, end_col])
+# Evaluates many nodes at once (see Node.evaluate()): the attack counts and
+# Pawn structures of the pending nodes that are not in the caches are
+# counted for all of them together on their stacked boards
+# Returns the nodes' h_values as an array
+def evaluate_nodes(nodes):
+    pending = [node for node in nodes if node.pending]
 
-        # Cover all possible pawn promotion choices
-        choices = np.array(list(range(4)))
+    for node in pending:
+        if node.attacked is None:
+            node.attacked = EVAL_CACHE.probe(node.hash)
 
-        for choice in choices:
-            newest_board = deepcopy(new_board)
-            newest_board[end_row, end_col][2] = choices[choice]
+        if node.pawns is None:
+            node.pawns = PAWN_TABLE.probe(node.pawn_hash)
 
-            newest_my_targeted = deepcopy(new_my_targeted)
+    uncounted = [node for node in pending if node.attacked is None]
 
-            newest_h_value = new_h_value
+    if len(uncounted) > 0:
+        sides = np.stack([node.board[:, :, 0] for node in uncounted])
+        by_white = np.stack([node.my_targeted if node.side == 0 else
+            node.opp_targeted for node in uncounted])
+        by_black = np.stack([node.opp_targeted if node.side == 0 else
+            node.my_targeted for node in uncounted])
 
-            self.update_targeted(move[1], newest_my_targeted, newest_board, 0)
+        # Each side's pieces are attacked as often as the other side targets
+        # their squares
+        white = (by_black * (sides == 0)).sum(axis=(1, 2))
+        black = (by_white * (sides == 1)).sum(axis=(1, 2))
 
-            # Update on Heuristic Part 3: How many times one's pieces are attacked
-            newest_h_value -= additive * self.num_attacked(new_my_squares,\
-                new_opp_targeted)
-            newest_h_value += additive * self.num_attacked(new_opp_squares,\
-                newest_my_targeted)
+        for node, white_attacked, black_attacked in zip(uncounted, white,
+                black):
+            node.attacked = (int(white_attacked), int(black_attacked))
+            EVAL_CACHE.store(node.hash, node.attacked[0], node.attacked[1])
 
-            # Prepare the node to be returned (swap [my <-> opp])
-            node = Node(newest_board, opp, self.player)
+    # Positions with the same Pawns are only counted once
+    layouts = {}
 
-            node.my_squares = deepcopy(new_opp_squares)
-            node.my_moved = deepcopy(new_opp_moved)
-            node.my_targeted = deepcopy(new_opp_targeted)
+    for node in pending:
+        if node.pawns is None:
+            layouts.setdefault(node.pawn_hash, []).append(node)
 
-            node.opp_squares = deepcopy(new_my_squares)
-            node.opp_moved = deepcopy(new_my_moved)
-            node.opp_targeted = newest_my_targeted
+    if len(layouts) > 0:
+        structures = pawn_structures(np.stack([same[0].board for same in
+            layouts.values()]))
 
-            # Update on Heuristic Part 5: If opp is Checked
-            # If enemy king is checked, heuristic++
-            if node.is_checked(opp):
-                newest_h_value += additive * HEUR_P5_ADD
+        for (key, same), structure in zip(layouts.items(), structures):
+            PAWN_TABLE.store(key, structure)
 
-            node.h_value = newest_h_value
-            node.move = move
+            for node in same:
+                node.pawns = structure
 
-            nodes.append(node)
+    for node in pending:
+        node.h_value += node.attack_value() + node.pawn_value()
+        node.pending = False
 
-        return nodes
+    return np.array([node.h_value for node in nodes], dtype=float)
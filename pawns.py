@@ -0,0 +1,206 @@
+"""
+Pawn Structure for Chess Bot
+Pawn structure terms only depend on where the Pawns are, and Pawns move
+rarely, so they are counted once per Pawn layout and kept in a Pawn hash
+table keyed by node.pawn_hash (see zobrist.hash_pawns())
+"""
+
+import numpy as np
+
+PAWN_TABLE_SIZE = 2 ** 14  # Number of entries in the shared Pawn table
+
+MASK_30 = (1 << 30) - 1
+MASK_64 = (1 << 64) - 1
+VALID_BIT = 1 << 63  # Set in every stored entry, so 0 marks an empty one
+
+# Names of the counts returned by pawn_terms(), in order, and whether each
+# one gains (1) or loses (-1) points
+PAWN_TERMS = ["passed", "doubled", "isolated", "backward", "shield"]
+PAWN_SIGNS = np.array([1, -1, -1, -1, 1])
+
+
+# Returns the Pawn structures of one side on many boards at once, as
+# [passed, doubled, isolated, backward, shield] arrays with a first axis of
+# boards; shield has 8 counts per board: the number of files next to (and
+# on) each column that have one of the side's Pawns one or two rows in
+# front of a King on that column of its first row
+# own = Nx8x8 boolean array of the side's Pawns, enemy = the same for the
+# other side; both are flipped so that the side moves up (row + 1)
+def side_structures(own, enemy):
+    count = len(own)
+    rows = np.arange(8).reshape(1, 8, 1)
+    files = own.sum(axis=1)  # Number of own Pawns on each column
+
+    # Own Pawns on the columns next to each column
+    neighbors = np.zeros((count, 8), dtype=int)
+    neighbors[:, 1:] += files[:, :-1]
+    neighbors[:, :-1] += files[:, 1:]
+
+    doubled = np.maximum(files - 1, 0).sum(axis=1)
+    isolated = (files * (neighbors == 0)).sum(axis=1)
+
+    # Lowest and highest own Pawn on each column (8 and -1 if none), and
+    # highest enemy Pawn on each column and the columns next to it
+    own_low = np.where(own, rows, 8).min(axis=1)
+    own_high = np.where(own, rows, -1).max(axis=1)
+    high = np.where(enemy, rows, -1).max(axis=1)
+    enemy_high = high.copy()
+    enemy_high[:, 1:] = np.maximum(enemy_high[:, 1:], high[:, :-1])
+    enemy_high[:, :-1] = np.maximum(enemy_high[:, :-1], high[:, 1:])
+
+    # No enemy Pawn in front of it on its own or the next columns (only the
+    # front Pawn of a doubled pair counts)
+    passed = (own & (rows == own_high[:, None]) & (enemy_high[:, None] <=
+        rows)).sum(axis=(1, 2))
+
+    # Squares attacked by enemy Pawns (which move down), seen from the
+    # square behind them
+    attacked = np.zeros(own.shape, dtype=bool)
+    attacked[:, :-1, 1:] |= enemy[:, 1:, :-1]
+    attacked[:, :-1, :-1] |= enemy[:, 1:, 1:]
+    front_attacked = np.zeros(own.shape, dtype=bool)
+    front_attacked[:, :-1] = attacked[:, 1:]
+
+    # Lowest own Pawn on the column to the left and to the right (8 off the
+    # board)
+    left_low = np.full((count, 8), 8)
+    left_low[:, 1:] = own_low[:, :-1]
+    right_low = np.full((count, 8), 8)
+    right_low[:, :-1] = own_low[:, 1:]
+
+    # Not isolated, but every own Pawn next to it is further up (so none can
+    # ever defend it), and an enemy Pawn attacks the square in front of it
+    backward = (own & (neighbors[:, None] > 0) & (left_low[:, None] > rows) &
+        (right_low[:, None] > rows) & front_attacked).sum(axis=(1, 2))
+
+    # Pawn shield for a King on each column of the first row
+    cover = np.zeros((count, 10), dtype=int)
+    cover[:, 1:9] = own[:, 1:3].any(axis=1)
+    shield = cover[:, :-2] + cover[:, 1:-1] + cover[:, 2:]
+
+    return [passed, doubled, isolated, backward, shield]
+
+
+# Returns the [White, Black] Pawn structures of many boards (stacked as an
+# Nx8x8x3 array), one [White, Black] pair per board
+def pawn_structures(boards):
+    pawns = boards[:, :, :, 2] == 5
+    white = pawns & (boards[:, :, :, 0] == 0)
+    black = pawns & (boards[:, :, :, 0] == 1)
+
+    # Black's rows are flipped so that it also moves up
+    sides = [side_structures(white, black), side_structures(black[:, ::-1],
+        white[:, ::-1])]
+
+    return [[[int(term[index]) for term in side[:4]] + [side[4][index]] for
+        side in sides] for index in range(len(boards))]
+
+
+# Returns [White, Black] Pawn structures (see side_structures()) of a board
+def pawn_structure(board):
+    return pawn_structures(board[None])[0]
+
+
+# Packs a [White, Black] Pawn structure into one word
+#   per side (30 bits, White first): bits 0-3: passed, 4-6: doubled,
+#   7-10: isolated, 11-13: backward, 14-29: shield (2 bits per column)
+#   bit 63: valid
+def pack_structure(structure):
+    data = VALID_BIT
+
+    for side in range(2):
+        passed, doubled, isolated, backward, shield = structure[side]
+        word = passed | doubled << 4 | isolated << 7 | backward << 11
+
+        for col in range(8):
+            word |= int(shield[col]) << (14 + 2 * col)
+
+        data |= word << (30 * side)
+
+    return data
+
+
+# Returns the [White, Black] Pawn structure from a word made by
+# pack_structure
+def unpack_structure(data):
+    structure = []
+
+    for side in range(2):
+        word = data >> (30 * side) & MASK_30
+        shield = np.array([word >> (14 + 2 * col) & 3 for col in range(8)])
+
+        structure.append([word & 15, word >> 4 & 7, word >> 7 & 15,
+            word >> 11 & 7, shield])
+
+    return structure
+
+
+# Returns [White, Black] arrays of the PAWN_TERMS counts for a Pawn
+# structure; the shield only counts for a King on its first row
+# kings = [White, Black] [row, col] of the Kings
+def pawn_terms(structure, kings):
+    terms = np.zeros((2, len(PAWN_TERMS)), dtype=int)
+
+    for side in range(2):
+        passed, doubled, isolated, backward, shield = structure[side]
+        king_row, king_col = kings[side]
+
+        terms[side, :4] = passed, doubled, isolated, backward
+
+        if king_row == (0 if side == 0 else 7):
+            terms[side, 4] = shield[king_col]
+
+    return terms
+
+
+class PawnTable:
+    # size = number of entries, rounded down to a power of two
+    # table = optional existing uint64 array of shape (size, 2) to use as
+    # storage
+    def __init__(self, size=PAWN_TABLE_SIZE, table=None):
+        if table is None:
+            size = 1 << (size.bit_length() - 1)
+            table = np.zeros((size, 2), dtype=np.uint64)
+
+        # Each entry is [pawn hash ^ data, data] (see evalcache.py)
+        self.table = table
+        self.mask = len(table) - 1
+
+        self.hits = 0
+        self.misses = 0
+
+    # Switches to another storage array of the same layout (i.e. one in
+    # shared memory, see sharedtables.py)
+    def use_table(self, table):
+        self.table = table
+        self.mask = len(table) - 1
+
+    def clear(self):
+        self.table[:] = 0
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the [White, Black] Pawn structure stored for the Pawn hash, or
+    # None on a miss
+    def probe(self, key):
+        entry = self.table[key & self.mask]
+        data = int(entry[1])
+
+        if data == 0 or int(entry[0]) ^ data != key & MASK_64:
+            self.misses += 1
+
+            return None
+
+        self.hits += 1
+
+        return unpack_structure(data)
+
+    def store(self, key, structure):
+        index = key & self.mask
+        data = pack_structure(structure)
+
+        self.table[index, 1] = data
+        self.table[index, 0] = (key & MASK_64) ^ data
+
+
+PAWN_TABLE = PawnTable()  # The Pawn table used by every Node in the process
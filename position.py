@@ -0,0 +1,345 @@
+"""
+Position Encoding for Chess Bot
+"""
+
+import struct
+
+import numpy as np
+from moves import parse_square
+from node import Node, EMPTY_2, EMPTY_3
+from psqt import psqt_scores
+from weights import DEFAULT_WEIGHTS
+from zobrist import hash_node, hash_pawns
+
+# Layout of a packed position:
+#   64 bytes for the board (one byte per square, row-major from A1)
+#   2 uint16 bit fields for the moved flags of White/Black
+#   1 byte each for side, player, en passant square and outcome
+#   1 float64 for the heuristic value (fractional, see psqt.py)
+PACKED_FORMAT = "<64sHHBBBBd"
+PACKED_SIZE = struct.calcsize(PACKED_FORMAT)
+
+EMPTY_BYTE = 0xFF  # Byte used for empty squares and "no en passant"
+OUTCOMES = ["Ongoing", "Draw", "Checkmate"]
+
+FEN_PIECES = "rnbqkp"  # FEN letter of each piece, indexed by Piece
+HOME_PIECES = [0, 1, 2, 3, 4, 2, 1, 0]  # Piece starting on each column of
+# the back row
+
+# The starting position as packed by pack_node (with White as the player),
+# so that a new game is unpacked from constant bytes rather than laid out
+# square by square
+START_POSITION = bytes.fromhex("001122334425160758595a5b5c5d5e5f" + "ff" *
+    32 + "d8d9dadbdcdddedf8091a2b3c4a59687" + "000000000000ff00" + "00" * 8)
+# Times each side attacks the squares of its first three rows in the
+# starting position (from its own side; the other rows are not attacked)
+START_TARGETED = [[0, 1, 1, 1, 1, 1, 1, 0], [1, 1, 1, 4, 4, 1, 1, 1],
+    [2, 2, 3, 2, 2, 3, 2, 2]]
+
+START_NODE = None  # Node of the starting position, once unpacked; copied
+# by start_node()
+
+
+# Returns the byte used for a square holding the piece [Side, ID, Piece]
+# Side takes the top bit, Piece the next 3 bits and ID the bottom 4 bits
+def encode_square(tup):
+    if tup[0] == -1:
+        return EMPTY_BYTE
+
+    return (int(tup[0]) << 7) | (int(tup[2]) << 4) | int(tup[1])
+
+
+# Returns the [Side, ID, Piece] array corresponding to a square byte
+def decode_square(byte):
+    if byte == EMPTY_BYTE:
+        return np.array(EMPTY_3)
+
+    return np.array([byte >> 7, byte & 0x0F, (byte >> 4) & 0x07])
+
+
+# Returns the uint16 holding one bit per piece ID for the moved array
+def pack_moved(moved):
+    bits = 0
+
+    for piece_id in range(16):
+        if moved[piece_id]:
+            bits |= 1 << piece_id
+
+    return bits
+
+
+# Inverse of pack_moved
+def unpack_moved(bits):
+    return np.array([bool(bits >> piece_id & 1) for piece_id in range(16)])
+
+
+# Fills in the squares arrays and targeted matrices of a node from its board
+# Used whenever a node is built from scratch instead of by node_do_move
+def fill_from_board(node):
+    squares = board_squares(node.board)
+    targeted = [np.zeros((8, 8), dtype=int) for _ in range(2)]
+
+    for side in range(2):
+        for square in squares[side]:
+            if (square != EMPTY_2).all():
+                node.update_targeted(square, targeted[side], node.board, 0)
+
+    opp = 1 if node.side == 0 else 0
+
+    node.my_squares = squares[node.side]
+    node.opp_squares = squares[opp]
+    node.my_targeted = targeted[node.side]
+    node.opp_targeted = targeted[opp]
+
+
+# Returns the compact byte string describing the node's position
+def pack_node(node):
+    board = bytes(encode_square(node.board[row, col]) for row in range(8)
+        for col in range(8))
+
+    white_moved = node.my_moved if node.side == 0 else node.opp_moved
+    black_moved = node.opp_moved if node.side == 0 else node.my_moved
+
+    if (node.en_passant == EMPTY_2).all():
+        en_passant = EMPTY_BYTE
+    else:
+        en_passant = int(node.en_passant[0]) * 8 + int(node.en_passant[1])
+
+    return struct.pack(PACKED_FORMAT, board, pack_moved(white_moved),
+        pack_moved(black_moved), node.side, node.player, en_passant,
+        OUTCOMES.index(node.outcome), node.evaluate())
+
+
+# Returns just the outcome stored in a byte string made by pack_node
+def unpack_outcome(data):
+    return OUTCOMES[struct.unpack(PACKED_FORMAT, data)[6]]
+
+
+# Returns the 8x8 array of [Side, ID, Piece] entries of the 64 board bytes
+# of a packed position (see encode_square)
+def decode_board(data):
+    codes = np.frombuffer(data, dtype=np.uint8).reshape(8, 8).astype(int)
+    state = np.stack([codes >> 7, codes & 0x0F, (codes >> 4) & 0x07],
+        axis=2)
+    state[codes == EMPTY_BYTE] = EMPTY_3
+
+    return state
+
+
+# Returns the [White, Black] squares arrays of a board (see Node)
+def board_squares(board):
+    squares = [np.array([EMPTY_2 for _ in range(16)]) for _ in range(2)]
+    rows, cols = np.nonzero(board[:, :, 0] != -1)
+
+    for side in range(2):
+        mine = board[rows, cols, 0] == side
+        squares[side][board[rows[mine], cols[mine], 1]] = np.stack([rows[mine],
+            cols[mine]], axis=1)
+
+    return squares
+
+
+# Returns a new node built from a byte string made by pack_node
+# weights = weights used in heuristics (see weights.py)
+def unpack_node(data, weights=DEFAULT_WEIGHTS):
+    board, white_bits, black_bits, side, player, en_passant, outcome,\
+        h_value = struct.unpack(PACKED_FORMAT, data)
+
+    state = decode_board(board)
+
+    node = Node(state, side, player, weights)
+
+    moved = [unpack_moved(white_bits), unpack_moved(black_bits)]
+    node.my_moved = moved[side]
+    node.opp_moved = moved[1 - side]
+
+    if en_passant != EMPTY_BYTE:
+        node.en_passant = np.array([en_passant // 8, en_passant % 8])
+
+    node.outcome = OUTCOMES[outcome]
+    node.h_value = h_value
+
+    fill_from_board(node)
+    node.hash = hash_node(node)
+    node.pawn_hash = hash_pawns(node)
+    node.mg_score, node.eg_score, node.phase = psqt_scores(state)
+
+    return node
+
+
+# Returns a new node of the starting position, White to move
+# player = side the computer plays as
+# weights = weights used in heuristics (see weights.py)
+# The position is unpacked from START_POSITION once per process; every
+# later call only copies its arrays
+def start_node(player, weights=DEFAULT_WEIGHTS):
+    global START_NODE
+
+    if START_NODE is None:
+        board, white_bits, black_bits = struct.unpack(PACKED_FORMAT,
+            START_POSITION)[:3]
+
+        template = Node(decode_board(board), 0, 0)
+        template.my_squares, template.opp_squares = board_squares(
+            template.board)
+        template.my_moved = unpack_moved(white_bits)
+        template.opp_moved = unpack_moved(black_bits)
+
+        targeted = np.zeros((8, 8), dtype=int)
+        targeted[:3] = START_TARGETED
+        template.my_targeted = targeted
+        template.opp_targeted = targeted[::-1].copy()
+
+        template.hash = hash_node(template)
+        template.pawn_hash = hash_pawns(template)
+        template.mg_score, template.eg_score, template.phase =\
+            psqt_scores(template.board)
+
+        START_NODE = template
+
+    # The piece-square tables are symmetric, so the value starts at 0 for
+    # either player
+    node = Node(START_NODE.board.copy(), 0, player, weights)
+
+    for name in ("my_squares", "opp_squares", "my_moved", "opp_moved",
+            "my_targeted", "opp_targeted"):
+        setattr(node, name, getattr(START_NODE, name).copy())
+
+    node.hash = START_NODE.hash
+    node.pawn_hash = START_NODE.pawn_hash
+    node.mg_score = START_NODE.mg_score
+    node.eg_score = START_NODE.eg_score
+    node.phase = START_NODE.phase
+
+    return node
+
+
+# Returns the heuristic value of a node computed from scratch (Heuristic
+# Parts 2 to 5, 7 and 8), from the point of view of node.player like h_value
+# Used for positions that were not reached through node_do_move
+def static_value(node):
+    weights = node.weights
+    value = 0
+
+    for side in range(2):
+        sign = 1 if side == node.player else -1
+
+        if side == node.side:
+            squares, moved = node.my_squares, node.my_moved
+        else:
+            squares, moved = node.opp_squares, node.opp_moved
+
+        for piece_id in range(16):
+            square = squares[piece_id]
+
+            if square[0] == -1:
+                continue
+
+            piece = node.board[square[0], square[1]][2]
+
+            # Heuristic Parts 2 and 4: points and development
+            value += sign * weights.points[piece]
+
+            if moved[piece_id]:
+                value += sign * weights.moved_points[piece]
+
+    # Heuristic Parts 3 and 7: how many times each side's pieces are
+    # attacked and the Pawn structure
+    value += node.attack_value() + node.pawn_value()
+
+    # Heuristic Part 8: the piece-square tables
+    value += node.psqt_value()
+
+    # Heuristic Part 5: the side that just moved gave check
+    if node.is_checked(node.side):
+        value += weights.check if node.side != node.player else\
+            -weights.check
+
+    return np.array(value).item()
+
+
+# Returns the node for a FEN string; only the first four fields (board,
+# side, castling and en passant) are used, so EPD lines work too
+# player = side the computer plays as (the side to move by default)
+# weights = weights used in heuristics (see weights.py)
+# Pieces on their starting squares keep their starting IDs; the King always
+# gets ID 4 and castling rights decide whether the King/Rooks have moved
+def node_from_fen(fen, player=None, weights=DEFAULT_WEIGHTS):
+    fields = fen.split()
+    side = 0 if fields[1] == "w" else 1
+    castling = fields[2]
+
+    if player is None:
+        player = side
+
+    pieces = [[], []]  # [piece, row, col] of every piece of each side
+
+    for index, text in enumerate(fields[0].split("/")):
+        row = 7 - index
+        col = 0
+
+        for char in text:
+            if char.isdigit():
+                col += int(char)
+            else:
+                pieces[0 if char.isupper() else 1].append([FEN_PIECES.index(
+                    char.lower()), row, col])
+                col += 1
+
+    board = np.array([[EMPTY_3 for _ in range(8)] for _ in range(8)])
+    moved = [np.array([True for _ in range(16)]) for _ in range(2)]
+
+    for color in range(2):
+        if len(pieces[color]) > 16:
+            raise ValueError("Too many pieces in FEN: " + fen)
+
+        if [piece[0] for piece in pieces[color]].count(4) != 1:
+            raise ValueError("Each side needs exactly one King: " + fen)
+
+        home_row = 0 if color == 0 else 7
+        pawn_row = 1 if color == 0 else 6
+        rights = ["Q", "K"] if color == 0 else ["q", "k"]
+
+        ids = [-1 for _ in pieces[color]]
+
+        # Pieces on their starting squares take their starting IDs
+        for index, (piece, row, col) in enumerate(pieces[color]):
+            if row == home_row and HOME_PIECES[col] == piece:
+                ids[index] = col
+            elif row == pawn_row and piece == 5:
+                ids[index] = 8 + col
+            elif piece == 4:
+                ids[index] = 4
+
+            if ids[index] != -1 and piece != 4:
+                moved[color][ids[index]] = False
+
+        # Everything else takes the remaining IDs
+        free = [piece_id for piece_id in range(16) if piece_id not in ids]
+
+        for index, (piece, row, col) in enumerate(pieces[color]):
+            if ids[index] == -1:
+                ids[index] = free.pop(0)
+
+            board[row, col] = np.array([color, ids[index], piece])
+
+        # Castling rights decide whether the King and Rooks have moved
+        moved[color][4] = rights[0] not in castling and rights[1] not in\
+            castling
+        moved[color][0] = moved[color][0] or rights[0] not in castling
+        moved[color][7] = moved[color][7] or rights[1] not in castling
+
+    node = Node(board, side, player, weights)
+    node.my_moved = moved[side]
+    node.opp_moved = moved[1 - side]
+
+    if fields[3] != "-":
+        node.en_passant = np.array(parse_square(fields[3]))
+
+    fill_from_board(node)
+    node.hash = hash_node(node)
+    node.pawn_hash = hash_pawns(node)
+    node.mg_score, node.eg_score, node.phase = psqt_scores(board)
+    node.h_value = static_value(node)
+
+    return node
@@ -0,0 +1,151 @@
+"""
+Piece-Square Tables for Chess Bot
+Points for each piece on each square, with one table for the middlegame
+and one for the endgame; a position's score is blended between the two by
+the material left on the board (its phase)
+node_do_move keeps the scores up to date by the squares that change, so
+they are only counted over the whole board for positions that were not
+reached through a move (see psqt_scores())
+"""
+
+import numpy as np
+
+PST_SCALE = 100  # The tables are written in hundredths of a point
+
+# Phase that each piece (by Piece) adds while it is on the board; the
+# starting position has MAX_PHASE, and a phase of 0 is a pure endgame
+PHASE_WEIGHTS = (2, 1, 1, 4, 0, 0)
+MAX_PHASE = 24
+
+# Tables by Piece, for White, written as the board is seen from White's
+# side (the 8th row first)
+MG_TABLES = np.array([
+    # Rook
+    [0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0],
+    # Knight
+    [-50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50],
+    # Bishop
+    [-20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20],
+    # Queen
+    [-20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20],
+    # King: behind its Pawns
+    [-30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20],
+    # Pawn
+    [0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0],
+], dtype=float)
+
+EG_TABLES = np.array([
+    # Rook: only the 7th row still matters
+    [0, 0, 0, 0, 0, 0, 0, 0,
+    10, 10, 10, 10, 10, 10, 10, 10,
+    0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0],
+    # Knight, Bishop and Queen want the center in both phases
+    MG_TABLES[1],
+    MG_TABLES[2],
+    MG_TABLES[3],
+    # King: in the center, next to the Pawns
+    [-50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50],
+    # Pawn: the closer to promoting, the better
+    [0, 0, 0, 0, 0, 0, 0, 0,
+    80, 80, 80, 80, 80, 80, 80, 80,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    20, 20, 20, 20, 20, 20, 20, 20,
+    10, 10, 10, 10, 10, 10, 10, 10,
+    5, 5, 5, 5, 5, 5, 5, 5,
+    0, 0, 0, 0, 0, 0, 0, 0],
+], dtype=float)
+
+
+# Returns the [White, Black] tables indexed [Piece][row * 8 + col], in
+# points from White's point of view (Black's are mirrored and negated)
+def side_tables(tables):
+    white = tables.reshape(6, 8, 8)[:, ::-1] / PST_SCALE
+
+    return [white.reshape(6, 64), -white[:, ::-1].reshape(6, 64)]
+
+
+# Kept as Python lists because node_do_move looks them up one at a time
+MG_VALUES = [table.tolist() for table in side_tables(MG_TABLES)]
+EG_VALUES = [table.tolist() for table in side_tables(EG_TABLES)]
+
+
+# Returns the score from White's point of view, blended between the
+# middlegame score (at MAX_PHASE) and the endgame score (at 0)
+def tapered(mg_score, eg_score, phase):
+    phase = min(phase, MAX_PHASE)
+
+    return (mg_score * phase + eg_score * (MAX_PHASE - phase)) / MAX_PHASE
+
+
+# Returns mg_score, eg_score, phase of a board counted from scratch
+# node_do_move keeps them up to date incrementally afterwards
+def psqt_scores(board):
+    mg_score = 0
+    eg_score = 0
+    phase = 0
+
+    for row in range(8):
+        for col in range(8):
+            tup = board[row, col]
+
+            if tup[0] != -1:
+                mg_score += MG_VALUES[tup[0]][tup[2]][row * 8 + col]
+                eg_score += EG_VALUES[tup[0]][tup[2]][row * 8 + col]
+                phase += PHASE_WEIGHTS[tup[2]]
+
+    return mg_score, eg_score, phase
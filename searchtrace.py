@@ -0,0 +1,224 @@
+"""
+Search Tracing for Chess Bot
+Records every node a search visits as a fixed-size binary record in a ring
+buffer (optionally streamed to a file) and summarizes recorded traces:
+branching factor per ply, where cutoffs happen and the slowest subtrees
+
+Usage: python searchtrace.py TRACE_FILE [--hotspots N]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+TRACE_MAGIC = b"CBTRACE2"  # Start of every trace file
+TRACE_CAPACITY = 2 ** 20  # Records kept in memory
+CHUNK = 4096  # Records gathered in a list before they are copied into the
+# ring buffer
+
+# One record per visited node, written when the node is left
+TRACE_TYPE = np.dtype([
+    ("ply", "u1"),  # Level of the node (its depth from the root)
+    ("kind", "u1"),  # One of the KINDS, plus CUTOFF if the node cut off
+    ("move", "<u2"),  # Move that led to the node (see moves.py)
+    ("alpha", "<f4"),  # Window the node was searched with (values are
+    ("beta", "<f4"),  # fractional heuristic points, see psqt.py)
+    ("score", "<f4"),  # Value returned
+    ("searched", "<u2"),  # Children searched (the cutoff position)
+    ("children", "<u2"),  # Legal children
+    ("time", "<u4"),  # Microseconds from the start of tracing at entry
+    ("spent", "<u4"),  # Microseconds spent in the node and below
+])
+
+# Kinds of node
+KIND_MAX = 0  # Searched, the computer to move
+KIND_MIN = 1  # Searched, its opponent to move
+KIND_HASH = 2  # Answered by the transposition table
+KIND_END = 3  # Game over
+KIND_HORIZON = 4  # At the cutoff level (quiescence search follows)
+KIND_RAZOR = 5  # Cut off by razoring
+KIND_QUIESCENCE = 6  # Inside the quiescence search
+KINDS = ["max", "min", "hash", "end", "horizon", "razor", "quiescence"]
+CUTOFF = 0x80  # Set in kind when a child's value ended the search early
+KIND_MASK = 0x7F  # Bits of kind that hold the kind of node
+
+
+class SearchTracer:
+    # capacity = records kept in memory (the oldest are overwritten)
+    # path = optional file that every record is appended to instead, so
+    # nothing is lost
+    def __init__(self, capacity=TRACE_CAPACITY, path=None):
+        self.records = np.zeros(capacity, dtype=TRACE_TYPE)
+        self.count = 0  # Records written in total
+        self.chunk = []  # Records not yet copied into self.records
+        self.start = time.perf_counter()
+        self.file = None
+
+        if path is not None:
+            self.file = open(path, "wb")
+            self.file.write(TRACE_MAGIC)
+
+    # Returns the microseconds since tracing started
+    def now(self):
+        return int((time.perf_counter() - self.start) * 1e6)
+
+    # Records a node when it is left
+    # start = now() when the node was entered
+    def record(self, ply, kind, move, alpha, beta, score, searched,
+            children, start):
+        end = self.now()
+
+        self.chunk.append((ply, kind, move or 0, alpha, beta, score,
+            searched, children, start, end - start))
+
+        if len(self.chunk) >= CHUNK:
+            self.flush()
+
+    # Copies the gathered records into the ring buffer (and the file)
+    def flush(self):
+        if len(self.chunk) == 0:
+            return
+
+        chunk = np.array(self.chunk, dtype=TRACE_TYPE)
+        self.chunk = []
+
+        if self.file is not None:
+            self.file.write(chunk.tobytes())
+            self.file.flush()
+
+        capacity = len(self.records)
+
+        # Only the newest "capacity" records fit
+        if len(chunk) > capacity:
+            self.count += len(chunk) - capacity
+            chunk = chunk[-capacity:]
+
+        index = np.arange(self.count, self.count + len(chunk)) % capacity
+        self.records[index] = chunk
+        self.count += len(chunk)
+
+    # Returns the records kept in memory, oldest first
+    def trace(self):
+        self.flush()
+
+        capacity = len(self.records)
+
+        if self.count <= capacity:
+            return self.records[:self.count].copy()
+
+        split = self.count % capacity
+
+        return np.concatenate([self.records[split:], self.records[:split]])
+
+    # Writes the records kept in memory to a trace file
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(TRACE_MAGIC)
+            file.write(self.trace().tobytes())
+
+    def close(self):
+        self.flush()
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# Returns the records of a trace file (memory-mapped)
+def read_trace(path):
+    with open(path, "rb") as file:
+        if file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError("Not a trace file: " + path)
+
+    return np.memmap(path, dtype=TRACE_TYPE, mode="r", offset=len(
+        TRACE_MAGIC))
+
+
+# Returns a summary of trace records as a dict
+#   plies: per ply, the nodes, the mean legal and searched children of
+#   searched nodes, the share that cut off and, of those, the share that cut
+#   off on the first child
+#   cutoff_positions: number of cutoffs after 1, 2, ... children
+#   kinds: number of nodes of each kind
+#   hotspots: the slowest nodes (ply, move, microseconds, kind)
+def summarize(records, hotspots=10):
+    kinds = records["kind"] & KIND_MASK
+    cutoffs = records["kind"] & CUTOFF != 0
+    searched = (kinds == KIND_MAX) | (kinds == KIND_MIN)
+
+    plies = []
+
+    for ply in range(int(records["ply"].max()) + 1 if len(records) > 0 else
+            0):
+        at_ply = records["ply"] == ply
+        inner = at_ply & searched
+        cut = inner & cutoffs
+
+        plies.append({
+            "ply": ply,
+            "nodes": int(at_ply.sum()),
+            "branching": float(records["children"][inner].mean()) if
+                inner.any() else 0.0,
+            "searched": float(records["searched"][inner].mean()) if
+                inner.any() else 0.0,
+            "cutoff_rate": float(cut.sum() / inner.sum()) if inner.any()
+                else 0.0,
+            "first_cutoff_rate": float((records["searched"][cut] ==
+                1).sum() / cut.sum()) if cut.any() else 0.0,
+        })
+
+    positions = np.bincount(records["searched"][searched & cutoffs])
+
+    slowest = np.argsort(records["spent"])[::-1][:hotspots]
+
+    return {
+        "records": int(len(records)),
+        "plies": plies,
+        "cutoff_positions": {int(index): int(count) for index, count in
+            enumerate(positions) if count > 0},
+        "kinds": {KINDS[kind]: int((kinds == kind).sum()) for kind in
+            range(len(KINDS))},
+        "hotspots": [[int(records["ply"][index]), int(records["move"][index]),
+            int(records["spent"][index]), KINDS[kinds[index]]] for index in
+            slowest],
+    }
+
+
+def main(args=None):
+    # Only the command line needs argparse; the search imports this module
+    # on every start
+    import argparse
+    from moves import move_to_str
+
+    parser = argparse.ArgumentParser(description="Summarize a search trace")
+    parser.add_argument("trace", help="Trace file")
+    parser.add_argument("--hotspots", type=int, default=10, help="Slowest "
+        "nodes to list")
+    args = parser.parse_args(args)
+
+    summary = summarize(read_trace(args.trace), args.hotspots)
+
+    print("Records:", summary["records"])
+    print("Nodes by kind:", summary["kinds"])
+    print()
+    print("{:>4}{:>10}{:>11}{:>10}{:>9}{:>9}".format("Ply", "Nodes",
+        "Branching", "Searched", "Cutoff", "First"))
+
+    for ply in summary["plies"]:
+        print("{:>4}{:>10}{:>11.2f}{:>10.2f}{:>9.1%}{:>9.1%}".format(
+            ply["ply"], ply["nodes"], ply["branching"], ply["searched"],
+            ply["cutoff_rate"], ply["first_cutoff_rate"]))
+
+    print()
+    print("Cutoffs after N children:", summary["cutoff_positions"])
+    print()
+    print("Slowest nodes (ply, move, ms, kind):")
+
+    for ply, move, spent, kind in summary["hotspots"]:
+        print("  ", ply, move_to_str(move) if move else "-", round(spent /
+            1000, 2), kind)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
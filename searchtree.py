@@ -4,190 +4,764 @@ Jerry Shukai Zhang
 12/06/2020 - 02/03/2021
 """
 
-from node import Node
-import numpy as np
+from evalcache import EVAL_CACHE
+from mate import MateSolver, MATE_MOVES, MATE_NODES
+from position import start_node
+from weights import DEFAULT_WEIGHTS
+from moves import NO_MOVE, is_capture, is_promotion, move_to_str
+from searchtrace import CUTOFF, KIND_END, KIND_HASH, KIND_HORIZON, KIND_MAX,\
+    KIND_MIN, KIND_QUIESCENCE, KIND_RAZOR
+from transposition import TranspositionTable, FLAG_EXACT, FLAG_LOWER,\
+    FLAG_UPPER, bound_flag
+import time
 
 
 # Constants:
 MAX_LEVEL = 4  # Max level of Minimax algorithm
+TT_SIZE = 2 ** 16  # Number of entries in the transposition table
+QUIESCENCE_LEVELS = 4  # Captures followed past MAX_LEVEL (0 turns the
+# quiescence search off)
+FORWARD_PRUNING = True  # Futility pruning and razoring near the cutoff
+LAZY_MARGIN = 6  # Heuristic margin for skipping Heuristic Parts 3 and 7
+# outside the alpha-beta window (see Node.evaluate(); None always adds them)
+# It is not a bound: over positions from random games, the two parts come to
+# more than 6 for about 3% of positions (up to 9-12), and a depth-3 search
+# of 40 such positions found another move in 1 of them than with None
+TIMED_MAX_LEVEL = 20  # Deepest iteration of a timed search
+
+
+# Raised inside the search once its deadline has passed or its node budget
+# is spent
+class SearchTimeout(Exception):
+    pass
+
+
+# Raised by tree_do_move for a move that is not legal in the current
+# position; the game is left as it was
+class IllegalMoveError(ValueError):
+    pass
 
 
 class SearchTree:
-    def __init__(self, player):
+    # player = the side that computer will play as
+    # board = optional Node to continue from instead of the starting board
+    # weights = weights used in heuristics (see weights.py)
+    # tt = optional TranspositionTable to search with (i.e. one shared with
+    # other processes, see sharedtables.py) instead of a new one
+    def __init__(self, player, board=None, weights=DEFAULT_WEIGHTS, tt=None):
         self.player = player  # the side that computer will play as
 
-        # Layout of the starting board
-        # Contains entries of format [Side, ID, Piece]
-        # Empty squares are [-1, -1, -1]
-        start_board = np.array([[[-1, -1, -1] for col in range(8)] for row in\
-            range(8)])
-
-        # Set my_moved and opp_moved for the starting board
-        white_squares = np.array([[-1, -1] for _ in range(16)])
-        black_squares = np.array([[-1, -1] for _ in range(16)])
-
-        # Fill in the starting board
-        for side in range(2):  # 0 = White; 1 = Black
-            # Fill in the appropriate squares
-            squares = white_squares if side == 0 else black_squares
-
-            for row in range(2):  # Each side starts in 2 rows
-                for col in range(8):  # With 8 pieces in each
-                    # Determine coordinates of the piece
-                    x = col
-                    y = row if side == 0 else 7 if row == 0 else 6
-
-                    # Determine the piece
-                    if row == 1:
-                        piece = 5  # Pawn
-                    elif col == 0 or col == 7:
-                        piece = 0  # Rook
-                    elif col == 1 or col == 6:
-                        piece = 1  # Knight
-                    elif col == 2 or col == 5:
-                        piece = 2  # Bishop
-                    elif col == 3:
-                        piece = 3  # Queen
-                    else:
-                        piece = 4  # King
+        self.moves_made = []  # Will list all the moves made by the computer
+        self.local_nodes_generated = 0  # Nodes generated in one search
+        self.total_nodes_generated = 0  # Total nodes generated
+        self.lazy_exits = 0  # Leaves whose value was decided without Parts
+        # 3 and 7 in one search
+        self.futility_prunes = 0  # Quiet moves skipped by futility pruning
+        self.razor_prunes = 0  # Nodes cut off by razoring
+        self.last_value = 0  # Heuristic value of the last search's result
+
+        # Shared by every search so later searches (and every line of an
+        # analysis) reuse earlier results
+        self.tt = TranspositionTable(TT_SIZE) if tt is None else tt
+
+        self.tracer = None  # Optional SearchTracer that records every node
+        # visited (see searchtrace.py)
+
+        self.mcts = None  # Monte Carlo search tree, kept between moves so
+        # its subtree of the move played is reused (see mcts.py)
+
+        # State of the search in progress
+        self.max_level = MAX_LEVEL  # Level at which the search stops
+        self.deadline = None  # time.monotonic() value to stop at, or None
+        self.max_nodes = None  # Nodes to stop after, or None
+        self.root_move = None  # Best fully searched root move so far
+        self.root_value = 0  # Value of root_move
+        self.root_scores = {}  # Value (or upper bound) of every root move
+        # searched, by move
+
+        # The starting board is unpacked from a constant (see
+        # position.start_node()); White goes first
+        self.curr_board = start_node(player, weights) if board is None else\
+            board
+
+    # Resets the per-search state before a new search
+    # max_level = level at which to stop (MAX_LEVEL by default)
+    # max_nodes = number of nodes after which to stop (None = no limit)
+    def start_search(self, deadline, max_level=None, max_nodes=None):
+        self.local_nodes_generated = 0  # Number of nodes generated in this search
+        self.max_level = MAX_LEVEL if max_level is None else max_level
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.root_move = None
+        self.root_value = 0
+        self.root_scores = {}
+        self.lazy_exits = 0
+        self.futility_prunes = 0
+        self.razor_prunes = 0
+
+        self.tt.new_search()
+
+    # Stops the search once the deadline has passed or the node budget is
+    # spent
+    def check_deadline(self):
+        if self.max_nodes is not None and self.local_nodes_generated >=\
+                self.max_nodes:
+            raise SearchTimeout()
+
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise SearchTimeout()
+
+    # Looks check_node up in the transposition table
+    # Returns val, hash_move; val is None unless the stored result is deep
+    # enough to be used in the window alpha/beta
+    def probe(self, check_node, alpha, beta, level):
+        entry = self.tt.probe(check_node.hash)
+
+        if entry is None:
+            return None, NO_MOVE
+
+        hash_move, value, depth, flag = entry
+
+        # The root is always searched so that it has a move to return
+        if level > 0 and depth >= self.max_level - level:
+            if flag == FLAG_EXACT or (flag == FLAG_LOWER and value >= beta)\
+                    or (flag == FLAG_UPPER and value <= alpha):
+                return value, hash_move
+
+        return None, hash_move
+
+    # Returns the key that order_nodes() sorts the child "node" of check_node
+    # by: the child made by hash_move first, then captures that win material
+    # (best first, see Node.see()), then quiet moves and last the captures
+    # that lose material
+    def move_order(self, check_node, node, hash_move):
+        if node.move == hash_move:
+            return 0, 0
+
+        if is_capture(node.move):
+            gain = check_node.see(node.move)
+
+            return (1, -gain) if gain >= 0 else (3, -gain)
+
+        return 2, 0
+
+    # Sorts child_nodes into the order they should be searched in
+    def order_nodes(self, check_node, child_nodes, hash_move):
+        child_nodes.sort(key=lambda node: self.move_order(check_node, node,\
+            hash_move))
+
+    # Follows only the captures that do not lose material (see Node.see())
+    # past the cutoff, so that the search does not stop in the middle of an
+    # exchange; the side to move may also stop capturing ("stand pat") and
+    # take the heuristic value
+    # Returns val
+    # depth = how many captures have been followed so far
+    # child_nodes = the children of check_node if it was already expanded
+    def quiescence(self, check_node, alpha, beta, depth, child_nodes=None):
+        self.check_deadline()
+
+        start = 0 if self.tracer is None else self.tracer.now()
+        alpha_start, beta_start = alpha, beta
+
+        val = check_node.evaluate(alpha, beta, LAZY_MARGIN)
+        maximize = check_node.side == self.player
+
+        if check_node.pending:
+            self.lazy_exits += 1
+
+        if depth == QUIESCENCE_LEVELS or (maximize and val >= beta) or\
+                (not maximize and val <= alpha):
+            if self.tracer is not None:
+                self.tracer.record(self.max_level + depth, KIND_QUIESCENCE,\
+                    check_node.move, alpha, beta, val, 0, 0, start)
+
+            return val
+
+        if maximize:
+            alpha = max(alpha, val)
+        else:
+            beta = min(beta, val)
+
+        # Expanded children are already known to be valid moves
+        if child_nodes is None:
+            captures = check_node.good_captures()
+            children = {}
+        else:
+            captures = check_node.good_captures([node.move for node in\
+                child_nodes])
+            children = {node.move: node for node in child_nodes}
+
+        searched = 0
+        kind = KIND_QUIESCENCE
+
+        for gain, move in captures:
+            if child_nodes is None:
+                node = check_node.node_do_move(move)
+
+                # Skip captures that leave one's own King checked
+                if node.is_checked(check_node.side):
+                    continue
+            else:
+                node = children[move]
+
+            temp_val = self.quiescence(node, alpha, beta, depth + 1)
+            searched += 1
+
+            self.local_nodes_generated += 1
+            self.total_nodes_generated += 1
+
+            if maximize and temp_val > val:
+                val = temp_val
+                alpha = max(alpha, val)
+            elif not maximize and temp_val < val:
+                val = temp_val
+                beta = min(beta, val)
+
+            if alpha >= beta:
+                kind |= CUTOFF
+
+                break
+
+        if self.tracer is not None:
+            self.tracer.record(self.max_level + depth, kind, check_node.move,\
+                alpha_start, beta_start, val, searched, len(captures), start)
+
+        return val
+
+    # Returns True if the move that made "node" takes a piece, promotes a
+    # Pawn or checks (such moves are never pruned)
+    def is_tactical(self, node):
+        return is_capture(node.move) or is_promotion(node.move) or\
+            node.is_checked(node.side)
 
-                    # Calculate the ID
-                    piece_id = row * 8 + col
+    # Forward pruning of check_node one or two levels before the cutoff
+    # (never at the root, when in check, or with FORWARD_PRUNING off); the
+    # margins are the worth of a Rook (razoring) and of a Knight (futility)
+    # from the node's weights
+    # Returns val, futile_val: val is the node's value if razoring cut it
+    # off (None otherwise); futile_val is None unless its quiet moves may be
+    # skipped, in which case it is the best value those moves could reach
+    def forward_prune(self, check_node, child_nodes, alpha, beta, level):
+        depth = self.max_level - level
+
+        if not FORWARD_PRUNING or level == 0 or depth > 2 or\
+                check_node.is_checked(check_node.side):
+            return None, None
+
+        points = check_node.weights.points
+        maximize = check_node.side == self.player
+        static = check_node.evaluate()
 
-                    # Set squares fields
-                    squares[piece_id] = np.array([y, x])
+        # How far the value falls short of the window (below alpha for the
+        # computer, above beta for its opponent)
+        short = alpha - static if maximize else static - beta
 
-                    # Set the piece
-                    start_board[y, x] = np.array([side, piece_id, piece])
+        # Razoring: two levels from the cutoff, a value short by more than a
+        # Rook is only searched for captures, and cut off if they do not
+        # bring it back into the window
+        if depth == 2 and short >= points[0]:
+            val = self.quiescence(check_node, alpha, beta, 0, child_nodes)
 
-        # Fill in the values for the starting board
-        self.curr_board = Node(start_board, 0, player)  # White goes first
+            if (maximize and val <= alpha) or (not maximize and val >= beta):
+                self.razor_prunes += 1
 
-        self.curr_board.my_squares = white_squares
-        self.curr_board.opp_squares = black_squares
+                return val, None
 
-        self.curr_board.my_moved = np.array([False for _ in range(16)])
-        self.curr_board.opp_moved = np.array([False for _ in range(16)])
+        # Futility pruning: one level from the cutoff, a quiet move cannot
+        # make up for more than a Knight
+        if depth == 1 and short >= points[1]:
+            return None, static + points[1] if maximize else static -\
+                points[1]
 
-        # Fill in the targeted matrices
-        white_targeted = np.array([[0 for _ in range(8)]\
-            for _ in range(8)])
-        black_targeted = np.array([[0 for _ in range(8)]\
-            for _ in range(8)])
+        return None, None
 
-        first_row = np.array([0, 7])
-        second_row = np.array([1, 6])
-        third_row = np.array([2, 5])
+    # Returns val, move
+    # check_node = node that is being expanded/inspected
+    # alpha = highest heuristic value so far
+    # beta = lowest heuristic value so far
+    # level = how many lookaheads have been done so far
+    def max_value(self, check_node, alpha, beta, level):
+        self.check_deadline()
 
-        # Starting board will always have the same targeting schemes
-        for side in range(2):
-            targeted = white_targeted if side == 0 else black_targeted
+        start = 0 if self.tracer is None else self.tracer.now()
 
-            row_1 = first_row[side]
-            row_2 = second_row[side]
-            row_3 = third_row[side]
+        tt_val, hash_move = self.probe(check_node, alpha, beta, level)
 
-            for col in range(8):
-                num_1 = 0 if col == 0 or col == 7 else 1
-                num_2 = 3 if col == 3 or col == 4 else 1
-                num_3 = 3 if col == 2 or col == 5 else 2
+        if tt_val is not None:
+            if self.tracer is not None:
+                self.tracer.record(level, KIND_HASH, check_node.move, alpha,\
+                    beta, tt_val, 0, 0, start)
 
-                targeted[row_1, col] = num_1
-                targeted[row_2, col] = num_2
-                targeted[row_3, col] = num_3
+            return tt_val, None
 
-        self.curr_board.my_targeted = white_targeted
-        self.curr_board.opp_targeted = black_targeted
+        # Call expand() first because this updates Checkmate/Draw status
+        child_nodes = check_node.expand()
 
-        self.moves_made = []  # Will list all the moves made by the computer
-        self.local_nodes_generated = 0  # Nodes generated in one search
-        self.total_nodes_generated = 0  # Total nodes generated
+        # If game is over
+        if check_node.outcome == "Checkmate" or check_node.outcome\
+                == "Draw":
+            self.tt.store(check_node.hash, NO_MOVE, check_node.h_value,\
+                self.max_level - level, FLAG_EXACT)
+
+            if self.tracer is not None:
+                self.tracer.record(level, KIND_END, check_node.move, alpha,\
+                    beta, check_node.h_value, 0, 0, start)
+
+            return check_node.h_value, None
+
+        # If node reaches cutoff, only follow captures from here
+        if level >= self.max_level:
+            val = self.quiescence(check_node, alpha, beta, 0, child_nodes)
+
+            self.tt.store(check_node.hash, NO_MOVE, val, 0,\
+                bound_flag(val, alpha, beta))
+
+            if self.tracer is not None:
+                self.tracer.record(level, KIND_HORIZON, check_node.move,\
+                    alpha, beta, val, 0, len(child_nodes), start)
+
+            return val, None
+
+        razor_val, futile_val = self.forward_prune(check_node, child_nodes,\
+            alpha, beta, level)
+
+        if razor_val is not None:
+            if self.tracer is not None:
+                self.tracer.record(level, KIND_RAZOR, check_node.move, alpha,\
+                    beta, razor_val, 0, len(child_nodes), start)
+
+            return razor_val, None
+
+        self.order_nodes(check_node, child_nodes, hash_move)
+
+        alpha_start = alpha
+        val = -9999
+        move = NO_MOVE
+        searched = 0
+
+        for node in child_nodes:
+            searched += 1
+
+            # Skip quiet moves that cannot bring the value up to alpha
+            if futile_val is not None and not self.is_tactical(node):
+                self.futility_prunes += 1
+                val = max(val, futile_val)
+
+                continue
+
+            temp_val, temp_move = self.min_value(node, alpha, beta, level + 1)
+
+            if level == 0:
+                self.root_scores[node.move] = temp_val
+
+            # Update val/move if a node with a higher value is found
+            # Also update alpha accordingly
+            if temp_val > val:
+                val, move = temp_val, node.move
+                alpha = max(alpha, val)
+
+                if level == 0:
+                    self.root_move, self.root_value = move, val
+
+            # However, if value is greater than beta, this node will not
+            # be reached because the opponent is assumed is assumed to
+            # make the optimal move
+            if val >= beta:
+                break
+
+            self.local_nodes_generated += 1
+            self.total_nodes_generated += 1
+
+        if val >= beta:
+            flag = FLAG_LOWER
+        else:
+            flag = FLAG_EXACT if val > alpha_start else FLAG_UPPER
+
+        if self.tracer is not None:
+            self.tracer.record(level, KIND_MAX | (CUTOFF if val >= beta else\
+                0), check_node.move, alpha_start, beta, val, searched,\
+                len(child_nodes), start)
+
+        self.tt.store(check_node.hash, move, val, self.max_level -\
+            level, flag)
+
+        return val, move
+
+    # Return val, move
+    # check_node = node that is being expanded/inspected
+    # alpha = highest heuristic value so far
+    # beta = lowest heuristic value so far
+    # level = how many lookaheads have been done so far
+    def min_value(self, check_node, alpha, beta, level):
+        self.check_deadline()
+
+        start = 0 if self.tracer is None else self.tracer.now()
+
+        tt_val, hash_move = self.probe(check_node, alpha, beta, level)
+
+        if tt_val is not None:
+            if self.tracer is not None:
+                self.tracer.record(level, KIND_HASH, check_node.move, alpha,\
+                    beta, tt_val, 0, 0, start)
+
+            return tt_val, None
+
+        child_nodes = check_node.expand()
+
+        # If game is over
+        if check_node.outcome == "Checkmate" or check_node.outcome\
+                == "Draw":
+            self.tt.store(check_node.hash, NO_MOVE, check_node.h_value,\
+                self.max_level - level, FLAG_EXACT)
+
+            if self.tracer is not None:
+                self.tracer.record(level, KIND_END, check_node.move, alpha,\
+                    beta, check_node.h_value, 0, 0, start)
+
+            return check_node.h_value, None
+
+        # If node reaches cutoff, only follow captures from here
+        if level >= self.max_level:
+            val = self.quiescence(check_node, alpha, beta, 0, child_nodes)
+
+            self.tt.store(check_node.hash, NO_MOVE, val, 0,\
+                bound_flag(val, alpha, beta))
+
+            if self.tracer is not None:
+                self.tracer.record(level, KIND_HORIZON, check_node.move,\
+                    alpha, beta, val, 0, len(child_nodes), start)
+
+            return val, None
+
+        razor_val, futile_val = self.forward_prune(check_node, child_nodes,\
+            alpha, beta, level)
+
+        if razor_val is not None:
+            if self.tracer is not None:
+                self.tracer.record(level, KIND_RAZOR, check_node.move, alpha,\
+                    beta, razor_val, 0, len(child_nodes), start)
+
+            return razor_val, None
+
+        self.order_nodes(check_node, child_nodes, hash_move)
+
+        beta_start = beta
+        val = 9999
+        move = NO_MOVE
+        searched = 0
+
+        for node in child_nodes:
+            searched += 1
+
+            # Skip quiet moves that cannot bring the value down to beta
+            if futile_val is not None and not self.is_tactical(node):
+                self.futility_prunes += 1
+                val = min(val, futile_val)
+
+                continue
+
+            temp_val, temp_move = self.max_value(node, alpha, beta, level + 1)
+
+            # Update val/move if a node with a lower value is found
+            # Also update beta accordingly
+            if temp_val < val:
+                val, move = temp_val, node.move
+                beta = min(beta, val)
+
+            # However, if value is less than alpha, this node will not
+            # be reached because the player is assumed is assumed to
+            # make the optimal move
+            if val <= alpha:
+                break
+
+            self.local_nodes_generated += 1
+            self.total_nodes_generated += 1
+
+        if val <= alpha:
+            flag = FLAG_UPPER
+        else:
+            flag = FLAG_EXACT if val < beta_start else FLAG_LOWER
+
+        if self.tracer is not None:
+            self.tracer.record(level, KIND_MIN | (CUTOFF if val <= alpha else\
+                0), check_node.move, alpha, beta_start, val, searched,\
+                len(child_nodes), start)
+
+        self.tt.store(check_node.hash, move, val, self.max_level -\
+            level, flag)
+
+        return val, move
 
     # Minimax algorithm with Alpha-Beta pruning; tree-like
     # Only goes up to max_level before stopping
-    def find_next_move(self):
-        self.local_nodes_generated = 0  # Number of nodes generated in this search
+    # deadline = optional time.monotonic() value at which the search stops and
+    # returns the best root move completed so far
+    # verbose = whether to print the node counts
+    # max_level = level at which to stop (MAX_LEVEL by default)
+    # max_nodes = optional number of nodes after which the search stops like
+    # at a deadline
+    # deterministic = whether to make the result depend on the position and
+    # limits alone: the deadline is ignored and the search uses a new empty
+    # transposition table of TT_SIZE (move ordering has no random element),
+    # so the same input gives the same nodes and move on any machine; the
+    # game's own table, which may be shared with other processes (see
+    # sharedtables.py), is left as it is
+    def find_next_move(self, deadline=None, verbose=True, max_level=None,
+            max_nodes=None, deterministic=False):
+        tt = self.tt
+
+        if deterministic:
+            deadline = None
+            self.tt = TranspositionTable(TT_SIZE)
+
+        try:
+            move = self.search_root(deadline, max_level, max_nodes)
+        finally:
+            self.tt = tt
+
+        if verbose:
+            print("Nodes Generated for this move: ", self.local_nodes_generated)
+            print("Total Nodes Generated: ", self.total_nodes_generated)
+            print("Evaluation Cache Hits/Misses: ", EVAL_CACHE.hits,\
+                EVAL_CACHE.misses)
+            print("Lazy Evaluation Exits: ", self.lazy_exits)
+            print("Futility/Razoring Prunes: ", self.futility_prunes,\
+                self.razor_prunes)
+
+        return move
+
+    # Runs the search of find_next_move() with the current transposition
+    # table; returns the move found
+    def search_root(self, deadline, max_level, max_nodes):
+        self.start_search(deadline, max_level, max_nodes)
+
+        try:
+            self.last_value, move = self.max_value(self.curr_board, -9999,\
+                9999, 0)
+        except SearchTimeout:
+            self.last_value, move = self.root_value, self.root_move
+
+            # If not even one root move was searched, take the first one
+            if move is None:
+                child_nodes = self.curr_board.expand()
+
+                if len(child_nodes) > 0:
+                    move = child_nodes[0].move
+
+        if self.tracer is not None:
+            self.tracer.flush()
+
+        return move
+
+    # Iterative deepening under a game clock: searches one level deeper at a
+    # time until time_manager (see timemanager.py) says to stop, and returns
+    # the best move of the deepest iteration (or of the unfinished one, if
+    # it already found one, since its first move is the last best move)
+    # The transposition table carries the best move of each iteration into
+    # the next, so the deeper ones search it first
+    # verbose = whether to print the node counts and depth reached
+    # max_level = deepest iteration (TIMED_MAX_LEVEL by default)
+    def find_timed_move(self, time_manager, verbose=True, max_level=None):
+        time_manager.start()
+        self.start_search(time_manager.deadline(), max_level)
+        depth = TIMED_MAX_LEVEL if max_level is None else max_level
+
+        child_nodes = self.curr_board.expand()
+        move = child_nodes[0].move if len(child_nodes) > 0 else None
+        reached = 0
+
+        # With only one move there is nothing to think about
+        for max_level in range(1, depth + 1 if len(child_nodes) > 1 else 1):
+            self.max_level = max_level
+            self.root_move = None
+            self.root_scores = {}
+
+            try:
+                val, best = self.max_value(self.curr_board, -9999, 9999, 0)
+            except SearchTimeout:
+                if self.root_move is not None:
+                    self.last_value, move = self.root_value, self.root_move
+
+                break
+
+            self.last_value, move = val, best
+            reached = max_level
+
+            # How far the best move leads every other one; the values of
+            # the others are upper bounds, so the lead is a lower bound
+            others = [score for root_move, score in self.root_scores.items()\
+                if root_move != best]
+            gap = val - max(others) if len(others) > 0 else 9999
+
+            time_manager.update(best, val, gap)
+
+            if time_manager.should_stop():
+                break
+
+        if verbose:
+            print("Nodes Generated for this move: ", self.local_nodes_generated)
+            print("Total Nodes Generated: ", self.total_nodes_generated)
+            print("Depth Reached/Seconds Used: ", reached,\
+                round(time_manager.elapsed(), 2))
+
+        return move
 
-        # Returns val, move
-        # check_node = node that is being expanded/inspected
-        # alpha = highest heuristic value so far
-        # beta = lowest heuristic value so far
-        # level = how many lookaheads have been done so far
-        def max_value(check_node, alpha, beta, level):
-            # Call expand() first because this updates Checkmate/Draw status
-            child_nodes = check_node.expand()
-
-            # If game is over or node reaches cutoff
-            if check_node.outcome == "Checkmate" or check_node.outcome\
-                    == "Draw" or level == MAX_LEVEL:
-                return check_node.h_value, None
-
-            val = -9999
-
-            for node in child_nodes:
-                temp_val, temp_move = min_value(node, alpha, beta, level + 1)
-
-                # Update val/move if a node with a higher value is found
-                # Also update alpha accordingly
-                if temp_val > val:
-                    val, move = temp_val, node.move
-                    alpha = max(alpha, val)
-
-                # However, if value is greater than beta, this node will not
-                # be reached because the opponent is assumed is assumed to
-                # make the optimal move
-                if val >= beta:
-                    return val, move
-
-                self.local_nodes_generated += 1
-                self.total_nodes_generated += 1
-            return val, move
-
-        # Return val, move
-        # check_node = node that is being expanded/inspected
-        # alpha = highest heuristic value so far
-        # beta = lowest heuristic value so far
-        # level = how many lookaheads have been done so far
-        def min_value(check_node, alpha, beta, level):
-            child_nodes = check_node.expand()
-
-            # If game is over or node reaches cutoff
-            if check_node.outcome == "Checkmate" or check_node.outcome\
-                    == "Draw" or level == MAX_LEVEL:
-                return check_node.h_value, None
-
-            val = 9999
-
-            for node in child_nodes:
-                temp_val, temp_move = max_value(node, alpha, beta, level + 1)
-
-                # Update val/move if a node with a lower value is found
-                # Also update beta accordingly
-                if temp_val < val:
-                    val, move = temp_val, temp_move
-                    beta = min(beta, val)
-
-                # However, if value is less than alpha, this node will not
-                # be reached because the player is assumed is assumed to
-                # make the optimal move
-                if val <= alpha:
-                    return val, move
-
-                self.local_nodes_generated += 1
-                self.total_nodes_generated += 1
-            return val, move
-
-        _, move = max_value(self.curr_board, -9999, 9999, 0)
-
-        print("Nodes Generated for this move: ", self.local_nodes_generated)
-        print("Total Nodes Generated: ", self.total_nodes_generated)
+    # Monte Carlo tree search instead of minimax (see mcts.py)
+    # deadline = optional time.monotonic() value at which to stop
+    # max_visits = visits of the root after which to stop
+    # formula = "puct" or "uct"
+    # Without a deadline or max_visits, mcts.DEFAULT_VISITS are made
+    def find_mcts_move(self, deadline=None, max_visits=None, verbose=True,
+            formula="puct"):
+        if self.mcts is None or self.mcts.root.position.hash !=\
+                self.curr_board.hash or self.mcts.formula != formula:
+            # Imported here, so that only games that use it pay for it
+            from mcts import MCTS
+
+            self.mcts = MCTS(self.curr_board, formula)
+
+        visits = 0 if not self.mcts.root.is_expanded() else\
+            int(self.mcts.root.visits.sum())
+        generated = self.mcts.generated
+        move = self.mcts.search(max_visits, deadline)
+        scores = self.mcts.root_scores()
+
+        self.local_nodes_generated = self.mcts.generated - generated
+        self.total_nodes_generated += self.local_nodes_generated
+
+        self.last_value = scores[0][2] if len(scores) > 0 else\
+            self.curr_board.evaluate()
+
+        if verbose:
+            print("Visits for this move: ", int(sum(score[1] for score in\
+                scores)) - visits)
+            print("Positions in Tree/Recycled: ", self.mcts.size,\
+                self.mcts.recycled)
 
         return move
 
+    # Looks for a forced mate by the side to move with proof-number search
+    # (see mate.py), which only follows checks and their replies
+    # Returns the forced line (None if there is none within max_moves of the
+    # side to move, or none was found within max_nodes positions)
+    def find_mate(self, max_moves=MATE_MOVES, max_nodes=MATE_NODES,
+            verbose=True):
+        solver = MateSolver(self.curr_board, max_moves, max_nodes)
+        line = solver.solve()
+
+        self.local_nodes_generated = solver.nodes
+        self.total_nodes_generated += solver.nodes
+
+        if verbose:
+            print("Mate Search Result/Positions: ", solver.status(),\
+                solver.nodes)
+
+        return line
+
+    # Returns the moves stored in the transposition table as the best line
+    # from node, at most "length" moves long
+    # The line stops at the first move that is not legal where it is
+    # played: the entry may belong to another position with the same hash,
+    # or have been written by another search sharing the table
+    def principal_variation(self, node, length):
+        line = []
+
+        for _ in range(length):
+            move = self.tt.probe_move(node.hash)
+
+            if move == NO_MOVE or move not in node.legal_moves():
+                break
+
+            line.append(move)
+            node = node.node_do_move(move)
+
+        return line
+
+    # Multi-PV analysis of the current board
+    # Returns up to num_moves lists of [move, val, pv] for the best root moves,
+    # best first for the side to move; val is a heuristic value (from the
+    # computer's point of view, like h_value) and pv the expected line
+    # starting with move
+    # Uses iterative deepening up to "depth" (MAX_LEVEL by default); each
+    # root move is searched with a window that only admits moves that beat
+    # the current num_moves-th best, and all the lines share the
+    # transposition table
+    # With a deadline, the deepest completed iteration is returned
+    def analyze(self, num_moves=3, depth=None, deadline=None):
+        self.start_search(deadline, depth)
+        depth = self.max_level
+
+        root = self.curr_board
+        child_nodes = root.expand()
+
+        # The computer maximizes the heuristic value and its opponent
+        # minimizes it
+        sign = 1 if root.side == self.player else -1
+        results = []
+
+        for max_level in range(1, depth + 1):
+            self.max_level = max_level
+            scores = []  # [val, node] for every root move searched so far
+
+            try:
+                for node in child_nodes:
+                    # Only moves better than the num_moves-th best so far
+                    # need an exact value
+                    best = sorted([sign * score[0] for score in scores],\
+                        reverse=True)
+                    bound = best[num_moves - 1] if len(best) >= num_moves\
+                        else -9999
+
+                    if sign == 1:
+                        val, _ = self.min_value(node, bound, 9999, 1)
+                    else:
+                        val, _ = self.max_value(node, -9999, -bound, 1)
+
+                    scores.append([val, node])
+
+                    self.local_nodes_generated += 1
+                    self.total_nodes_generated += 1
+            except SearchTimeout:
+                if len(results) == 0:
+                    results = scores
+
+                break
+
+            # Search the best moves first in the next iteration
+            scores.sort(key=lambda score: -sign * score[0])
+            child_nodes = [score[1] for score in scores]
+            results = scores
+
+        results = sorted(results, key=lambda score: -sign * score[0])\
+            [:num_moves]
+        self.last_value = results[0][0] if len(results) > 0 else 0
+
+        return [[node.move, val, [node.move] + self.principal_variation(node,\
+            self.max_level - 1)] for val, node in results]
+
+    # Returns True if "move" is legal in the current position
+    # The legal moves are worked out once per position, and a search of the
+    # position has usually found them already (see Node.legal_moves())
+    def is_legal(self, move):
+        return move in self.curr_board.legal_moves()
+
     # Conducts the move specified
-    # move = [[old_row, old_col], [new_row, new_col]]
+    # move = move encoded as in moves.py (a promotion carries the piece the
+    # Pawn becomes)
+    # Raises IllegalMoveError, leaving the game as it was, if the move is
+    # not legal
+    # The new position's outcome is set if the side to move has no legal
+    # moves, so that a game loop on curr_board.outcome ends there
     def tree_do_move(self, move):
+        if not self.is_legal(move):
+            raise IllegalMoveError("Illegal move: " + move_to_str(move))
+
         if self.curr_board.side == self.player:
             self.moves_made.append(move)
 
-        self.curr_board = self.curr_board.node_do_move(move)
\ No newline at end of file
+        # Keep the Monte Carlo subtree of the move, if there is one
+        if self.mcts is not None and not self.mcts.advance(move):
+            self.mcts = None
+
+        self.curr_board = self.curr_board.node_do_move(move)
+        self.curr_board.legal_moves()
\ No newline at end of file
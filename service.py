@@ -0,0 +1,301 @@
+"""
+Asynchronous Game Service for Chess Bot
+Serves many concurrent games from one process; searches run in a pool
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import itertools
+import json
+import os
+
+from position import pack_node, unpack_node, unpack_outcome
+
+DEADLINE_GRACE = 1.0  # Seconds a search may overrun its deadline before the
+# request is abandoned
+
+
+class GameNotFoundError(KeyError):
+    pass
+
+
+class GameOverError(ValueError):
+    pass
+
+
+# Raised when the computer is asked to search or play while it is the
+# other side's turn
+class NotComputersTurnError(ValueError):
+    pass
+
+
+# Runs in a pool worker: returns the packed position after the move
+# data = packed position, move = move in coordinate notation (i.e "e2e4")
+def apply_move(data, move):
+    from moves import parse_move
+    from searchtree import SearchTree
+
+    node = unpack_node(data)
+    tree = SearchTree(node.player, node)
+    tree.tree_do_move(parse_move(node, move))
+
+    return pack_node(tree.curr_board)
+
+
+# Runs in a pool worker: returns a dict with the best move, its value, the
+# number of nodes generated and the outcome of the searched position
+# data = packed position, with the computer to move
+# time_limit = seconds the search may take; it deepens one level at a time
+# and returns the deepest completed result (None = a full-depth search)
+def search_position(data, time_limit):
+    from moves import move_to_str
+    from searchtree import SearchTree
+    from sharedtables import shared_tt
+    from timemanager import TimeManager
+
+    node = unpack_node(data)
+    tree = SearchTree(node.player, node, tt=shared_tt(node.player))
+
+    if time_limit is None:
+        move = tree.find_next_move(verbose=False)
+    else:
+        # One move before the "clock" runs out: all of it may be used
+        move = tree.find_timed_move(TimeManager(time_limit, moves_to_go=1),
+            verbose=False)
+
+    return {
+        "move": None if move is None else move_to_str(move),
+        "value": round(float(tree.last_value), 3),
+        "nodes": tree.local_nodes_generated,
+        "outcome": tree.curr_board.outcome,
+    }
+
+
+# Runs in a pool worker: returns the packed starting position
+def start_position(player):
+    from searchtree import SearchTree
+
+    return pack_node(SearchTree(player).curr_board)
+
+
+# Executor that runs every call immediately in the calling thread
+# Stand-in for the process pool when testing the service
+class InProcessExecutor(concurrent.futures.Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+
+        return future
+
+
+class GameService:
+    # executor = where positions are searched; a process pool by default
+    # max_workers = size of the default process pool
+    # shared_tables = name of SharedTables (see sharedtables.py) that the
+    # default pool's workers search with, or None for their own tables
+    def __init__(self, executor=None, max_workers=None, shared_tables=None):
+        if executor is None and shared_tables is not None:
+            from sharedtables import attach_tables
+
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers,
+                initializer=attach_tables, initargs=(shared_tables,))
+        elif executor is None:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+
+        self.executor = executor
+        self.games = {}  # Game ID -> packed position (see position.py)
+        self.locks = {}  # Game ID -> [lock, users], only while in use
+        self.start_positions = {}  # Side -> packed starting position
+        self.ids = itertools.count()
+
+    # Serializes requests on one game; the lock only exists while in use so
+    # idle games cost nothing but their packed position
+    @contextlib.asynccontextmanager
+    async def game_lock(self, game_id):
+        entry = self.locks.setdefault(game_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+
+            if entry[1] == 0:
+                del self.locks[game_id]
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    def get_packed(self, game_id):
+        if game_id not in self.games:
+            raise GameNotFoundError(game_id)
+
+        return self.games[game_id]
+
+    # Starts a game where the computer plays as "player"; returns its ID
+    async def new_game(self, player):
+        if player not in self.start_positions:
+            self.start_positions[player] = await self.run(start_position,
+                player)
+
+        game_id = next(self.ids)
+        self.games[game_id] = self.start_positions[player]
+
+        return game_id
+
+    # Returns the Node of the game's current position
+    def get_position(self, game_id):
+        return unpack_node(self.get_packed(game_id))
+
+    # Plays a move in the game, which must still be at the packed position
+    # "data"; the caller holds the game's lock
+    async def apply(self, game_id, data, move):
+        if unpack_outcome(data) != "Ongoing":
+            raise GameOverError(game_id)
+
+        data = await self.run(apply_move, data, move)
+
+        # The game may have been closed while the move was played
+        self.get_packed(game_id)
+        self.games[game_id] = data
+
+    # Returns the search result for the packed position "data" of game_id;
+    # the caller holds the game's lock
+    # Raises NotComputersTurnError unless the computer is to move, since the
+    # search always looks for the computer's best move
+    async def search(self, game_id, data, time_limit):
+        node = unpack_node(data)
+
+        if node.side != node.player:
+            raise NotComputersTurnError(game_id)
+
+        if time_limit is None:
+            return await self.run(search_position, data, None)
+
+        return await asyncio.wait_for(self.run(search_position, data,
+            time_limit), time_limit + DEADLINE_GRACE)
+
+    # move = move in coordinate notation (i.e "e2e4", "e7e8q")
+    # Raises IllegalMoveError (see searchtree.py) if the move is not legal
+    async def do_move(self, game_id, move):
+        async with self.game_lock(game_id):
+            await self.apply(game_id, self.get_packed(game_id), move)
+
+    # Returns the search result for the game's current position (see
+    # search_position) without playing the move
+    # time_limit = seconds the search may take (None = full depth)
+    # Raises NotComputersTurnError if it is not the computer's turn
+    # Cancelling the awaiting task drops the request; a search that already
+    # started is stopped by its deadline, but one without a time limit runs
+    # on to full depth in its pool worker (a process cannot be interrupted
+    # from here), so give requests that may be cancelled a time limit
+    async def find_move(self, game_id, time_limit=None):
+        async with self.game_lock(game_id):
+            return await self.search(game_id, self.get_packed(game_id),
+                time_limit)
+
+    # Searches the game's current position and plays the move found
+    # The game stays locked from the search until the move is played, so
+    # the move is never played in a position other than the one searched
+    async def play_move(self, game_id, time_limit=None):
+        async with self.game_lock(game_id):
+            data = self.get_packed(game_id)
+            result = await self.search(game_id, data, time_limit)
+
+            if result["move"] is None:
+                node = unpack_node(data)
+                node.outcome = result["outcome"]
+                self.games[game_id] = pack_node(node)
+
+                raise GameOverError(game_id)
+
+            await self.apply(game_id, data, result["move"])
+
+        return result
+
+    def close_game(self, game_id):
+        self.games.pop(game_id, None)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # Handles one JSON request of the line protocol used by serve()
+    async def handle_request(self, request):
+        op = request.get("op")
+
+        if op == "new":
+            return {"game": await self.new_game(request["player"])}
+        elif op == "move":
+            await self.do_move(request["game"], request["move"])
+
+            return {}
+        elif op == "search":
+            return await self.find_move(request["game"],
+                request.get("time_limit"))
+        elif op == "play":
+            return await self.play_move(request["game"],
+                request.get("time_limit"))
+        elif op == "close":
+            self.close_game(request["game"])
+
+            return {}
+
+        raise ValueError("Unknown op: " + str(op))
+
+    # Serves the games over a socket, one JSON object per line each way
+    # Failed requests are answered with {"error": message}
+    async def serve(self, host="127.0.0.1", port=8765):
+        async def handle_client(reader, writer):
+            while True:
+                line = await reader.readline()
+
+                if not line:
+                    break
+
+                try:
+                    response = await self.handle_request(json.loads(line))
+                except (KeyError, ValueError, asyncio.TimeoutError) as error:
+                    response = {"error": type(error).__name__ + ": " +
+                        str(error)}
+
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+
+            writer.close()
+
+        return await asyncio.start_server(handle_client, host, port)
+
+
+# shared = whether the searches share one set of tables in shared memory
+async def main(host="127.0.0.1", port=8765, shared=True):
+    tables = None
+
+    if shared:
+        from sharedtables import SharedTables, SHARED_NAME
+
+        tables = SharedTables(SHARED_NAME + "_" + str(os.getpid()), True)
+
+    service = GameService(shared_tables=None if tables is None else
+        tables.name)
+    server = await service.serve(host, port)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.shutdown()
+
+        if tables is not None:
+            tables.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
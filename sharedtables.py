@@ -0,0 +1,147 @@
+"""
+Shared-Memory Tables for Chess Bot
+Holds the transposition tables, the evaluation cache and the Pawn table in
+multiprocessing.shared_memory, so that every search process on a host
+shares one large set of tables instead of keeping a small one each
+Entries are [hash ^ data, data] words (see transposition.py), which is what
+makes the tables safe without locks: a write torn by another process reads
+as a miss
+"""
+
+import multiprocessing
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from evalcache import EVAL_CACHE
+from pawns import PAWN_TABLE
+from transposition import TranspositionTable
+
+SHARED_NAME = "chess_bot_tables"  # Default prefix of the blocks' names
+SHARED_TT_SIZE = 2 ** 20  # Entries in each transposition table
+SHARED_EVAL_SIZE = 2 ** 20  # Entries in the evaluation cache
+SHARED_PAWN_SIZE = 2 ** 16  # Entries in the Pawn table
+
+ATTACHED = None  # The SharedTables this process searches with, if any
+
+
+# Attaches to an existing shared memory block without the resource tracker
+# taking ownership of it
+def attach_block(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name)
+
+        # Before Python 3.13, attaching also registers the block, and the
+        # resource tracker would remove it for every process once this one
+        # exits; processes started by multiprocessing share their parent's
+        # tracker, where the creator's registration must stay
+        if os.name == "posix" and multiprocessing.parent_process() is None:
+            resource_tracker.unregister(block._name, "shared_memory")
+
+        return block
+
+
+class SharedTables:
+    # name = prefix of the names of the shared memory blocks
+    # create = whether to create the blocks (the creator removes them in
+    # close()) or attach to ones another process created
+    # The sizes are numbers of entries (rounded down to powers of two) and
+    # only used when creating
+    def __init__(self, name=SHARED_NAME, create=False, tt_size=SHARED_TT_SIZE,
+            eval_size=SHARED_EVAL_SIZE, pawn_size=SHARED_PAWN_SIZE):
+        self.name = name
+        self.create = create
+
+        # Values in a transposition table are from the computer's point of
+        # view, so each side it can play has its own table
+        sizes = {"tt0": tt_size, "tt1": tt_size, "eval": eval_size, "pawn":
+            pawn_size}
+
+        self.blocks = {}
+        self.arrays = {}  # Table -> uint64 array of shape (size, 2)
+        self.tts = {}  # Player -> TranspositionTable, once asked for
+        self.previous = None  # Private tables replaced by install()
+
+        for table, size in sizes.items():
+            if create:
+                size = 1 << (size.bit_length() - 1)
+                block = shared_memory.SharedMemory(name + "_" + table, True,
+                    size * 16)
+            else:
+                block = attach_block(name + "_" + table)
+
+            # Some platforms round the block up to whole pages
+            entries = 1 << ((block.size // 16).bit_length() - 1)
+
+            self.blocks[table] = block
+            self.arrays[table] = np.ndarray((entries, 2), dtype=np.uint64,
+                buffer=block.buf)
+
+            if create:
+                self.arrays[table][:] = 0
+
+    # Returns the shared transposition table for searches where the computer
+    # plays as "player" (see SearchTree's tt parameter)
+    def transposition_table(self, player):
+        if player not in self.tts:
+            self.tts[player] = TranspositionTable(table=self.arrays["tt" +
+                str(player)])
+
+        return self.tts[player]
+
+    # Makes every Node in this process use the shared evaluation cache and
+    # Pawn table, and shared_tt() return the shared transposition tables
+    def install(self):
+        global ATTACHED
+
+        if self.previous is None:
+            self.previous = [EVAL_CACHE.table, PAWN_TABLE.table]
+
+        EVAL_CACHE.use_table(self.arrays["eval"])
+        PAWN_TABLE.use_table(self.arrays["pawn"])
+
+        ATTACHED = self
+
+    # Goes back to the private tables
+    def uninstall(self):
+        global ATTACHED
+
+        if self.previous is not None:
+            EVAL_CACHE.use_table(self.previous[0])
+            PAWN_TABLE.use_table(self.previous[1])
+            self.previous = None
+
+        if ATTACHED is self:
+            ATTACHED = None
+
+    # Detaches from the blocks, and removes them if this process created
+    # them
+    def close(self):
+        self.uninstall()
+
+        # The arrays point into the blocks, which cannot close while they
+        # are in use
+        self.tts = {}
+        self.arrays = {}
+
+        for block in self.blocks.values():
+            block.close()
+
+            if self.create:
+                block.unlink()
+
+        self.blocks = {}
+
+
+# Returns the shared transposition table for "player" if this process has
+# installed shared tables, otherwise None (a search then uses its own)
+def shared_tt(player):
+    return None if ATTACHED is None else ATTACHED.transposition_table(player)
+
+
+# Process pool initializer: attaches the worker to the tables created under
+# "name" and installs them
+def attach_tables(name=SHARED_NAME):
+    SharedTables(name).install()
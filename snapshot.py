@@ -0,0 +1,173 @@
+"""
+Engine Snapshots for Chess Bot
+Saves the persistent state of a SearchTree (and the evaluation cache and
+Pawn table every Node uses) to disk and maps it back in
+"""
+
+import mmap
+import struct
+
+import numpy as np
+from evalcache import EVAL_CACHE
+from node import Node
+from pawns import PAWN_TABLE
+from position import OUTCOMES
+from psqt import psqt_scores
+from searchtree import SearchTree
+from transposition import TranspositionTable
+import zobrist
+
+MAGIC = b"CBSNAP02"
+ALIGNMENT = 64  # Every array starts on a multiple of this many bytes
+HEADER_FORMAT = "<8sI"  # Magic, number of arrays
+ENTRY_FORMAT = "<16s8sI4QQ"  # Name, dtype, ndim, shape, offset
+MAX_DIMS = 4
+
+
+# Returns the (32-bit) checksum of the Zobrist keys so that a snapshot made
+# with different keys is never loaded into this engine
+def zobrist_checksum():
+    keys = np.concatenate([np.ravel(zobrist.PIECE_KEYS),
+        np.ravel(zobrist.MOVED_KEYS), zobrist.EN_PASSANT_KEYS,
+        [zobrist.SIDE_KEY]]).astype(np.int64)
+
+    return int(np.bitwise_xor.reduce(keys) & 0xFFFFFFFF)
+
+
+# Writes a dict of name -> NumPy array to "path" as one uncompressed file:
+# a header listing every array, followed by the raw aligned array data
+def write_arrays(path, arrays):
+    header_size = struct.calcsize(HEADER_FORMAT) + len(arrays) *\
+        struct.calcsize(ENTRY_FORMAT)
+    offset = -(-header_size // ALIGNMENT) * ALIGNMENT
+
+    entries = []
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        shape = list(array.shape) + [0] * (MAX_DIMS - array.ndim)
+
+        entries.append(struct.pack(ENTRY_FORMAT, name.encode(),
+            array.dtype.str.encode(), array.ndim, *shape, offset))
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    with open(path, "wb") as file:
+        file.write(struct.pack(HEADER_FORMAT, MAGIC, len(arrays)))
+
+        for entry in entries:
+            file.write(entry)
+
+        for array in arrays.values():
+            array = np.ascontiguousarray(array)
+
+            file.seek(-(-file.tell() // ALIGNMENT) * ALIGNMENT)
+            file.write(array.tobytes())
+
+        # Pad the end so the final array can be mapped in full
+        file.truncate(-(-file.tell() // ALIGNMENT) * ALIGNMENT)
+
+
+# Maps a file made by write_arrays into memory and returns a dict of name ->
+# NumPy array backed by the mapping (copy-on-write: the arrays can be
+# modified without changing the file)
+def read_arrays(path):
+    with open(path, "rb") as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    magic, count = struct.unpack_from(HEADER_FORMAT, mapping)
+
+    if magic != MAGIC:
+        raise ValueError(path + " is not a Chess Bot snapshot")
+
+    arrays = {}
+    position = struct.calcsize(HEADER_FORMAT)
+
+    for _ in range(count):
+        name, dtype, ndim, *shape, offset = struct.unpack_from(ENTRY_FORMAT,
+            mapping, position)
+        position += struct.calcsize(ENTRY_FORMAT)
+
+        shape = tuple(shape[:ndim])
+        dtype = np.dtype(dtype.rstrip(b"\0").decode())
+
+        arrays[name.rstrip(b"\0").decode()] = np.frombuffer(mapping, dtype,
+            int(np.prod(shape)), offset).reshape(shape)
+
+    return arrays
+
+
+# Saves the engine's state: transposition table, evaluation cache, Pawn
+# table, current game (position and moves made) and counters
+def save_snapshot(tree, path):
+    node = tree.curr_board
+
+    meta = np.array([tree.player, node.side, OUTCOMES.index(node.outcome),
+        node.hash, tree.total_nodes_generated, tree.tt.age,
+        zobrist_checksum()], dtype=np.int64)
+
+    # Heuristic values are fractional (see psqt.py)
+    h_value = np.array([node.evaluate()], dtype=np.float64)
+
+    moves_made = np.array(tree.moves_made, dtype=np.uint16)
+
+    write_arrays(path, {
+        "meta": meta,
+        "h_value": h_value,
+        "board": node.board,
+        "en_passant": node.en_passant,
+        "my_squares": node.my_squares,
+        "my_moved": node.my_moved,
+        "my_targeted": node.my_targeted,
+        "opp_squares": node.opp_squares,
+        "opp_moved": node.opp_moved,
+        "opp_targeted": node.opp_targeted,
+        "moves_made": moves_made,
+        "tt": tree.tt.table,
+        "eval_cache": EVAL_CACHE.table,
+        "pawn_table": PAWN_TABLE.table,
+    })
+
+
+# Returns a SearchTree restored from a file made by save_snapshot
+# The transposition table stays mapped to the file, so only the pages that
+# are actually probed are ever read from disk
+# caches = whether to map the evaluation cache and Pawn table back in as
+# well; they are used by every Node in the process, so this replaces the
+# process's own (or its shared ones, see sharedtables.py)
+def load_snapshot(path, caches=True):
+    arrays = read_arrays(path)
+
+    player, side, outcome, key, total_nodes, age, checksum =\
+        arrays["meta"].tolist()
+    h_value = float(arrays["h_value"][0])
+
+    if checksum != zobrist_checksum():
+        raise ValueError(path + " was saved with different Zobrist keys")
+
+    node = Node(arrays["board"], side, player)
+
+    node.en_passant = arrays["en_passant"]
+    node.my_squares = arrays["my_squares"]
+    node.my_moved = arrays["my_moved"]
+    node.my_targeted = arrays["my_targeted"]
+    node.opp_squares = arrays["opp_squares"]
+    node.opp_moved = arrays["opp_moved"]
+    node.opp_targeted = arrays["opp_targeted"]
+
+    node.outcome = OUTCOMES[outcome]
+    node.h_value = h_value
+    node.hash = key
+    node.pawn_hash = zobrist.hash_pawns(node)
+    node.mg_score, node.eg_score, node.phase = psqt_scores(node.board)
+
+    tree = SearchTree(player, node)
+    tree.moves_made = arrays["moves_made"].tolist()
+    tree.total_nodes_generated = total_nodes
+
+    tree.tt = TranspositionTable(table=arrays["tt"])
+    tree.tt.age = age
+
+    if caches:
+        EVAL_CACHE.use_table(arrays["eval_cache"])
+        PAWN_TABLE.use_table(arrays["pawn_table"])
+
+    return tree
@@ -0,0 +1,93 @@
+"""
+Time Management for Chess Bot
+Splits a game clock into per-move budgets: a soft budget, after which no
+new iteration of the search is started, and a hard budget, at which the
+search in progress is stopped (see SearchTree.find_timed_move())
+"""
+
+import time
+
+MOVES_TO_GO = 30  # Moves the remaining time is spread over when the time
+# control does not say
+INCREMENT_SHARE = 0.75  # Share of the increment spent on every move
+HARD_FACTOR = 4  # Hard budget as a multiple of the soft budget
+MAX_SHARE = 0.5  # Most of the remaining time that one move may take
+MOVE_OVERHEAD = 0.05  # Seconds kept back on every move for the interface
+MIN_BUDGET = 0.01  # Least time a move is given, in seconds
+NEXT_ITERATION_SHARE = 0.5  # A new iteration is only started before this
+# share of the soft budget is spent, since it takes longer than all the
+# earlier ones together
+
+# Changes to the soft budget between iterations (it never passes the hard
+# budget); values are in heuristic points (see weights.py)
+SCORE_DROP = 1  # Fall of the best value that counts as a score drop
+DROP_EXTENSION = 1.5  # Soft budget multiplied by this on a score drop
+CHANGE_EXTENSION = 1.3  # ... and by this when the best move changes
+DOMINANCE_MARGIN = 3  # Lead over every other root move (a Knight) ...
+STABLE_ITERATIONS = 3  # ... held for this many iterations in a row stops
+# the search early
+
+
+class TimeManager:
+    # remaining = seconds left on the computer's clock
+    # increment = seconds added to the clock after every move
+    # moves_to_go = moves to make before the clock is next topped up (None
+    # = the rest of the game, see MOVES_TO_GO)
+    def __init__(self, remaining, increment=0, moves_to_go=None):
+        moves = MOVES_TO_GO if not moves_to_go else moves_to_go
+        usable = max(remaining - MOVE_OVERHEAD, MIN_BUDGET)
+
+        # With moves_to_go, the last move before the clock is topped up may
+        # use nearly all of it
+        share = MAX_SHARE if moves > 1 else 1
+
+        self.hard = max(min(usable * share, (usable / moves + increment *
+            INCREMENT_SHARE) * HARD_FACTOR), MIN_BUDGET)
+        self.soft = min(usable / moves + increment * INCREMENT_SHARE,
+            self.hard)
+
+        self.start()
+
+    # Starts the clock for a new move
+    def start(self):
+        self.start_time = time.monotonic()
+        self.scale = 1.0  # Extension of the soft budget so far
+        self.best_move = None  # Best move of the last iteration
+        self.best_value = None  # Value of best_move
+        self.stable = 0  # Iterations in a row that best_move dominated
+        self.dominant = False
+
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+    # Returns the time.monotonic() value at which the search must stop
+    def deadline(self):
+        return self.start_time + self.hard
+
+    # Returns the soft budget, extended as the search went on
+    def budget(self):
+        return min(self.soft * self.scale, self.hard)
+
+    # Takes the result of a completed iteration and adjusts the budget
+    # move, value = best root move and its value (the side to move
+    # maximizes)
+    # gap = how far value is above the best bound on every other root move
+    def update(self, move, value, gap):
+        if self.best_value is not None and value <= self.best_value -\
+                SCORE_DROP:
+            self.scale *= DROP_EXTENSION
+
+        if self.best_move is not None and move != self.best_move:
+            self.scale *= CHANGE_EXTENSION
+            self.stable = 0
+
+        self.stable = self.stable + 1 if gap >= DOMINANCE_MARGIN else 0
+        self.dominant = self.stable >= STABLE_ITERATIONS
+
+        self.best_move = move
+        self.best_value = value
+
+    # Returns True if no new iteration should be started
+    def should_stop(self):
+        return self.dominant or self.elapsed() >= self.budget() *\
+            NEXT_ITERATION_SHARE
@@ -0,0 +1,111 @@
+"""
+Transposition Table for Chess Bot
+"""
+
+import numpy as np
+from moves import NO_MOVE
+
+# Bound types stored with each value (0 marks an empty entry)
+FLAG_EXACT = 1  # The value is the exact minimax value
+FLAG_LOWER = 2  # The true value is at least the stored value
+FLAG_UPPER = 3  # The true value is at most the stored value
+
+VALUE_OFFSET = 2 ** 31  # Stored values are shifted to be non-negative
+VALUE_SCALE = 1000  # Values are stored in thousandths of a point, so the
+# fractions of the piece-square tables (see psqt.py) are kept
+
+MASK_16 = (1 << 16) - 1
+MASK_32 = (1 << 32) - 1
+MASK_64 = (1 << 64) - 1
+
+
+# Packs an entry into a single 64-bit word
+#   bits 0-15: move (see moves.py), 16-47: value, 48-55: depth, 56-57: flag, 58-63: age
+def pack_entry(move, value, depth, flag, age):
+    return move | (int(round(value * VALUE_SCALE)) + VALUE_OFFSET) << 16 |\
+        depth << 48 | flag << 56 | (age & 63) << 58
+
+
+# Returns move, value, depth, flag, age from a word made by pack_entry
+def unpack_entry(data):
+    return data & MASK_16, ((data >> 16 & MASK_32) - VALUE_OFFSET) /\
+        VALUE_SCALE, data >> 48 & 0xFF, data >> 56 & 3, data >> 58
+
+
+# Returns the flag to store with a value found by a search of the window
+# alpha/beta
+def bound_flag(value, alpha, beta):
+    if value >= beta:
+        return FLAG_LOWER
+
+    return FLAG_EXACT if value > alpha else FLAG_UPPER
+
+
+class TranspositionTable:
+    # size = number of entries, rounded down to a power of two
+    # table = optional existing uint64 array of shape (size, 2) to use as
+    # storage (i.e. one loaded from disk or in shared memory)
+    def __init__(self, size=2 ** 16, table=None):
+        if table is None:
+            size = 1 << (size.bit_length() - 1)
+            table = np.zeros((size, 2), dtype=np.uint64)
+
+        # Each entry is [hash ^ data, data]; an entry is only trusted if the
+        # two words XOR back to the probed hash, so a torn write is detected
+        # as a miss instead of returning the wrong position's data
+        self.table = table
+        self.mask = len(table) - 1
+        self.age = 0  # Incremented once per search, used for replacement
+
+        self.hits = 0
+        self.misses = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 63
+
+    def clear(self):
+        self.table[:] = 0
+        self.hits = 0
+        self.misses = 0
+
+    # Returns move, value, depth, flag for the position, or None on a miss
+    def probe(self, key):
+        entry = self.table[key & self.mask]
+        data = int(entry[1])
+
+        if data == 0 or int(entry[0]) ^ data != key & MASK_64:
+            self.misses += 1
+
+            return None
+
+        self.hits += 1
+
+        return unpack_entry(data)[:4]
+
+    # Returns just the best move stored for the position (NO_MOVE if none)
+    def probe_move(self, key):
+        entry = self.table[key & self.mask]
+        data = int(entry[1])
+
+        if data == 0 or int(entry[0]) ^ data != key & MASK_64:
+            return NO_MOVE
+
+        return data & MASK_16
+
+    # Stores a search result; an entry from the current search is only
+    # replaced by a result that is at least as deep
+    def store(self, key, move, value, depth, flag):
+        index = key & self.mask
+        entry = self.table[index]
+        old = int(entry[1])
+
+        if old != 0 and int(entry[0]) ^ old != key & MASK_64:
+            _, _, old_depth, _, old_age = unpack_entry(old)
+
+            if old_age == self.age and old_depth > depth:
+                return
+
+        data = pack_entry(move, value, depth, flag, self.age)
+
+        self.table[index, 1] = data
+        self.table[index, 0] = (key & MASK_64) ^ data
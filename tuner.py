@@ -0,0 +1,237 @@
+"""
+Texel-Style Weight Tuner for Chess Bot
+Fits the linear evaluation weights (see weights.py) to game results
+
+Usage:
+    python tuner.py extract positions.epd features.npz [--workers N]
+    python tuner.py fit features.npz weights.json [--iterations N]
+        [--rate R] [--freeze NAME ...]
+
+Each line of positions.epd holds a FEN/EPD position followed by the result
+of its game: "1-0", "0-1", "1/2-1/2" (optionally quoted, i.e c9 "1-0";) or
+a score from White's point of view in brackets, i.e [0.5]
+"""
+
+import argparse
+import multiprocessing
+
+import numpy as np
+from pawns import PAWN_SIGNS
+from position import node_from_fen
+from psqt import tapered
+from weights import DEFAULT_WEIGHTS, FEATURE_NAMES, Weights
+
+RESULTS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+
+# Returns the result (from White's point of view) written on an EPD line
+def parse_result(line):
+    for token in reversed(line.replace(";", " ").split()):
+        token = token.strip('"')
+
+        if token in RESULTS:
+            return RESULTS[token]
+
+        if token.startswith("[") and token.endswith("]"):
+            return float(token[1:-1])
+
+    raise ValueError("No game result on line: " + line.strip())
+
+
+# Returns the feature vector of a node (see FEATURE_NAMES), counted from
+# White's point of view, so that the node's heuristic value (Parts 2-7)
+# from White's side is the dot product with Weights.to_vector()
+def extract_features(node):
+    features = np.zeros(len(FEATURE_NAMES), dtype=np.float32)
+
+    for side in range(2):
+        sign = 1 if side == 0 else -1
+        home_row = 0 if side == 0 else 7
+
+        if side == node.side:
+            squares, moved = node.my_squares, node.my_moved
+            targeted = node.opp_targeted
+        else:
+            squares, moved = node.opp_squares, node.opp_moved
+            targeted = node.my_targeted
+
+        for piece_id in range(16):
+            square = squares[piece_id]
+
+            if square[0] == -1:
+                continue
+
+            piece = node.board[square[0], square[1]][2]
+
+            features[piece] += sign
+            features[12] -= sign * targeted[square[0], square[1]]
+
+            if moved[piece_id]:
+                features[6 + piece] += sign
+
+        # Count a King next to its Rook on a castling square as castled
+        king = squares[4]
+
+        if king[0] == home_row and (king[1] == 6 or king[1] == 2):
+            rook = node.board[home_row, 5 if king[1] == 6 else 3]
+
+            if rook[0] == side and rook[2] == 0:
+                features[14] += sign
+
+    # The side that just moved gave check
+    if node.is_checked(node.side):
+        features[13] += 1 if node.side == 1 else -1
+
+    # Pawn structure terms that lose points are counted negatively
+    counts = node.pawn_counts()
+    features[15:20] = (counts[0] - counts[1]) * PAWN_SIGNS
+
+    features[20] = tapered(node.mg_score, node.eg_score, node.phase)
+
+    return features
+
+
+# Returns the features and result of one EPD line (None if it is unusable)
+def extract_line(line):
+    try:
+        return extract_features(node_from_fen(line, 0)), parse_result(line)
+    except (ValueError, IndexError):
+        return None
+
+
+# Returns the feature matrix and result vector of every position in a file
+# The features only have to be extracted once; fitting then works on the
+# matrix alone
+def extract_file(path, workers=None):
+    features = []
+    results = []
+
+    with open(path) as file, multiprocessing.Pool(workers) as pool:
+        lines = (line for line in file if line.strip() and not
+            line.startswith("#"))
+
+        for item in pool.imap(extract_line, lines, chunksize=256):
+            if item is not None:
+                features.append(item[0])
+                results.append(item[1])
+
+    return np.array(features, dtype=np.float32).reshape(-1,
+        len(FEATURE_NAMES)), np.array(results, dtype=np.float32)
+
+
+def sigmoid(values):
+    return 1 / (1 + np.exp(-values))
+
+
+# Returns the mean squared error between the results and the win
+# probabilities predicted from the evaluations
+def loss(features, results, vector, scale):
+    return float(np.mean((results - sigmoid(scale * (features @ vector)))
+        ** 2))
+
+
+# Returns the scale K that maps evaluations to win probabilities best for
+# the given weights (searched on a log scale, then refined)
+def fit_scale(features, results, vector):
+    scales = np.logspace(-3, 1, 41)
+    errors = [loss(features, results, vector, scale) for scale in scales]
+    best = int(np.argmin(errors))
+
+    low = scales[max(best - 1, 0)]
+    high = scales[min(best + 1, len(scales) - 1)]
+
+    for _ in range(30):
+        third = (high - low) / 3
+
+        if loss(features, results, vector, low + third) <\
+                loss(features, results, vector, high - third):
+            high -= third
+        else:
+            low += third
+
+    return (low + high) / 2
+
+
+# Fits the linear weights to the results with full-batch Adam gradient
+# steps over the whole feature matrix
+# Returns the fitted Weights, the scale K and the final error
+# frozen = names of weights (see FEATURE_NAMES) to keep as they are
+def fit(features, results, weights=DEFAULT_WEIGHTS, iterations=1000,
+        rate=0.01, scale=None, frozen=()):
+    features = np.asarray(features, dtype=np.float64)
+    results = np.asarray(results, dtype=np.float64)
+
+    vector = weights.to_vector()
+
+    if scale is None:
+        scale = fit_scale(features, results, vector)
+
+    mask = np.array([name not in frozen for name in FEATURE_NAMES],
+        dtype=float)
+
+    # Adam moment estimates
+    first = np.zeros_like(vector)
+    second = np.zeros_like(vector)
+    beta_1, beta_2, epsilon = 0.9, 0.999, 1e-8
+
+    for step in range(1, iterations + 1):
+        predicted = sigmoid(scale * (features @ vector))
+        gradient = -2 * scale * (features.T @ ((results - predicted) *
+            predicted * (1 - predicted))) / len(results) * mask
+
+        first = beta_1 * first + (1 - beta_1) * gradient
+        second = beta_2 * second + (1 - beta_2) * gradient ** 2
+
+        vector -= rate * (first / (1 - beta_1 ** step)) / (np.sqrt(second /
+            (1 - beta_2 ** step)) + epsilon)
+
+    return weights.from_vector(vector), scale, loss(features, results,
+        vector, scale)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Tune the evaluation "
+        "weights on labeled positions")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract = commands.add_parser("extract", help="Extract the features of "
+        "a labeled EPD file")
+    extract.add_argument("input")
+    extract.add_argument("output", help=".npz file for the features")
+    extract.add_argument("--workers", type=int, default=None)
+
+    tune = commands.add_parser("fit", help="Fit weights to extracted "
+        "features")
+    tune.add_argument("input", help=".npz file made by extract")
+    tune.add_argument("output", help=".json file for the weights")
+    tune.add_argument("--start", default=None, help="Weights to start from "
+        "(the defaults if not given)")
+    tune.add_argument("--iterations", type=int, default=1000)
+    tune.add_argument("--rate", type=float, default=0.01)
+    tune.add_argument("--freeze", nargs="*", default=[], choices=
+        FEATURE_NAMES)
+
+    args = parser.parse_args(args)
+
+    if args.command == "extract":
+        features, results = extract_file(args.input, args.workers)
+        np.savez(args.output, features=features, results=results)
+
+        print("Extracted", len(results), "positions")
+    else:
+        data = np.load(args.input)
+        start = DEFAULT_WEIGHTS if args.start is None else\
+            Weights.load(args.start)
+
+        before = loss(data["features"], data["results"], start.to_vector(),
+            fit_scale(data["features"], data["results"], start.to_vector()))
+        weights, scale, after = fit(data["features"], data["results"], start,
+            args.iterations, args.rate, frozen=args.freeze)
+        weights.save(args.output)
+
+        print("Scale:", scale)
+        print("Error:", before, "->", after)
+
+
+if __name__ == "__main__":
+    main()
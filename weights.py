@@ -0,0 +1,78 @@
+"""
+Evaluation Weights for Chess Bot
+"""
+
+import json
+
+import numpy as np
+
+# Names of the linear (tunable) weights, in the order used by to_vector()
+# and by the feature vectors of tuner.py
+FEATURE_NAMES = ["points_rook", "points_knight", "points_bishop",
+    "points_queen", "points_king", "points_pawn", "moved_rook",
+    "moved_knight", "moved_bishop", "moved_queen", "moved_king",
+    "moved_pawn", "attacked", "check", "castle", "passed", "doubled",
+    "isolated", "backward", "shield", "psqt"]
+
+
+class Weights:
+    # points = points that each piece are worth (Heuristic Part 2)
+    # attacked = points lost each time one's pieces are attacked (Part 3)
+    # moved_points = points for moving each piece type from its starting
+    # position (Part 4)
+    # check = points for checking (Part 5)
+    # castle = points for castling (Part 6)
+    # pawns = points for each passed Pawn, lost for each doubled, isolated
+    # and backward Pawn, and gained for each file of the Pawn shield in
+    # front of a King on its first row (Part 7, see pawns.py)
+    # psqt = multiplier of the piece-square table scores (Part 8, see
+    # psqt.py)
+    # checkmate = added if someone checkmates (Part 1)
+    # draw_divide = the value is divided by this on a draw (Part 1)
+    def __init__(self, points=(5, 3, 3, 9, 0, 1), attacked=1,
+            moved_points=(3, 2, 2, 4, 0, 1), check=3, castle=3,
+            checkmate=100, draw_divide=2, pawns=(1, 1, 1, 1, 1), psqt=1):
+        self.points = np.array(points)
+        self.attacked = attacked
+        self.moved_points = np.array(moved_points)
+        self.check = check
+        self.castle = castle
+        self.checkmate = checkmate
+        self.draw_divide = draw_divide
+        self.pawns = np.array(pawns)
+        self.psqt = psqt
+
+    # Returns the linear weights as one vector (see FEATURE_NAMES)
+    def to_vector(self):
+        return np.concatenate([self.points, self.moved_points,
+            [self.attacked, self.check, self.castle], self.pawns,
+            [self.psqt]])\
+            .astype(float)
+
+    # Returns a copy of these weights with the linear weights replaced by
+    # "vector" (see FEATURE_NAMES)
+    def from_vector(self, vector):
+        vector = [value.item() for value in np.asarray(vector)]
+
+        return Weights(vector[0:6], vector[12], vector[6:12], vector[13],
+            vector[14], self.checkmate, self.draw_divide, vector[15:20],
+            vector[20])
+
+    def to_dict(self):
+        return {"points": self.points.tolist(), "attacked": self.attacked,
+            "moved_points": self.moved_points.tolist(), "check": self.check,
+            "castle": self.castle, "checkmate": self.checkmate,
+            "draw_divide": self.draw_divide, "pawns": self.pawns.tolist(),
+            "psqt": self.psqt}
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+    @staticmethod
+    def load(path):
+        with open(path) as file:
+            return Weights(**json.load(file))
+
+
+DEFAULT_WEIGHTS = Weights()  # The hand-picked weights
@@ -0,0 +1,65 @@
+"""
+Zobrist Hashing for Chess Bot
+"""
+
+import numpy as np
+
+ZOBRIST_SEED = 20201206  # Fixed so that hashes match across processes/runs
+
+_rng = np.random.default_rng(ZOBRIST_SEED)
+
+# Keys are held as Python ints because node_do_move XORs them one at a time
+PIECE_KEYS = _rng.integers(0, 2 ** 63, size=(2, 6, 64), dtype=np.int64)\
+    .tolist()  # [Side][Piece][row * 8 + col]
+MOVED_KEYS = _rng.integers(0, 2 ** 63, size=(2, 16), dtype=np.int64)\
+    .tolist()  # [Side][ID], XORed in once the piece has moved
+EN_PASSANT_KEYS = _rng.integers(0, 2 ** 63, size=8, dtype=np.int64)\
+    .tolist()  # [Column of the en passant square]
+SIDE_KEY = int(_rng.integers(0, 2 ** 63, dtype=np.int64))  # XORed in when
+# Black has the move
+
+
+# Returns the hash of a node's position computed from scratch
+# node_do_move keeps the hash up to date incrementally afterwards
+def hash_node(node):
+    key = 0
+
+    for row in range(8):
+        for col in range(8):
+            tup = node.board[row, col]
+
+            if tup[0] != -1:
+                key ^= PIECE_KEYS[tup[0]][tup[2]][row * 8 + col]
+
+    opp = 1 if node.side == 0 else 0
+
+    for piece_id in range(16):
+        if node.my_moved[piece_id]:
+            key ^= MOVED_KEYS[node.side][piece_id]
+
+        if node.opp_moved[piece_id]:
+            key ^= MOVED_KEYS[opp][piece_id]
+
+    if node.en_passant[0] != -1:
+        key ^= EN_PASSANT_KEYS[node.en_passant[1]]
+
+    if node.side == 1:
+        key ^= SIDE_KEY
+
+    return key
+
+
+# Returns the hash of the node's Pawns alone (the XOR of their PIECE_KEYS),
+# used for the Pawn table (see pawns.py)
+# node_do_move keeps it up to date incrementally afterwards
+def hash_pawns(node):
+    key = 0
+
+    for row in range(8):
+        for col in range(8):
+            tup = node.board[row, col]
+
+            if tup[2] == 5:
+                key ^= PIECE_KEYS[tup[0]][5][row * 8 + col]
+
+    return key